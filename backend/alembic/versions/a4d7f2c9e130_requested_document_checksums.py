@@ -0,0 +1,43 @@
+"""requested document size and checksum
+
+Revision ID: a4d7f2c9e130
+Revises: e7a3c1d5f824
+Create Date: 2026-10-17 21:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a4d7f2c9e130"
+down_revision: Union[str, None] = "e7a3c1d5f824"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    doc_columns = [col["name"] for col in inspector.get_columns("requested_documents")]
+    with op.batch_alter_table("requested_documents", schema=None) as batch_op:
+        if "file_size" not in doc_columns:
+            batch_op.add_column(sa.Column("file_size", sa.BigInteger(), nullable=True))
+        if "file_sha256" not in doc_columns:
+            batch_op.add_column(sa.Column("file_sha256", sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    doc_columns = [col["name"] for col in inspector.get_columns("requested_documents")]
+    with op.batch_alter_table("requested_documents", schema=None) as batch_op:
+        if "file_sha256" in doc_columns:
+            batch_op.drop_column("file_sha256")
+        if "file_size" in doc_columns:
+            batch_op.drop_column("file_size")
@@ -0,0 +1,80 @@
+"""indexed phone lookup keys on awaiting sms
+
+Revision ID: a8d4f2b6c317
+Revises: f5c1e8a3d920
+Create Date: 2026-10-17 16:00:00.000000
+"""
+
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a8d4f2b6c317"
+down_revision: Union[str, None] = "f5c1e8a3d920"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Snapshot of app/phone.py at the time of this migration.
+def _lookup_keys(phone, default_country_code):
+    value = (phone or "").strip()
+    digits = "".join(char for char in value if char.isdigit())
+    if not digits:
+        return None, None
+    if not value.startswith("+") and len(digits) == 10 and default_country_code:
+        e164 = f"+{default_country_code}{digits}"
+    else:
+        e164 = f"+{digits}"
+    return e164, (digits[-10:] if len(digits) >= 10 else None)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    columns = {column["name"] for column in inspector.get_columns("awaiting_sms")}
+    if "phone_e164" not in columns:
+        op.add_column("awaiting_sms", sa.Column("phone_e164", sa.String(), nullable=True))
+    if "phone_last10" not in columns:
+        op.add_column("awaiting_sms", sa.Column("phone_last10", sa.String(), nullable=True))
+
+    indexes = {index["name"] for index in inspector.get_indexes("awaiting_sms")}
+    if "ix_awaiting_sms_phone_e164" not in indexes:
+        op.create_index("ix_awaiting_sms_phone_e164", "awaiting_sms", ["phone_e164"])
+    if "ix_awaiting_sms_phone_last10" not in indexes:
+        op.create_index("ix_awaiting_sms_phone_last10", "awaiting_sms", ["phone_last10"])
+
+    default_country_code = (os.getenv("DEFAULT_PHONE_COUNTRY_CODE", "1") or "").strip().lstrip("+")
+    rows = bind.execute(sa.text("SELECT id, client_phone_number FROM awaiting_sms")).fetchall()
+    updates = []
+    for sms_id, phone in rows:
+        e164, last10 = _lookup_keys(phone, default_country_code)
+        updates.append({"id": sms_id, "phone_e164": e164, "phone_last10": last10})
+    if updates:
+        bind.execute(
+            sa.text("UPDATE awaiting_sms SET phone_e164 = :phone_e164, phone_last10 = :phone_last10 WHERE id = :id"),
+            updates,
+        )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    indexes = {index["name"] for index in inspector.get_indexes("awaiting_sms")}
+    if "ix_awaiting_sms_phone_last10" in indexes:
+        op.drop_index("ix_awaiting_sms_phone_last10", table_name="awaiting_sms")
+    if "ix_awaiting_sms_phone_e164" in indexes:
+        op.drop_index("ix_awaiting_sms_phone_e164", table_name="awaiting_sms")
+
+    columns = {column["name"] for column in inspector.get_columns("awaiting_sms")}
+    with op.batch_alter_table("awaiting_sms") as batch_op:
+        if "phone_last10" in columns:
+            batch_op.drop_column("phone_last10")
+        if "phone_e164" in columns:
+            batch_op.drop_column("phone_e164")
@@ -0,0 +1,89 @@
+"""content-addressed document blobs
+
+Revision ID: b8e2d5f1c637
+Revises: a4d7f2c9e130
+Create Date: 2026-10-17 22:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b8e2d5f1c637"
+down_revision: Union[str, None] = "a4d7f2c9e130"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+FK_NAME = "fk_requested_documents_file_sha256_document_blobs"
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    if not inspector.has_table("document_blobs"):
+        op.create_table(
+            "document_blobs",
+            sa.Column("sha256", sa.String(length=64), primary_key=True),
+            sa.Column("size", sa.BigInteger(), nullable=False),
+            sa.Column("path", sa.String(), nullable=False),
+            sa.Column("ref_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+        )
+
+    # Files uploaded with a checksum become blobs where they already lie; one of them
+    # stands for each distinct content. `manage.py document-blobs rebuild` moves the
+    # rest (and pre-checksum uploads) into the store.
+    op.execute(
+        """
+        INSERT INTO document_blobs (sha256, size, path, ref_count, created_at)
+        SELECT file_sha256, MAX(COALESCE(file_size, 0)), MIN(file_path), COUNT(*), CURRENT_TIMESTAMP
+        FROM requested_documents
+        WHERE file_sha256 IS NOT NULL AND file_path IS NOT NULL
+          AND file_sha256 NOT IN (SELECT sha256 FROM document_blobs)
+        GROUP BY file_sha256
+        """
+    )
+    op.execute(
+        """
+        UPDATE requested_documents SET file_sha256 = NULL
+        WHERE file_sha256 IS NOT NULL AND file_sha256 NOT IN (SELECT sha256 FROM document_blobs)
+        """
+    )
+
+    doc_columns = [col["name"] for col in inspector.get_columns("requested_documents")]
+    has_blob_fk = any(
+        fk["constrained_columns"] == ["file_sha256"] for fk in inspector.get_foreign_keys("requested_documents")
+    )
+    doc_indexes = {index["name"] for index in inspector.get_indexes("requested_documents")}
+    with op.batch_alter_table("requested_documents", schema=None) as batch_op:
+        if "file_name" not in doc_columns:
+            batch_op.add_column(sa.Column("file_name", sa.String(), nullable=True))
+        if not has_blob_fk:
+            batch_op.create_foreign_key(FK_NAME, "document_blobs", ["file_sha256"], ["sha256"])
+        if "ix_requested_documents_file_sha256" not in doc_indexes:
+            batch_op.create_index("ix_requested_documents_file_sha256", ["file_sha256"])
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    doc_columns = [col["name"] for col in inspector.get_columns("requested_documents")]
+    doc_foreign_keys = {fk["name"] for fk in inspector.get_foreign_keys("requested_documents")}
+    doc_indexes = {index["name"] for index in inspector.get_indexes("requested_documents")}
+    with op.batch_alter_table("requested_documents", schema=None) as batch_op:
+        if "ix_requested_documents_file_sha256" in doc_indexes:
+            batch_op.drop_index("ix_requested_documents_file_sha256")
+        if FK_NAME in doc_foreign_keys:
+            batch_op.drop_constraint(FK_NAME, type_="foreignkey")
+        if "file_name" in doc_columns:
+            batch_op.drop_column("file_name")
+
+    if inspector.has_table("document_blobs"):
+        op.drop_table("document_blobs")
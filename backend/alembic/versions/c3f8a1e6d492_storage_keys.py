@@ -0,0 +1,38 @@
+"""document file paths become storage keys
+
+Revision ID: c3f8a1e6d492
+Revises: b8e2d5f1c637
+Create Date: 2026-10-17 23:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c3f8a1e6d492"
+down_revision: Union[str, None] = "b8e2d5f1c637"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Paths were relative to the working directory under the hardcoded "uploads" folder;
+# keys are relative to the storage root (UPLOAD_DIRECTORY for the local backend).
+PREFIX = "uploads/"
+
+
+def upgrade() -> None:
+    for table, column in (("requested_documents", "file_path"), ("document_blobs", "path")):
+        op.execute(
+            f"UPDATE {table} SET {column} = SUBSTR({column}, {len(PREFIX) + 1}) "
+            f"WHERE {column} LIKE '{PREFIX}%'"
+        )
+
+
+def downgrade() -> None:
+    for table, column in (("requested_documents", "file_path"), ("document_blobs", "path")):
+        op.execute(
+            f"UPDATE {table} SET {column} = '{PREFIX}' || {column} "
+            f"WHERE {column} IS NOT NULL AND {column} NOT LIKE '{PREFIX}%'"
+        )
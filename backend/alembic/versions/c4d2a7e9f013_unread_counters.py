@@ -0,0 +1,66 @@
+"""unread counters per case member
+
+Revision ID: c4d2a7e9f013
+Revises: b1e6d9b7f442
+Create Date: 2026-10-17 09:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c4d2a7e9f013"
+down_revision: Union[str, None] = "b1e6d9b7f442"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    # The app's startup create_all may already have created the (empty) table.
+    if not inspector.has_table("unread_counters"):
+        op.create_table(
+            "unread_counters",
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+            sa.Column("case_id", sa.Integer(), sa.ForeignKey("cases.id", ondelete="CASCADE"), primary_key=True),
+            sa.Column("count", sa.Integer(), nullable=False, server_default="0"),
+        )
+        op.create_index("ix_unread_counters_case_id", "unread_counters", ["case_id"])
+
+    # Backfill: one row per case membership with its current unread count.
+    bind.execute(sa.text("DELETE FROM unread_counters"))
+    bind.execute(
+        sa.text(
+            """
+            INSERT INTO unread_counters (user_id, case_id, count)
+            SELECT members.user_id, members.case_id, COUNT(messages.id)
+            FROM (
+                SELECT client_id AS user_id, case_id FROM case_client_association
+                UNION
+                SELECT user_id, case_id FROM case_personnel_association
+            ) AS members
+            LEFT OUTER JOIN messages
+                ON messages.case_id = members.case_id
+                AND messages.is_read = :unread
+                AND messages.sender_id != members.user_id
+            GROUP BY members.user_id, members.case_id
+            """
+        ).bindparams(sa.bindparam("unread", False, type_=sa.Boolean())),
+    )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    if inspector.has_table("unread_counters"):
+        index_names = {index["name"] for index in inspector.get_indexes("unread_counters")}
+        if "ix_unread_counters_case_id" in index_names:
+            op.drop_index("ix_unread_counters_case_id", table_name="unread_counters")
+        op.drop_table("unread_counters")
@@ -0,0 +1,61 @@
+"""outbound sms queue
+
+Revision ID: c6f1a9e4b258
+Revises: a8d4f2b6c317
+Create Date: 2026-10-17 17:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c6f1a9e4b258"
+down_revision: Union[str, None] = "a8d4f2b6c317"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    # The app's startup create_all may already have created the (empty) table.
+    if not inspector.has_table("outbound_sms"):
+        op.create_table(
+            "outbound_sms",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("to_number", sa.String(), nullable=False),
+            sa.Column("from_number", sa.String(), nullable=True),
+            sa.Column("body", sa.String(), nullable=False),
+            sa.Column("case_id", sa.Integer(), sa.ForeignKey("cases.id", ondelete="SET NULL"), nullable=True),
+            sa.Column("status", sa.String(), nullable=False, server_default="queued"),
+            sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("next_attempt_at", sa.DateTime(), nullable=False),
+            sa.Column("last_error", sa.String(), nullable=True),
+            sa.Column("provider_sid", sa.String(), nullable=True),
+            sa.Column("delivery_status", sa.String(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.Column("sent_at", sa.DateTime(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+            sa.UniqueConstraint("provider_sid"),
+        )
+
+    indexes = {index["name"] for index in inspect(bind).get_indexes("outbound_sms")}
+    if "ix_outbound_sms_id" not in indexes:
+        op.create_index("ix_outbound_sms_id", "outbound_sms", ["id"])
+    if "ix_outbound_sms_case_id" not in indexes:
+        op.create_index("ix_outbound_sms_case_id", "outbound_sms", ["case_id"])
+    if "ix_outbound_sms_due" not in indexes:
+        op.create_index("ix_outbound_sms_due", "outbound_sms", ["status", "next_attempt_at"])
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    if inspector.has_table("outbound_sms"):
+        op.drop_table("outbound_sms")
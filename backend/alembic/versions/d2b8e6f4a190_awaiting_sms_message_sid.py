@@ -0,0 +1,47 @@
+"""unique twilio message sid on awaiting sms
+
+Revision ID: d2b8e6f4a190
+Revises: c6f1a9e4b258
+Create Date: 2026-10-17 18:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d2b8e6f4a190"
+down_revision: Union[str, None] = "c6f1a9e4b258"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    columns = {column["name"] for column in inspector.get_columns("awaiting_sms")}
+    if "message_sid" not in columns:
+        # Existing rows keep NULL; only buffered webhooks carry a MessageSid.
+        op.add_column("awaiting_sms", sa.Column("message_sid", sa.String(), nullable=True))
+
+    indexes = {index["name"] for index in inspector.get_indexes("awaiting_sms")}
+    if "ix_awaiting_sms_message_sid" not in indexes:
+        op.create_index("ix_awaiting_sms_message_sid", "awaiting_sms", ["message_sid"], unique=True)
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    indexes = {index["name"] for index in inspector.get_indexes("awaiting_sms")}
+    if "ix_awaiting_sms_message_sid" in indexes:
+        op.drop_index("ix_awaiting_sms_message_sid", table_name="awaiting_sms")
+
+    columns = {column["name"] for column in inspector.get_columns("awaiting_sms")}
+    if "message_sid" in columns:
+        with op.batch_alter_table("awaiting_sms") as batch_op:
+            batch_op.drop_column("message_sid")
@@ -0,0 +1,101 @@
+"""per-reader case read watermarks
+
+Revision ID: d7b3f1c8a2e5
+Revises: c4d2a7e9f013
+Create Date: 2026-10-17 11:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d7b3f1c8a2e5"
+down_revision: Union[str, None] = "c4d2a7e9f013"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+MEMBERS_SQL = """
+    SELECT client_id AS user_id, case_id FROM case_client_association
+    UNION
+    SELECT user_id, case_id FROM case_personnel_association
+"""
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    message_indexes = {index["name"] for index in inspector.get_indexes("messages")}
+    if "ix_messages_case_id_id" not in message_indexes:
+        op.create_index("ix_messages_case_id_id", "messages", ["case_id", "id"])
+
+    # The app's startup create_all may already have created the (empty) table.
+    if not inspector.has_table("case_reads"):
+        op.create_table(
+            "case_reads",
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+            sa.Column("case_id", sa.Integer(), sa.ForeignKey("cases.id", ondelete="CASCADE"), primary_key=True),
+            sa.Column("last_read_message_id", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("read_at", sa.DateTime(), nullable=True),
+        )
+
+    # Seed each member's watermark from the old global flag: just below their oldest
+    # unread message from someone else, or the newest message when nothing is unread.
+    bind.execute(sa.text("DELETE FROM case_reads"))
+    bind.execute(
+        sa.text(
+            f"""
+            INSERT INTO case_reads (user_id, case_id, last_read_message_id, read_at)
+            SELECT
+                members.user_id,
+                members.case_id,
+                COALESCE(
+                    MIN(CASE WHEN messages.is_read = :unread AND messages.sender_id != members.user_id
+                        THEN messages.id END) - 1,
+                    MAX(messages.id),
+                    0
+                ),
+                CURRENT_TIMESTAMP
+            FROM ({MEMBERS_SQL}) AS members
+            LEFT OUTER JOIN messages ON messages.case_id = members.case_id
+            GROUP BY members.user_id, members.case_id
+            """
+        ).bindparams(sa.bindparam("unread", False, type_=sa.Boolean())),
+    )
+
+    # Recount against the watermarks.
+    bind.execute(sa.text("DELETE FROM unread_counters"))
+    bind.execute(
+        sa.text(
+            f"""
+            INSERT INTO unread_counters (user_id, case_id, count)
+            SELECT members.user_id, members.case_id, COUNT(messages.id)
+            FROM ({MEMBERS_SQL}) AS members
+            LEFT OUTER JOIN case_reads
+                ON case_reads.case_id = members.case_id
+                AND case_reads.user_id = members.user_id
+            LEFT OUTER JOIN messages
+                ON messages.case_id = members.case_id
+                AND messages.id > COALESCE(case_reads.last_read_message_id, 0)
+                AND messages.sender_id != members.user_id
+            GROUP BY members.user_id, members.case_id
+            """
+        )
+    )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    if inspector.has_table("case_reads"):
+        op.drop_table("case_reads")
+
+    message_indexes = {index["name"] for index in inspector.get_indexes("messages")}
+    if "ix_messages_case_id_id" in message_indexes:
+        op.drop_index("ix_messages_case_id_id", table_name="messages")
@@ -0,0 +1,41 @@
+"""sync markers for in-memory snapshots
+
+Revision ID: e2a9c5d4b716
+Revises: d7b3f1c8a2e5
+Create Date: 2026-10-17 13:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e2a9c5d4b716"
+down_revision: Union[str, None] = "d7b3f1c8a2e5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    # The app's startup create_all may already have created the (empty) table.
+    if not inspector.has_table("sync_markers"):
+        op.create_table(
+            "sync_markers",
+            sa.Column("name", sa.String(), primary_key=True),
+            sa.Column("value", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+        )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    if inspector.has_table("sync_markers"):
+        op.drop_table("sync_markers")
@@ -0,0 +1,74 @@
+"""sms inbox thread summaries
+
+Revision ID: e7a3c1d5f824
+Revises: d2b8e6f4a190
+Create Date: 2026-10-17 19:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e7a3c1d5f824"
+down_revision: Union[str, None] = "d2b8e6f4a190"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    # The app's startup create_all may already have created the (empty) table.
+    if not inspector.has_table("sms_threads"):
+        op.create_table(
+            "sms_threads",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("thread_key", sa.String(), nullable=False),
+            sa.Column("client_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=True),
+            sa.Column("client_phone_number", sa.String(), nullable=False),
+            sa.Column("client_name", sa.String(), nullable=True),
+            sa.Column("pending_count", sa.Integer(), nullable=False, server_default="0"),
+            sa.Column("last_received_at", sa.DateTime(), nullable=False),
+            sa.UniqueConstraint("thread_key"),
+        )
+        op.create_index("ix_sms_threads_client_id", "sms_threads", ["client_id"])
+        op.create_index("ix_sms_threads_last_received_at", "sms_threads", ["last_received_at"])
+
+    # Backfill: one row per (client, phone) with pending SMS.
+    bind.execute(sa.text("DELETE FROM sms_threads"))
+    bind.execute(
+        sa.text(
+            """
+            INSERT INTO sms_threads (thread_key, client_id, client_phone_number, client_name, pending_count, last_received_at)
+            SELECT
+                COALESCE(CAST(awaiting_sms.client_id AS VARCHAR), '') || '|' || awaiting_sms.client_phone_number,
+                awaiting_sms.client_id,
+                awaiting_sms.client_phone_number,
+                users.name,
+                COUNT(awaiting_sms.id),
+                MAX(awaiting_sms.received_at)
+            FROM awaiting_sms
+            LEFT OUTER JOIN users ON users.id = awaiting_sms.client_id
+            WHERE awaiting_sms.status = 'pending'
+            GROUP BY awaiting_sms.client_id, awaiting_sms.client_phone_number, users.name
+            """
+        )
+    )
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    inspector = inspect(bind)
+
+    if inspector.has_table("sms_threads"):
+        index_names = {index["name"] for index in inspector.get_indexes("sms_threads")}
+        if "ix_sms_threads_last_received_at" in index_names:
+            op.drop_index("ix_sms_threads_last_received_at", table_name="sms_threads")
+        if "ix_sms_threads_client_id" in index_names:
+            op.drop_index("ix_sms_threads_client_id", table_name="sms_threads")
+        op.drop_table("sms_threads")
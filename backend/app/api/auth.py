@@ -1,9 +1,11 @@
+import asyncio
 import secrets
 import requests
 import hashlib
 import base64
 import logging
 import re
+from datetime import datetime, timedelta, timezone
 
 from fastapi import APIRouter, Depends, HTTPException, Response, Cookie
 from fastapi.responses import RedirectResponse
@@ -11,16 +13,16 @@ from sqlalchemy.orm import Session
 
 from .. import auth, crud, models, schemas, database
 from ..config import get_settings
-from ..deps import get_current_user
-from .utils import set_auth_cookie, OAUTH_STATE_COOKIE, OAUTH_NONCE_COOKIE
+from ..deps import Principal, get_current_user, get_current_user_record
+from ..services import graph
+from ..services.passwords import password_hasher
+from .utils import require_admin_user, set_auth_cookie, OAUTH_STATE_COOKIE, OAUTH_NONCE_COOKIE
 
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 settings = get_settings()
 OAUTH_VERIFIER_COOKIE = "oauth_verifier"
 AZURE_SCOPE = "openid profile email User.Read offline_access"
-GRAPH_MEMBER_GROUPS_URL = "https://graph.microsoft.com/v1.0/me/getMemberGroups"
-GRAPH_MEMBER_OF_URL = "https://graph.microsoft.com/v1.0/me/memberOf?$select=id,displayName"
 logger = logging.getLogger(__name__)
 
 
@@ -55,92 +57,82 @@ def _resolve_role_from_groups(group_identifiers: list[str]) -> tuple[str | None,
     return None, None
 
 
-def _fetch_graph_group_ids(access_token: str | None) -> list[str]:
-    if not access_token:
-        return []
-    try:
-        response = requests.post(
-            GRAPH_MEMBER_GROUPS_URL,
-            headers={"Authorization": f"Bearer {access_token}"},
-            json={"securityEnabledOnly": False},
-            timeout=10,
-        )
-        response.raise_for_status()
-        data = response.json()
-        values = data.get("value", [])
-        if isinstance(values, list):
-            return [str(value) for value in values]
-    except Exception as exc:
-        logger.warning("Failed to fetch Azure groups from Graph: %s", exc)
-    return []
-
-
-def _fetch_graph_group_names(access_token: str | None) -> list[str]:
-    if not access_token:
-        return []
-    try:
-        response = requests.get(
-            GRAPH_MEMBER_OF_URL,
-            headers={"Authorization": f"Bearer {access_token}"},
-            timeout=10,
-        )
-        response.raise_for_status()
-        data = response.json()
-        values = data.get("value", [])
-        if not isinstance(values, list):
-            return []
-        names: list[str] = []
-        for value in values:
-            if not isinstance(value, dict):
-                continue
-            display_name = value.get("displayName")
-            if display_name:
-                names.append(str(display_name))
-        return names
-    except Exception as exc:
-        logger.warning("Failed to fetch Azure group names from Graph: %s", exc)
-    return []
-
-
-def _extract_group_ids(payload: dict, access_token: str | None) -> list[str]:
-    token_groups = payload.get("groups")
-    if isinstance(token_groups, list):
-        return [str(group_id) for group_id in token_groups]
+def _recently_synced_group_ids(db: Session, aad_object_id: str | None) -> list[str] | None:
+    """Group ids stored by a login within AZURE_GROUP_SYNC_TTL_SECONDS (shared across workers)."""
+    if not aad_object_id:
+        return None
+    user = crud.get_user_by_aad(db, aad_object_id)
+    if not user or not user.last_azure_sync_at:
+        return None
+    synced_at = user.last_azure_sync_at
+    if synced_at.tzinfo is None:
+        synced_at = synced_at.replace(tzinfo=timezone.utc)
+    if datetime.now(timezone.utc) - synced_at > timedelta(seconds=settings.azure_group_sync_ttl_seconds):
+        return None
+    return [str(group_id) for group_id in user.azure_groups] or None
 
-    claim_names = payload.get("_claim_names") or {}
-    if isinstance(claim_names, dict) and "groups" in claim_names:
-        return _fetch_graph_group_ids(access_token)
 
-    return _fetch_graph_group_ids(access_token)
-
-
-def _extract_group_identifiers(payload: dict, access_token: str | None) -> tuple[list[str], list[str]]:
-    group_ids = _extract_group_ids(payload, access_token)
+def _extract_group_identifiers(db: Session, payload: dict, access_token: str | None) -> tuple[list[str], list[str]]:
+    token_groups = payload.get("groups")
+    group_ids = [str(group_id) for group_id in token_groups] if isinstance(token_groups, list) else None
     # Fetch group names only when config seems to rely on names.
     configured_group_keys = list(settings.azure_group_role_map.keys()) + list(settings.azure_allowed_group_ids)
     requires_name_lookup = any(key and not _looks_like_uuid(key) for key in configured_group_keys)
-    group_names = _fetch_graph_group_names(access_token) if requires_name_lookup else []
+    aad_object_id = payload.get("oid")
+    if group_ids is None and not requires_name_lookup:
+        group_ids = _recently_synced_group_ids(db, aad_object_id)
+
+    graph_ids, group_names = graph.resolve_graph_groups(
+        aad_object_id,
+        access_token,
+        fetch_ids=group_ids is None,
+        fetch_names=requires_name_lookup,
+    )
+    if group_ids is None:
+        group_ids = graph_ids
     combined = list(dict.fromkeys([*group_ids, *group_names]))
     return group_ids, combined
 
 
+def _login_candidate(db: Session, email: str) -> tuple[int, str] | None:
+    user = crud.get_user_by_email(db, email)
+    candidate = (user.id, user.hashed_password) if user else None
+    # Release the connection before the bcrypt wait; a login burst must not drain the pool.
+    db.rollback()
+    return candidate
+
+
+def _complete_login(db: Session, user_id: int, new_hash: str | None, response: Response) -> schemas.User:
+    user = crud.get_user_by_id(db, user_id)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid email or password.")
+    user = crud.record_local_login(db, user, new_hash)
+    set_auth_cookie(response, user)
+    # Serialised here so the profile relationships load off the event loop.
+    return schemas.User.model_validate(user)
+
+
 @router.post("/login", response_model=schemas.User)
-def auth_login(
+async def auth_login(
     credentials: schemas.UserLogin,
     response: Response,
     db: Session = Depends(database.get_db),
 ):
-    user = crud.authenticate_user(db, credentials.email, credentials.password)
-    if not user:
+    # Async so a login waiting on the hashing pool holds neither a threadpool thread nor
+    # a database connection; the lookups on either side of the check run in a thread.
+    candidate = await asyncio.to_thread(_login_candidate, db, credentials.email)
+    valid, new_hash = False, None
+    if candidate:
+        valid, new_hash = await password_hasher.verify_and_update_async(credentials.password, candidate[1])
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid email or password.")
-    if not user.auth_provider:
-        user.auth_provider = "local"
-    if not user.effective_role_source:
-        user.effective_role_source = "local"
-    db.commit()
-    db.refresh(user)
-    set_auth_cookie(response, user)
-    return user
+    return await asyncio.to_thread(_complete_login, db, candidate[0], new_hash, response)
+
+
+@router.get("/admin/password-hashing/stats")
+def get_password_hashing_stats(current_user: Principal = Depends(get_current_user)):
+    require_admin_user(current_user)
+    return password_hasher.stats()
 
 
 @router.post("/logout")
@@ -155,7 +147,7 @@ def auth_logout(response: Response):
 
 
 @router.get("/me", response_model=schemas.User)
-def auth_me(current_user: models.User = Depends(get_current_user)):
+def auth_me(current_user: models.User = Depends(get_current_user_record)):
     return current_user
 
 
@@ -169,7 +161,7 @@ def azure_start():
     ).decode("utf-8").rstrip("=")
 
     auth_url = (
-        f"https://login.microsoftonline.com/{settings.azure_tenant_id}/oauth2/v2.0/authorize"
+        f"{settings.azure_authority_host.rstrip('/')}/{settings.azure_tenant_id}/oauth2/v2.0/authorize"
         f"?client_id={settings.azure_client_id}"
         f"&response_type=code"
         f"&redirect_uri={settings.azure_redirect_uri}"
@@ -214,7 +206,7 @@ def azure_callback(
     if not oauth_verifier:
         raise HTTPException(status_code=400, detail="Missing PKCE verifier")
 
-    token_url = f"https://login.microsoftonline.com/{settings.azure_tenant_id}/oauth2/v2.0/token"
+    token_url = f"{settings.azure_authority_host.rstrip('/')}/{settings.azure_tenant_id}/oauth2/v2.0/token"
     data = {
         "client_id": settings.azure_client_id,
         "client_secret": settings.azure_client_secret,
@@ -252,7 +244,7 @@ def azure_callback(
         if settings.azure_tenant_id and token_tenant_id != settings.azure_tenant_id:
             raise HTTPException(status_code=403, detail="Tenant is not allowed.")
 
-        group_ids, group_identifiers = _extract_group_identifiers(payload, access_token)
+        group_ids, group_identifiers = _extract_group_identifiers(db, payload, access_token)
         configured_allowed_groups = list(set(settings.azure_allowed_group_ids) or set(settings.azure_group_role_map.keys()))
         normalized_allowed_groups = {
             _normalize_group_key(group_id)
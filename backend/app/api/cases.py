@@ -3,20 +3,24 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 
 from .. import database, models, schemas, crud
-from ..deps import get_current_user
-from .utils import PERSONNEL_ROLES, require_role, ensure_case_access
+from ..deps import Principal, get_current_user
+from .utils import PERSONNEL_ROLES, require_role, ensure_case_access, get_accessible_case, invalidate_case_access
+from .ws import publish_case_read, publish_membership_changed
 
 
 router = APIRouter(tags=["cases"])
+MAX_MESSAGE_PAGE_SIZE = 500
 
 
 def _to_case_schema(
     db: Session,
     case: models.Case,
     unread_count: int = 0,
-    current_user: models.User | None = None,
+    current_user: Principal | None = None,
+    client_roles: dict[int, str] | None = None,
 ) -> schemas.Case:
-    client_roles = crud.get_case_client_roles_map(db=db, case_id=case.id)
+    if client_roles is None:
+        client_roles = crud.get_case_client_roles_map(db=db, case_id=case.id)
     for client in case.clients:
         setattr(client, "case_role", client_roles.get(client.id, "client"))
 
@@ -39,22 +43,35 @@ def _to_case_schema(
     return case_schema
 
 
+def _to_case_schemas(
+    db: Session,
+    rows: List[tuple[models.Case, int]],
+    current_user: Principal,
+) -> List[schemas.Case]:
+    """Serializes a case list with one role-map query for the whole page."""
+    roles_by_case = crud.get_case_client_roles_maps(db, [case.id for case, _ in rows])
+    return [
+        _to_case_schema(db, case, count, current_user, client_roles=roles_by_case[case.id])
+        for case, count in rows
+    ]
+
+
 @router.get("/cases", response_model=List[schemas.Case])
 def get_cases(
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     if current_user.role == "admin":
         all_cases = crud.get_cases(db, skip=skip, limit=limit)
-        return [_to_case_schema(db, case, 0, current_user) for case in all_cases]
+        return _to_case_schemas(db, [(case, 0) for case in all_cases], current_user)
     if current_user.role in PERSONNEL_ROLES:
         results = crud.get_lawyer_cases(db, current_user.id)
-        return [_to_case_schema(db, case, count, current_user) for case, count in results]
+        return _to_case_schemas(db, results, current_user)
     if current_user.role == "client":
         results = crud.get_client_cases(db, current_user.id)
-        return [_to_case_schema(db, case, count, current_user) for case, count in results]
+        return _to_case_schemas(db, results, current_user)
     return []
 
 
@@ -62,31 +79,31 @@ def get_cases(
 def get_lawyer_cases(
     lawyer_id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     if current_user.id != lawyer_id:
         raise HTTPException(status_code=403, detail="Forbidden")
     results = crud.get_lawyer_cases(db, lawyer_id)
-    return [_to_case_schema(db, case, count, current_user) for case, count in results]
+    return _to_case_schemas(db, results, current_user)
 
 
 @router.get("/clients/{client_id}/cases", response_model=List[schemas.Case])
 def get_client_cases_route(
     client_id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     if current_user.id != client_id:
         raise HTTPException(status_code=403, detail="Forbidden")
     results = crud.get_client_cases(db, client_id)
-    return [_to_case_schema(db, case, count, current_user) for case, count in results]
+    return _to_case_schemas(db, results, current_user)
 
 
 @router.post("/cases", response_model=schemas.Case)
 def create_case(
     case: schemas.CaseCreate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     # Auto-assign creator only for non-admin personnel roles.
@@ -112,7 +129,7 @@ def add_personnel_to_case(
     user_id: int,
     role: str,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     ensure_case_access(db, current_user, case_id)
@@ -133,7 +150,9 @@ def add_personnel_to_case(
         role=role,
     )
     db.execute(stmt)
+    crud.sync_case_unread_counters(db, db_case.id)
     db.commit()
+    publish_membership_changed(user_id)
     return crud.get_user_by_id(db, user_id)
 
 
@@ -142,7 +161,7 @@ def remove_personnel_from_case(
     case_id: int,
     user_id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     ensure_case_access(db, current_user, case_id)
@@ -154,8 +173,12 @@ def remove_personnel_from_case(
         models.case_personnel_association.c.case_id == case_id,
         models.case_personnel_association.c.user_id == user_id,
     )
-    db.execute(stmt)
+    result = db.execute(stmt)
+    crud.sync_case_unread_counters(db, case_id)
     db.commit()
+    invalidate_case_access(case_id, user_id)
+    if result.rowcount:
+        publish_membership_changed(user_id)
     return Response(status_code=204)
 
 
@@ -165,13 +188,14 @@ def add_client_to_case(
     user_id: int,
     role_type: str = "client",
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     ensure_case_access(db, current_user, case_id)
     client_user = crud.add_client_to_case(db, case_id=case_id, user_id=user_id, role_type=role_type)
     if not client_user:
         raise HTTPException(status_code=404, detail="Case not found")
+    publish_membership_changed(client_user.id)
     return client_user
 
 
@@ -181,7 +205,7 @@ def update_case_client_role(
     user_id: int,
     payload: schemas.CaseClientRoleUpdate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     ensure_case_access(db, current_user, case_id)
@@ -199,7 +223,7 @@ def remove_client_from_case(
     case_id: int,
     user_id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     ensure_case_access(db, current_user, case_id)
@@ -215,7 +239,10 @@ def remove_client_from_case(
         db_case.clients.remove(client_user)
         if client_user.client_profile and client_user.client_profile.active_cases > 0:
             client_user.client_profile.active_cases -= 1
+        crud.sync_case_unread_counters(db, case_id)
         db.commit()
+        invalidate_case_access(case_id, client_user.id)
+        publish_membership_changed(client_user.id)
 
     return Response(status_code=204)
 
@@ -223,13 +250,37 @@ def remove_client_from_case(
 @router.get("/cases/{case_id}/messages", response_model=List[schemas.Message])
 def get_messages_for_case(
     case_id: int,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    latest: bool = False,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
+    """
+    Messages in ascending order. `latest=true` returns the newest page; page with
+    `before_id` (older) or `after_id` (newer). When another page may exist its cursor
+    is returned in X-Next-Before-Id / X-Next-After-Id.
+    """
     ensure_case_access(db, current_user, case_id)
-    return crud.get_case_messages(db, case_id=case_id, skip=skip, limit=limit)
+    limit = max(1, min(limit, MAX_MESSAGE_PAGE_SIZE))
+    messages = crud.get_case_messages(
+        db,
+        case_id=case_id,
+        skip=skip,
+        limit=limit,
+        before_id=before_id,
+        after_id=after_id,
+        latest=latest,
+    )
+    if len(messages) == limit:
+        if before_id is not None or (latest and after_id is None):
+            response.headers["X-Next-Before-Id"] = str(messages[0].id)
+        else:
+            response.headers["X-Next-After-Id"] = str(messages[-1].id)
+    return messages
 
 
 @router.post("/cases/{case_id}/read")
@@ -237,10 +288,11 @@ def mark_case_as_read(
     case_id: int,
     payload: schemas.MarkReadPayload,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     ensure_case_access(db, current_user, case_id)
     updated_count = crud.mark_messages_as_read(db, case_id=case_id, reader_id=current_user.id)
+    publish_case_read(case_id, current_user.id, updated_count)
     return {"status": "success", "updated_messages": updated_count}
 
 
@@ -248,7 +300,7 @@ def mark_case_as_read(
 def check_sms_tag(
     tag: str,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     exists = db.query(models.Case).filter(models.Case.sms_id_tag == tag).first()
@@ -259,7 +311,7 @@ def check_sms_tag(
 def get_case_detail(
     id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
-    db_case = ensure_case_access(db, current_user, id)
+    db_case = get_accessible_case(db, current_user, id)
     return _to_case_schema(db, db_case, 0, current_user)
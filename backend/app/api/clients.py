@@ -3,7 +3,7 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 
 from .. import database, models, schemas, crud
-from ..deps import get_current_user
+from ..deps import Principal, get_current_user
 from .utils import PERSONNEL_ROLES, require_role
 
 
@@ -15,7 +15,7 @@ def get_clients_route(
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     return crud.get_all_clients(db, skip=skip, limit=limit)
@@ -25,7 +25,7 @@ def get_clients_route(
 def get_client_route(
     client_id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     client = crud.get_user_by_id(db, client_id)
@@ -38,7 +38,7 @@ def get_client_route(
 def create_client_route(
     client_data: schemas.UserCreate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     client_data.role = "client"
@@ -50,7 +50,7 @@ def update_client_route(
     client_id: int,
     client_data: schemas.ClientUpdate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     updated_client = crud.update_client(db, client_id, client_data)
@@ -63,7 +63,7 @@ def update_client_route(
 def delete_client_route(
     client_id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     success = crud.delete_user(db, client_id)
@@ -78,7 +78,7 @@ def get_available_clients_route(
     skip: int = 0,
     limit: int = 50,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     return crud.get_all_clients(db, search_term=search, skip=skip, limit=limit)
@@ -90,7 +90,7 @@ def get_available_personnel_route(
     skip: int = 0,
     limit: int = 50,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     return crud.get_lawyers_and_personnel(db, search_term=search, skip=skip, limit=limit)
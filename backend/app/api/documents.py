@@ -1,22 +1,24 @@
+import asyncio
 import os
-import shutil
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
-from typing import List
-from starlette.datastructures import UploadFile
+from typing import List, Optional
 
 from .. import database, models, schemas, crud
-from ..deps import get_current_user
-from .utils import PERSONNEL_ROLES, require_role, ensure_case_access, require_admin_user
-from fastapi.responses import FileResponse
+from ..deps import Principal, get_current_user
+from .utils import PERSONNEL_ROLES, require_role, ensure_case_access, get_accessible_case, require_admin_user
 from ..config import get_settings
-from ..services.sms import send_sms
+from ..services.sms import sms_dispatcher
+from ..services.downloads import serve_stored_file
+from ..services.uploads import ResumableUpload, StoredUpload, receive_uploads
+from .ws import publish_message_created
 
 
 router = APIRouter(tags=["documents"])
 settings = get_settings()
-UPLOAD_DIRECTORY = "uploads"
+# Local staging area for uploads in progress; finished files go to document_storage.
+UPLOAD_DIRECTORY = settings.upload_directory
 
 
 
@@ -26,22 +28,23 @@ def create_doc_request(
     case_id: int,
     request_data: schemas.DocumentRequestCreate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     request_data = request_data.model_copy(update={"lawyer_id": current_user.id})
     lawyer_id = current_user.id
 
-    db_case = ensure_case_access(db, current_user, case_id)
-    if not db_case:
-        raise HTTPException(status_code=404, detail="Case not found")
+    db_case = get_accessible_case(db, current_user, case_id)
 
     is_assigned = any(user.id == lawyer_id for user in db_case.personnel)
     if not is_assigned:
         raise HTTPException(status_code=403, detail="Only assigned personnel can send a request for this case.")
 
-    db_request = crud.create_document_request(db, case_id=case_id, request_data=request_data)
+    # The request, its chat message and the client SMS are committed together, so a
+    # stored request always has its SMS queued.
+    db_request = crud.add_document_request(db, case_id=case_id, request_data=request_data)
 
+    sms_queued = False
     primary_client = db_case.clients[0] if db_case.clients else None
     if primary_client and primary_client.client_profile and primary_client.client_profile.phone:
         client_phone = primary_client.client_profile.phone
@@ -50,7 +53,15 @@ def create_doc_request(
             f"New documents are required for your case (#{db_case.case_number} - {db_case.title}). "
             f"Click to upload them: {link}"
         )
-        send_sms(to_number=client_phone, body=message_body)
+        crud.add_outbound_sms(db, client_phone, message_body, case_id=case_id)
+        sms_queued = True
+    db.commit()
+    db.refresh(db_request)
+
+    if db_request.chat_message:
+        publish_message_created(db, db_request.chat_message)
+    if sms_queued:
+        sms_dispatcher.notify()
     return db_request
 
 
@@ -58,7 +69,7 @@ def create_doc_request(
 def get_case_doc_requests(
     case_id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     ensure_case_access(db, current_user, case_id)
     return crud.get_all_requests_by_case(db, case_id)
@@ -81,73 +92,181 @@ def get_doc_request_by_token(
 
 
 MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+# Allowance for part headers and form fields when bounding the whole body up front.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
 ALLOWED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png", ".doc", ".docx"}
+# Partial resumable uploads live here, inside each request's upload directory.
+RESUMABLE_SUBDIRECTORY = ".resumable"
 
 
-@router.post("/requests/{token}/upload")
-async def upload_documents_for_request(
-    token: str,
-    request: Request,
-    db: Session = Depends(database.get_db),
-):
+def _open_upload_request(db: Session, token: str) -> models.DocumentRequest:
     db_request = crud.get_document_request_by_token(db, token)
     if not db_request:
         raise HTTPException(status_code=404, detail="Document request not found.")
     if db_request.status == "completed":
         raise HTTPException(status_code=400, detail="This request is already completed.")
+    return db_request
+
+
+def _record_uploads(db: Session, request_id: int, uploads: List[StoredUpload]) -> dict:
+    db_request = crud.get_document_request_by_id(db, request_id)
+    docs_by_id = {doc.id: doc for doc in db_request.requested_documents}
+    for upload in uploads:
+        db_doc = docs_by_id[int(upload.field_name)]
+        crud.attach_document_file(db, db_doc, upload.path, upload.sha256, upload.size, upload.filename)
+        db_doc.status = "uploaded"
+
+    all_docs_uploaded = all(doc.status != "required" for doc in db_request.requested_documents)
+    db_request.status = "completed" if all_docs_uploaded else "pending"
+    db.commit()
+    db.refresh(db_request)
 
-    request_upload_dir = os.path.join(UPLOAD_DIRECTORY, str(db_request.id))
-    os.makedirs(request_upload_dir, exist_ok=True)
+    return {"status": "success", "uploaded_files": len(uploads), "request_status": db_request.status}
 
-    form_data = await request.form()
-    uploaded_doc_ids = []
 
-    for field_name, file_or_value in form_data.items():
-        if not isinstance(file_or_value, UploadFile):
-            continue
+def _upload_target(db: Session, token: str) -> tuple[int, set[int]]:
+    db_request = _open_upload_request(db, token)
+    target = db_request.id, {doc.id for doc in db_request.requested_documents}
+    # Release the connection while the body streams in; a slow client must not hold it.
+    db.rollback()
+    return target
 
-        file = file_or_value
+
+@router.post("/requests/{token}/upload")
+async def upload_documents_for_request(
+    token: str,
+    request: Request,
+    db: Session = Depends(database.get_db),
+):
+    """
+    Multipart upload for a document request: file fields are named by requested
+    document id. The body is streamed to disk (see services.uploads.receive_uploads),
+    so memory and temp space stay constant however many files are attached.
+    """
+    request_id, doc_ids = await asyncio.to_thread(_upload_target, db, token)
+    request_upload_dir = os.path.join(UPLOAD_DIRECTORY, str(request_id))
+
+    def target_path(field_name: str, filename: str):
         try:
             doc_id = int(field_name)
-            uploaded_doc_ids.append(doc_id)
-            db_doc = crud.get_requested_document_by_id(db, doc_id)
-            if not db_doc or db_doc.request_id != db_request.id:
-                continue
+        except ValueError:
+            return None
+        if doc_id not in doc_ids or not filename:
+            return None
+        return os.path.join(request_upload_dir, f"{doc_id}_{filename}")
+
+    uploads = await receive_uploads(
+        request,
+        target_path,
+        max_bytes=MAX_UPLOAD_BYTES,
+        allowed_extensions=ALLOWED_EXTENSIONS,
+        max_body_bytes=len(doc_ids) * MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+    )
+    # Attaching hands the files to document_storage, which may be a remote store.
+    return await asyncio.to_thread(_record_uploads, db, request_id, uploads)
+
+
+# -------------------------------------------------------------------------
+# Resumable uploads: POST to open (or resume), GET for the offset, PATCH with an
+# Upload-Offset header to append bytes, POST .../complete to finalize.
+# -------------------------------------------------------------------------
+
+def _resumable_upload(db: Session, token: str, doc_id: int) -> tuple[int, ResumableUpload]:
+    db_request = _open_upload_request(db, token)
+    if not any(doc.id == doc_id for doc in db_request.requested_documents):
+        raise HTTPException(status_code=404, detail="Requested document not found.")
+    request_id = db_request.id
+    db.rollback()
+    directory = os.path.join(UPLOAD_DIRECTORY, str(request_id), RESUMABLE_SUBDIRECTORY)
+    return request_id, ResumableUpload(directory, str(doc_id))
+
+
+def _resumable_status(doc_id: int, upload: ResumableUpload, response: Response, offset: Optional[int] = None):
+    meta = upload.load()
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Upload not started.")
+    offset = upload.offset if offset is None else offset
+    response.headers["Upload-Offset"] = str(offset)
+    response.headers["Upload-Length"] = str(meta["size"])
+    response.headers["Cache-Control"] = "no-store"
+    return schemas.ResumableUploadStatus(document_id=doc_id, filename=meta["filename"], size=meta["size"], offset=offset)
+
+
+@router.post("/requests/{token}/documents/{doc_id}/upload", response_model=schemas.ResumableUploadStatus)
+def start_resumable_upload(
+    token: str,
+    doc_id: int,
+    payload: schemas.ResumableUploadCreate,
+    response: Response,
+    db: Session = Depends(database.get_db),
+):
+    """Opens a resumable upload; re-posting the same filename and size resumes it."""
+    filename = os.path.basename(payload.filename.replace("\\", "/"))
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"File type not allowed: {ext}")
+    if payload.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+
+    _, upload = _resumable_upload(db, token, doc_id)
+    upload.start(filename, payload.size)
+    return _resumable_status(doc_id, upload, response)
+
 
-            ext = os.path.splitext(file.filename or "")[1].lower()
-            if ext not in ALLOWED_EXTENSIONS:
-                raise HTTPException(status_code=400, detail=f"File type not allowed: {ext}")
+@router.get("/requests/{token}/documents/{doc_id}/upload", response_model=schemas.ResumableUploadStatus)
+def get_resumable_upload(
+    token: str,
+    doc_id: int,
+    response: Response,
+    db: Session = Depends(database.get_db),
+):
+    _, upload = _resumable_upload(db, token, doc_id)
+    return _resumable_status(doc_id, upload, response)
 
-            file.file.seek(0, os.SEEK_END)
-            size = file.file.tell()
-            file.file.seek(0)
-            if size > MAX_UPLOAD_BYTES:
-                raise HTTPException(status_code=413, detail="File too large")
 
-            safe_filename = os.path.basename(file.filename)
-            file_path = os.path.join(request_upload_dir, f"{doc_id}_{safe_filename}")
+@router.patch("/requests/{token}/documents/{doc_id}/upload", response_model=schemas.ResumableUploadStatus)
+async def append_resumable_upload(
+    token: str,
+    doc_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(database.get_db),
+):
+    """Appends the raw request body at the Upload-Offset header (409 if it is stale)."""
+    offset_header = request.headers.get("upload-offset", "")
+    if not offset_header.isdigit():
+        raise HTTPException(status_code=400, detail="Missing or invalid Upload-Offset header.")
 
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+    _, upload = await asyncio.to_thread(_resumable_upload, db, token, doc_id)
+    offset = await upload.append(request, int(offset_header))
+    return await asyncio.to_thread(_resumable_status, doc_id, upload, response, offset)
 
-            db_doc.status = "uploaded"
-            db_doc.file_path = file_path
-        except ValueError:
-            continue
-        finally:
-            file.file.close()
 
-    all_docs_uploaded = True
-    for doc in db_request.requested_documents:
-        if doc.status == "required":
-            all_docs_uploaded = False
-            break
+@router.post("/requests/{token}/documents/{doc_id}/upload/complete")
+def complete_resumable_upload(
+    token: str,
+    doc_id: int,
+    payload: Optional[schemas.ResumableUploadComplete] = None,
+    db: Session = Depends(database.get_db),
+):
+    request_id, upload = _resumable_upload(db, token, doc_id)
+    meta = upload.load()
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Upload not started.")
+    final_path = os.path.join(UPLOAD_DIRECTORY, str(request_id), f"{doc_id}_{meta['filename']}")
+    stored = upload.finalize(final_path, expected_sha256=payload.sha256 if payload else None)
+    return _record_uploads(db, request_id, [stored])
 
-    db_request.status = "completed" if all_docs_uploaded else "pending"
-    db.commit()
-    db.refresh(db_request)
 
-    return {"status": "success", "uploaded_files": len(uploaded_doc_ids), "request_status": db_request.status}
+@router.delete("/requests/{token}/documents/{doc_id}/upload", status_code=204)
+def cancel_resumable_upload(
+    token: str,
+    doc_id: int,
+    db: Session = Depends(database.get_db),
+):
+    _, upload = _resumable_upload(db, token, doc_id)
+    upload.discard()
+    return Response(status_code=204)
 
 
 @router.post("/requests/{request_id}/upload-legacy")
@@ -158,38 +277,40 @@ async def upload_documents_for_request_legacy(request_id: int):
 @router.get("/documents/{doc_id}/download")
 def download_document(
     doc_id: int,
+    request: Request,
+    inline: bool = False,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
-    db_doc = crud.get_requested_document_by_id(db, doc_id)
-    if not db_doc or not db_doc.file_path:
+    """
+    Serves a stored document (see services.downloads.serve_stored_file) after a single
+    lookup that also checks case membership. `inline=true` lets the browser's PDF viewer
+    open it, seeking with Range requests.
+    """
+    download = crud.get_document_download(db, doc_id, current_user.id, current_user.role)
+    if not download or not download.file_path:
         raise HTTPException(status_code=404, detail="Document not found")
-
-    db_request = crud.get_document_request_by_id(db, db_doc.request_id)
-    if not db_request:
-        raise HTTPException(status_code=404, detail="Document request not found")
-
-    case = crud.get_case_by_id(db, db_request.case_id)
-    if not case:
-        raise HTTPException(status_code=404, detail="Case not found")
-
-    if current_user.role == "admin":
-        pass
-    elif current_user.role == "client":
-        if not any(c.id == current_user.id for c in case.clients):
-            raise HTTPException(status_code=403, detail="Forbidden")
-    else:
-        if not any(p.id == current_user.id for p in case.personnel):
-            raise HTTPException(status_code=403, detail="Forbidden")
-
-    return FileResponse(db_doc.file_path, filename=os.path.basename(db_doc.file_path))
+    if not download.allowed:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    # Nothing else needs the database; don't hold a connection while the bytes go out.
+    db.rollback()
+
+    return serve_stored_file(
+        request.headers,
+        download.file_path,
+        download.file_name or os.path.basename(download.file_path),
+        size=download.file_size,
+        sha256=download.file_sha256,
+        stored_at=download.stored_at,
+        inline=inline,
+    )
 
 
 @router.get("/documents", response_model=List[schemas.DocumentResponse])
 def get_all_documents(
     user_id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Forbidden")
@@ -217,7 +338,7 @@ def get_all_documents_admin(
     skip: int = 0,
     limit: int = 1000,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_admin_user(current_user)
     results = crud.get_all_documents_admin(
@@ -248,7 +369,7 @@ def update_document_status_admin(
     doc_id: int,
     payload: schemas.DocumentStatusUpdate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_admin_user(current_user)
     updated_doc = crud.update_requested_document_status(db, doc_id=doc_id, new_status=payload.status)
@@ -274,22 +395,16 @@ def update_document_status_admin(
 def delete_document_file_admin(
     doc_id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_admin_user(current_user)
     existing = crud.get_requested_document_by_id(db, doc_id)
     if not existing:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    file_path = existing.file_path
+    # Releases the document's reference; the bytes go only if no other document shares them.
     updated_doc = crud.clear_requested_document_file(db, doc_id)
     if not updated_doc:
         raise HTTPException(status_code=404, detail="Document not found")
 
-    if file_path and os.path.exists(file_path):
-        try:
-            os.remove(file_path)
-        except OSError:
-            pass
-
     return None
@@ -5,7 +5,7 @@ from sqlalchemy.orm import Session
 
 from .. import crud, database, models, schemas
 from ..config import get_settings
-from ..deps import get_current_user
+from ..deps import Principal, get_current_user
 from .utils import require_permission
 
 
@@ -22,7 +22,7 @@ def _invite_url(token: str) -> str:
 def create_invite_route(
     payload: schemas.InviteCreate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_permission(db, current_user, settings.invite_manage_permission)
     invite, token = crud.create_invite(
@@ -47,7 +47,7 @@ def list_invites_route(
     skip: int = 0,
     limit: int = 200,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_permission(db, current_user, settings.invite_manage_permission)
     invites = crud.list_invites(db, status=status, skip=skip, limit=limit)
@@ -1,4 +1,6 @@
 from typing import List, Optional
+import asyncio
+import json
 import logging
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Response
@@ -6,10 +8,11 @@ from sqlalchemy.orm import Session
 from twilio.request_validator import RequestValidator
 
 from .. import database, models, schemas, crud
-from ..deps import get_current_user
+from ..deps import Principal, get_current_user
 from .utils import PERSONNEL_ROLES, require_role
 from ..config import get_settings
-from .ws import manager
+from ..services.sms import inbound_sms_writer
+from .ws import manager, publish_message_created, publish_messages_created
 
 
 router = APIRouter(tags=["sms"])
@@ -51,12 +54,7 @@ def _validate_twilio_signature(request: Request, form_payload: dict, signature:
     return False
 
 
-@router.post("/api/twilio/webhook/sms")
-@router.post("/twilio/webhook/sms")
-async def twilio_sms_webhook(
-    request: Request,
-    db: Session = Depends(database.get_db),
-):
+async def _verified_twilio_payload(request: Request) -> dict:
     if not settings.twilio_auth_token:
         raise HTTPException(status_code=500, detail="Twilio auth token not configured")
 
@@ -65,29 +63,68 @@ async def twilio_sms_webhook(
     payload = {key: value for key, value in form_data.multi_items()}
     if settings.twilio_validate_signature:
         if not _validate_twilio_signature(request, payload, signature):
-            logger.warning("Twilio signature validation failed for inbound SMS. url=%s", str(request.url))
+            logger.warning("Twilio signature validation failed. url=%s", str(request.url))
             raise HTTPException(status_code=403, detail="Invalid Twilio signature")
     else:
         logger.warning("Twilio signature validation disabled by TWILIO_VALIDATE_SIGNATURE")
+    return payload
+
+
+@router.post("/api/twilio/webhook/sms")
+@router.post("/twilio/webhook/sms")
+async def twilio_sms_webhook(request: Request):
+    """
+    Acknowledges inbound SMS as soon as they are in the write-ahead log; the batch
+    writer (services.sms.inbound_sms_writer) stores them in the inbox shortly after.
+    """
+    payload = await _verified_twilio_payload(request)
 
     client_phone = payload.get("From")
     sms_body = payload.get("Body")
     if not client_phone or not sms_body:
         raise HTTPException(status_code=400, detail="Missing 'From' or 'Body' data")
 
-    client = crud.get_user_by_phone(db, client_phone)
-    client_id = client.id if client else None
-    created = crud.create_awaiting_sms(db, phone=client_phone, body=sms_body, client_id=client_id)
-    logger.info(
-        "Inbound SMS stored in inbox. awaiting_sms_id=%s from=%s client_id=%s",
-        created.id,
-        client_phone,
-        client_id,
-    )
+    message_sid = payload.get("MessageSid") or payload.get("SmsSid")
+    try:
+        if not inbound_sms_writer.running:
+            raise RuntimeError("inbound SMS writer is not running")
+        inbound_sms_writer.append(message_sid, client_phone, sms_body)
+    except (OSError, RuntimeError) as exc:
+        logger.error("Inbound SMS log unavailable (%s); storing directly. sid=%s", exc, message_sid)
+        await asyncio.to_thread(_store_inbound_sms_now, message_sid, client_phone, sms_body)
 
     return Response(content="<Response></Response>", media_type="application/xml")
 
 
+def _store_inbound_sms_now(message_sid: Optional[str], client_phone: str, sms_body: str):
+    db = database.SessionLocal()
+    try:
+        crud.store_inbound_sms_batch(db, [{"message_sid": message_sid, "from": client_phone, "body": sms_body}])
+    finally:
+        db.close()
+
+
+@router.post("/api/twilio/webhook/sms-status")
+@router.post("/twilio/webhook/sms-status")
+async def twilio_sms_status_webhook(
+    request: Request,
+    db: Session = Depends(database.get_db),
+):
+    """Delivery receipts for outbound SMS (TWILIO_STATUS_CALLBACK_URL points here)."""
+    payload = await _verified_twilio_payload(request)
+
+    message_sid = payload.get("MessageSid")
+    message_status = payload.get("MessageStatus")
+    if not message_sid or not message_status:
+        raise HTTPException(status_code=400, detail="Missing 'MessageSid' or 'MessageStatus' data")
+
+    error_code = payload.get("ErrorCode")
+    error = f"Twilio error {error_code}" if error_code else None
+    if not crud.update_outbound_sms_delivery(db, message_sid, message_status, error):
+        logger.info("Status callback for unknown or superseded SMS. sid=%s status=%s", message_sid, message_status)
+    return Response(status_code=204)
+
+
 def _broadcast_case_message(message: models.Message):
     return schemas.Message.from_orm(message).model_dump_json()
 
@@ -96,7 +133,7 @@ async def _assign_inbox_sms(
     db: Session,
     sms_id: int,
     payload: schemas.AssignSMSPayload,
-    current_user: models.User,
+    current_user: Principal,
 ) -> models.Message:
     awaiting_sms = crud.get_awaiting_sms_by_id(db, sms_id)
     if not awaiting_sms:
@@ -130,6 +167,7 @@ async def _assign_inbox_sms(
 
     room = f"case_{case.id}"
     await manager.broadcast(_broadcast_case_message(db_message_full), room)
+    publish_message_created(db, db_message_full)
     return db_message_full
 
 
@@ -139,10 +177,9 @@ def get_sms_inbox(
     limit: int = 50,
     client_id: Optional[int] = None,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
-    crud.reconcile_pending_sms_client_matches(db)
     return crud.get_awaiting_sms(db, skip=skip, limit=limit, client_id=client_id)
 
 
@@ -151,10 +188,9 @@ def get_sms_inbox_threads(
     skip: int = 0,
     limit: int = 100,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
-    crud.reconcile_pending_sms_client_matches(db)
     return crud.get_sms_inbox_threads(db, skip=skip, limit=limit)
 
 
@@ -163,12 +199,39 @@ async def assign_sms_inbox_message(
     sms_id: int,
     payload: schemas.AssignSMSPayload,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     return await _assign_inbox_sms(db, sms_id, payload, current_user)
 
 
+@router.post("/sms/inbox/assign", response_model=List[schemas.Message])
+def bulk_assign_sms_inbox_messages(
+    payload: schemas.BulkAssignSMSPayload,
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """
+    Assigns many inbox SMS in one transaction (all or nothing). Each case room gets a
+    single {"type": "messages"} frame and each member one coalesced unread event.
+    """
+    require_role(current_user, PERSONNEL_ROLES)
+    messages = crud.assign_awaiting_sms_bulk(
+        db,
+        [(item.sms_id, item.case_id) for item in payload.assignments],
+        assigned_by_user_id=current_user.id,
+    )
+
+    serialized = [schemas.Message.from_orm(message) for message in messages]
+    by_room: dict[str, list] = {}
+    for message in serialized:
+        by_room.setdefault(f"case_{message.case_id}", []).append(message.model_dump(mode="json"))
+    for room, room_messages in by_room.items():
+        manager.broadcast_threadsafe(json.dumps({"type": "messages", "messages": room_messages}), room)
+    publish_messages_created(db, messages)
+    return serialized
+
+
 # Legacy aliases kept for backward compatibility
 @router.get("/api/awaiting-sms", response_model=List[schemas.AwaitingSMS])
 def get_awaiting_sms_route(
@@ -176,7 +239,7 @@ def get_awaiting_sms_route(
     limit: int = 20,
     client_id: Optional[int] = None,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     return get_sms_inbox(
         skip=skip,
@@ -192,7 +255,7 @@ async def assign_awaiting_sms(
     sms_id: int,
     payload: schemas.AssignSMSPayload,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     return await _assign_inbox_sms(db, sms_id, payload, current_user)
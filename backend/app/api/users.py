@@ -3,8 +3,8 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 
 from .. import database, models, schemas, crud
-from ..deps import get_current_user
-from .utils import PERSONNEL_ROLES, require_role, require_admin_user
+from ..deps import Principal, get_current_user
+from .utils import PERSONNEL_ROLES, build_notification, require_role, require_admin_user
 
 
 router = APIRouter(tags=["users"])
@@ -17,7 +17,7 @@ SUPPORTED_ROLES = set(crud.get_supported_roles())
 def get_total_unread_count_route(
     user_id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Forbidden")
@@ -32,7 +32,7 @@ def get_total_unread_count_route(
 def get_user_notifications(
     user_id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Forbidden")
@@ -40,19 +40,10 @@ def get_user_notifications(
         raise HTTPException(status_code=400, detail="Invalid role specified.")
 
     db_notifications = crud.get_unread_message_notifications(db, user_id=current_user.id, role=current_user.role)
-    notifications_list = []
-    for message, case_title, sender_name in db_notifications:
-        snippet = (message.content[:40] + '...') if len(message.content) > 40 else message.content
-        notifications_list.append(
-            schemas.Notification(
-                message_id=message.id,
-                content_snippet=snippet,
-                timestamp=message.timestamp,
-                case_id=message.case_id,
-                case_title=case_title,
-                sender_name=sender_name,
-            )
-        )
+    notifications_list = [
+        build_notification(message, case_title, sender_name)
+        for message, case_title, sender_name in db_notifications
+    ]
     return schemas.NotificationResponse(notifications=notifications_list)
 
 
@@ -60,7 +51,7 @@ def get_user_notifications(
 def get_azure_sync_users(
     limit: int = 200,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_role(current_user, PERSONNEL_ROLES)
     return crud.get_azure_synced_users(db, limit=limit)
@@ -68,7 +59,7 @@ def get_azure_sync_users(
 
 @router.get("/roles", response_model=List[str])
 def get_supported_roles_route(
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_admin_user(current_user)
     return crud.get_supported_roles()
@@ -78,7 +69,7 @@ def get_supported_roles_route(
 def list_role_permissions_route(
     role: Optional[str] = None,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_admin_user(current_user)
     normalized_role = (role or "").strip().lower() or None
@@ -91,7 +82,7 @@ def list_role_permissions_route(
 def create_role_permission_route(
     payload: schemas.RolePermissionCreate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_admin_user(current_user)
     return crud.create_role_permission(db, role=payload.role, permission=payload.permission)
@@ -101,7 +92,7 @@ def create_role_permission_route(
 def delete_role_permission_route(
     permission_id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_admin_user(current_user)
     deleted = crud.delete_role_permission(db, permission_id=permission_id)
@@ -117,7 +108,7 @@ def list_users_route(
     skip: int = 0,
     limit: int = 200,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_admin_user(current_user)
     if role and role not in SUPPORTED_ROLES:
@@ -129,7 +120,7 @@ def list_users_route(
 def create_user_route(
     user_data: schemas.UserCreate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_admin_user(current_user)
     normalized_role = (user_data.role or "").strip().lower()
@@ -148,7 +139,7 @@ def update_user_role_route(
     user_id: int,
     role_data: schemas.UserRoleUpdate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_admin_user(current_user)
     updated_user = crud.update_user_role(
@@ -166,7 +157,7 @@ def update_user_role_route(
 def delete_user_route(
     user_id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     require_admin_user(current_user)
     if user_id == current_user.id:
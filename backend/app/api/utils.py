@@ -1,46 +1,84 @@
 from fastapi import HTTPException, Response
 from sqlalchemy.orm import Session
 
-from .. import auth, crud, models
+from .. import auth, crud, models, schemas
+from ..cache import TTLCache
 from ..config import get_settings
+from ..principals import Principal
 
 
 settings = get_settings()
+_case_access_cache = TTLCache(settings.case_access_cache_ttl_seconds)
 
 PERSONNEL_ROLES = {"lawyer", "accountant", "paralegal", "legal assistant", "admin"}
 OAUTH_STATE_COOKIE = "oauth_state"
 OAUTH_NONCE_COOKIE = "oauth_nonce"
 
 
-def require_role(user: models.User, allowed_roles: set[str]):
+def require_role(user: Principal, allowed_roles: set[str]):
     if user.role not in allowed_roles:
         raise HTTPException(status_code=403, detail="Forbidden")
 
-def require_admin_user(user: models.User):
+def require_admin_user(user: Principal):
     if user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin role required.")
 
 
-def require_permission(db: Session, user: models.User, permission: str):
+def require_permission(db: Session, user: Principal, permission: str):
     if not crud.role_has_permission(db, user.role, permission):
         raise HTTPException(status_code=403, detail="Forbidden")
 
 
-def ensure_case_access(db: Session, user: models.User, case_id: int) -> models.Case:
+def ensure_case_access(db: Session, user: Principal, case_id: int) -> None:
+    """
+    Raises 404/403 unless the user may open the case. Membership is an indexed EXISTS
+    rather than a full case load; grants are cached briefly per (user, role, case).
+    Use get_accessible_case when the endpoint needs the case itself.
+    """
+    cache_key = (user.id, user.role, case_id)
+    if _case_access_cache.get(cache_key):
+        return
+
+    if user.role == "admin":
+        allowed = crud.case_exists(db, case_id)
+        if not allowed:
+            raise HTTPException(status_code=404, detail="Case not found")
+    elif user.role == "client" or user.role in PERSONNEL_ROLES:
+        allowed = crud.is_case_member(db, case_id, user.id, user.role)
+    else:
+        allowed = False
+
+    if not allowed:
+        if not crud.case_exists(db, case_id):
+            raise HTTPException(status_code=404, detail="Case not found")
+        raise HTTPException(status_code=403, detail="Forbidden")
+    _case_access_cache.set(cache_key, True)
+
+
+def get_accessible_case(db: Session, user: Principal, case_id: int) -> models.Case:
+    ensure_case_access(db, user, case_id)
     case = crud.get_case_by_id(db, case_id)
     if not case:
         raise HTTPException(status_code=404, detail="Case not found")
-    if user.role == "admin":
-        return case
-    if user.role == "client":
-        if any(c.id == user.id for c in case.clients):
-            return case
-        raise HTTPException(status_code=403, detail="Forbidden")
-    if user.role in PERSONNEL_ROLES:
-        if any(p.id == user.id for p in case.personnel):
-            return case
-        raise HTTPException(status_code=403, detail="Forbidden")
-    raise HTTPException(status_code=403, detail="Forbidden")
+    return case
+
+
+def invalidate_case_access(case_id: int, user_id: int):
+    """Call when someone is removed from a case so this worker stops honouring their cached grant."""
+    _case_access_cache.invalidate(lambda key: key[0] == user_id and key[2] == case_id)
+
+
+def build_notification(message: models.Message, case_title: str, sender_name: str) -> schemas.Notification:
+    snippet = (message.content[:40] + '...') if len(message.content) > 40 else message.content
+    return schemas.Notification(
+        message_id=message.id,
+        content_snippet=snippet,
+        timestamp=message.timestamp,
+        case_id=message.case_id,
+        case_title=case_title,
+        sender_id=message.sender_id,
+        sender_name=sender_name,
+    )
 
 
 def set_auth_cookie(response: Response, user: models.User):
@@ -1,112 +1,404 @@
+import asyncio
+import json
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import Dict, List
 
-from .. import database, schemas, crud, auth
-from ..services.sms import send_sms
+from .. import database, models, schemas, crud, auth
+from ..deps import Principal, get_current_user, load_principal
+from ..services.sms import sms_dispatcher
+from ..services.pubsub import create_pubsub_backend
 from ..config import get_settings
-from .utils import ensure_case_access
+from .utils import build_notification, ensure_case_access, require_admin_user
 
 
 router = APIRouter(tags=["ws"])
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Sync SQLAlchemy work for sockets runs here so a slow query never stalls the event loop.
+_db_executor = ThreadPoolExecutor(max_workers=settings.ws_db_workers, thread_name_prefix="ws-db")
+
+
+class ClientConnection:
+    """One socket in a room, with its own bounded outbound queue drained by a writer task."""
+
+    def __init__(self, websocket: WebSocket, room: str, queue_size: int):
+        self.websocket = websocket
+        self.room = room
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        self.writer: asyncio.Task | None = None
+        self.enqueued = 0
 
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+    def __init__(self, backend=None):
+        self.active_connections: Dict[str, Dict[WebSocket, ClientConnection]] = {}
+        self.backend = backend or create_pubsub_backend()
+        self.metrics: Counter[str] = Counter()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        await self.backend.start(self.deliver_local)
 
-    async def connect(self, websocket: WebSocket, room: str):
+    async def stop(self):
+        await self.backend.stop()
+
+    async def connect(self, websocket: WebSocket, room: str) -> ClientConnection:
         await websocket.accept()
-        if room not in self.active_connections:
-            self.active_connections[room] = []
-        self.active_connections[room].append(websocket)
+        connection = ClientConnection(websocket, room, settings.ws_send_queue_size)
+        connection.writer = asyncio.create_task(self._write_loop(connection))
+        self.active_connections.setdefault(room, {})[websocket] = connection
+        self.metrics["connections_opened"] += 1
+        return connection
 
     def disconnect(self, websocket: WebSocket, room: str):
-        if room in self.active_connections:
-            self.active_connections[room].remove(websocket)
+        connection = self._remove(websocket, room)
+        if connection and connection.writer and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+
+    def _remove(self, websocket: WebSocket, room: str) -> ClientConnection | None:
+        room_connections = self.active_connections.get(room)
+        if not room_connections:
+            return None
+        connection = room_connections.pop(websocket, None)
+        if not room_connections:
+            del self.active_connections[room]
+        return connection
+
+    def _enqueue(self, connection: ClientConnection, message: str):
+        try:
+            connection.queue.put_nowait(message)
+            connection.enqueued += 1
+        except asyncio.QueueFull:
+            self._evict(connection, "queue_full")
+
+    def _evict(self, connection: ClientConnection, reason: str):
+        if self._remove(connection.websocket, connection.room) is None:
+            return
+        self.metrics[f"evicted_{reason}"] += 1
+        logger.warning("Dropping slow WebSocket client in %s (%s)", connection.room, reason)
+        if connection.writer and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
+        asyncio.create_task(self._close(connection.websocket))
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=1013), settings.ws_send_timeout_seconds)
+        except Exception:
+            pass
+
+    async def _write_loop(self, connection: ClientConnection):
+        while True:
+            message = await connection.queue.get()
+            try:
+                await asyncio.wait_for(
+                    connection.websocket.send_text(message),
+                    settings.ws_send_timeout_seconds,
+                )
+            except asyncio.TimeoutError:
+                self._evict(connection, "send_timeout")
+                return
+            except Exception:
+                self._evict(connection, "send_error")
+                return
+            self.metrics["messages_sent"] += 1
+
+    async def send_personal(self, websocket: WebSocket, room: str, message: str):
+        connection = self.active_connections.get(room, {}).get(websocket)
+        if connection:
+            self._enqueue(connection, message)
+
+    async def deliver_local(self, room: str, message: str):
+        # Enqueueing never blocks, so one stalled socket cannot hold up the rest of the room.
+        for connection in list(self.active_connections.get(room, {}).values()):
+            self._enqueue(connection, message)
 
     async def broadcast(self, message: str, room: str):
-        if room in self.active_connections:
-            for connection in self.active_connections[room]:
-                await connection.send_text(message)
+        # Sockets on this worker get the message directly; the backend relays it to other workers.
+        await self.deliver_local(room, message)
+        await self.backend.publish(room, message)
+
+    def broadcast_threadsafe(self, message: str, room: str):
+        """Schedules a broadcast from sync code (threadpool routes, ws-db jobs) without waiting for it."""
+        if self._loop is None or self._loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self.broadcast(message, room), self._loop)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "rooms": len(self.active_connections),
+            "connections": sum(len(room) for room in self.active_connections.values()),
+            "queued_messages": sum(
+                connection.queue.qsize()
+                for room in self.active_connections.values()
+                for connection in room.values()
+            ),
+            "counters": dict(self.metrics),
+        }
 
 
 manager = ConnectionManager()
 
 
-def get_ws_db():
+@router.get("/admin/realtime/stats")
+def get_realtime_stats(current_user: Principal = Depends(get_current_user)):
+    require_admin_user(current_user)
+    return manager.stats()
+
+
+# Re-reads of the connect snapshot while deltas keep arriving, before sending the latest anyway.
+USER_SNAPSHOT_ATTEMPTS = 3
+
+
+def user_room(user_id: int) -> str:
+    return f"user_{user_id}"
+
+
+def publish_message_created(db: Session, message: models.Message):
+    """Pushes an unread bump and a notification to every case member except the sender."""
+    sender_name = message.sender_user.name if message.sender_user else ""
+    notification = build_notification(message, message.case.title, sender_name)
+    event = json.dumps({
+        "type": "message_created",
+        "case_id": message.case_id,
+        "unread_delta": 1,
+        "notification": notification.model_dump(mode="json"),
+    })
+    for member_id in crud.get_case_member_ids(db, message.case_id):
+        if member_id != message.sender_id:
+            manager.broadcast_threadsafe(event, user_room(member_id))
+
+
+def publish_messages_created(db: Session, messages: List[models.Message]):
+    """
+    Coalesced publish_message_created for a batch: one event per case and member, with
+    the member's unread delta for the whole batch and the newest message as notification.
+    """
+    by_case: dict[int, List[models.Message]] = {}
+    for message in messages:
+        by_case.setdefault(message.case_id, []).append(message)
+    for case_id, case_messages in by_case.items():
+        for member_id in crud.get_case_member_ids(db, case_id):
+            received = [message for message in case_messages if message.sender_id != member_id]
+            if not received:
+                continue
+            latest = max(received, key=lambda message: message.id)
+            sender_name = latest.sender_user.name if latest.sender_user else ""
+            event = json.dumps({
+                "type": "message_created",
+                "case_id": case_id,
+                "unread_delta": len(received),
+                "notification": build_notification(latest, latest.case.title, sender_name).model_dump(mode="json"),
+            })
+            manager.broadcast_threadsafe(event, user_room(member_id))
+
+
+def publish_case_read(case_id: int, reader_id: int, cleared: int):
+    """Read state is per reader, so only the reader's own sockets hear about it."""
+    if not cleared:
+        return
+    manager.broadcast_threadsafe(
+        json.dumps({
+            "type": "case_read",
+            "case_id": case_id,
+            "reader_id": reader_id,
+            "unread_delta": -cleared,
+        }),
+        user_room(reader_id),
+    )
+
+
+def publish_membership_changed(user_id: int):
+    """Adding or removing someone from a case changes their totals wholesale; let them refetch."""
+    manager.broadcast_threadsafe(json.dumps({"type": "resync"}), user_room(user_id))
+
+
+def _user_snapshot(user_id: int) -> str | None:
     db = database.SessionLocal()
     try:
-        yield db
+        user = crud.get_user_by_id(db, user_id)
+        if not user:
+            return None
+        total = crud.get_total_unread_count(db, user_id=user.id, role=user.role)
+        notifications = [
+            build_notification(message, case_title, sender_name).model_dump(mode="json")
+            for message, case_title, sender_name in crud.get_unread_message_notifications(db, user_id=user.id, role=user.role)
+        ]
+        return json.dumps({"type": "snapshot", "total_unread_count": total, "notifications": notifications})
     finally:
         db.close()
 
 
-@router.websocket("/ws/{case_id}")
-async def websocket_endpoint(
-    websocket: WebSocket,
-    case_id: int,
-    db: Session = Depends(get_ws_db),
-):
+def _authorize_socket(user_id: int, token: str, case_id: int) -> bool:
+    db = database.SessionLocal()
+    try:
+        principal = load_principal(db, user_id, token)
+        if not principal:
+            return False
+        ensure_case_access(db, principal, case_id)
+        return True
+    except HTTPException:
+        return False
+    finally:
+        db.close()
+
+
+def _ingest_message(case_id: int, sender_id: int, content: str) -> tuple[str | None, bool]:
+    """Stores a chat message, queues the client SMS for lawyer messages, and returns (broadcast payload, SMS queued)."""
+    db = database.SessionLocal()
+    try:
+        message_schema = schemas.MessageCreate(
+            content=content,
+            case_id=case_id,
+            sender_id=sender_id,
+            channel="portal",
+        )
+        # The message and the client SMS are committed together, so a stored lawyer
+        # message always has its SMS queued.
+        db_message = crud.add_message(db, message=message_schema)
+        sms_queued = False
+        sender = crud.get_user_by_id(db, sender_id)
+        if sender and sender.role == "lawyer":
+            case = crud.get_case_by_id(db, case_id)
+            primary_client = case.clients[0] if case.clients else None
+            if (
+                primary_client
+                and primary_client.client_profile
+                and primary_client.client_profile.phone
+            ):
+                client_phone = primary_client.client_profile.phone
+                sms_body = f"Message regarding '{case.title}':\n{content}"
+                crud.add_outbound_sms(db, client_phone, sms_body, case_id=case_id)
+                sms_queued = True
+        db.commit()
+
+        db_message_full = crud.get_message_by_id(db, db_message.id)
+        if not db_message_full:
+            return None, sms_queued
+        publish_message_created(db, db_message_full)
+        broadcast_data = schemas.Message.from_orm(db_message_full).model_dump_json()
+        return broadcast_data, sms_queued
+    finally:
+        db.close()
+
+
+def _replay_messages(case_id: int, since_id: int, limit: int) -> list[str]:
+    db = database.SessionLocal()
+    try:
+        return [
+            schemas.Message.from_orm(message).model_dump_json()
+            for message in crud.get_case_messages(db, case_id=case_id, after_id=since_id, limit=limit)
+        ]
+    finally:
+        db.close()
+
+
+async def _run_db(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, func, *args)
+
+
+def _socket_user_id(websocket: WebSocket) -> int | None:
     token = websocket.cookies.get(settings.auth_cookie_name)
     if not token:
-        await websocket.close(code=1008)
-        return
-
+        return None
     try:
         payload = auth.decode_access_token(token)
-        user_id = int(payload.get("sub"))
+        return int(payload.get("sub"))
     except Exception:
+        return None
+
+
+@router.websocket("/ws/user")
+async def user_events_endpoint(websocket: WebSocket):
+    """
+    Per-user push channel: a snapshot of unread totals and notifications on connect,
+    then message_created / case_read / resync events instead of client-side polling.
+    """
+    user_id = _socket_user_id(websocket)
+    if user_id is None:
         await websocket.close(code=1008)
         return
 
-    user = crud.get_user_by_id(db, user_id)
-    if not user:
+    # Joined before the snapshot is read so no delta published meanwhile is missed.
+    # Deltas queued ahead of the snapshot are superseded by it; if any arrived while it
+    # was being read, it is read again so it is at least as new as all of them.
+    room = user_room(user_id)
+    connection = await manager.connect(websocket, room)
+    for _ in range(USER_SNAPSHOT_ATTEMPTS):
+        seen = connection.enqueued
+        snapshot = await _run_db(_user_snapshot, user_id)
+        if snapshot is None or connection.enqueued == seen:
+            break
+    if snapshot is None:
+        manager.disconnect(websocket, room)
         await websocket.close(code=1008)
         return
-
+    await manager.send_personal(websocket, room, snapshot)
     try:
-        ensure_case_access(db, user, case_id)
-    except HTTPException:
+        while True:
+            # Nothing is expected from the client; reading just surfaces the disconnect.
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        manager.disconnect(websocket, room)
+    except Exception:
+        manager.disconnect(websocket, room)
+
+
+@router.websocket("/ws/{case_id}")
+async def websocket_endpoint(
+    websocket: WebSocket,
+    case_id: int,
+    since: int | None = None,
+):
+    """
+    Case chat socket. With `since=<last message id>` the messages the client missed are
+    replayed right after connect (or a resync frame if there are more than WS_REPLAY_LIMIT,
+    in which case the client should page through /cases/{id}/messages?after_id=...).
+    """
+    user_id = _socket_user_id(websocket)
+    if user_id is None:
+        await websocket.close(code=1008)
+        return
+
+    token = websocket.cookies.get(settings.auth_cookie_name)
+    if not await _run_db(_authorize_socket, user_id, token, case_id):
         await websocket.close(code=1008)
         return
     room = f"case_{case_id}"
     await manager.connect(websocket, room)
 
+    if since is not None:
+        # Joined the room first so nothing falls between the replay and live traffic;
+        # a message can arrive twice, so clients dedupe by id.
+        backlog = await _run_db(_replay_messages, case_id, since, settings.ws_replay_limit + 1)
+        if len(backlog) > settings.ws_replay_limit:
+            await manager.send_personal(websocket, room, json.dumps({"type": "resync", "after_id": since}))
+        else:
+            for message in backlog:
+                await manager.send_personal(websocket, room, message)
+
     try:
         while True:
             data = await websocket.receive_json()
             sender_id = data.get("sender_id")
-            if not sender_id or int(sender_id) != user.id:
-                await websocket.send_text('{"error": "Invalid sender_id"}')
+            if not sender_id or int(sender_id) != user_id:
+                await manager.send_personal(websocket, room, '{"error": "Invalid sender_id"}')
                 continue
 
-            message_schema = schemas.MessageCreate(
-                content=data["content"],
-                case_id=case_id,
-                sender_id=sender_id,
-                channel="portal",
-            )
-            db_message_simple = crud.create_message(db, message=message_schema)
-            db_message_full = crud.get_message_by_id(db, db_message_simple.id)
-            if not db_message_full:
+            broadcast_data, sms_queued = await _run_db(_ingest_message, case_id, user_id, data["content"])
+            if not broadcast_data:
                 continue
 
-            broadcast_data = schemas.Message.from_orm(db_message_full).model_dump_json()
             await manager.broadcast(broadcast_data, room)
-
-            if db_message_full.sender_user and db_message_full.sender_user.role == "lawyer":
-                case = crud.get_case_by_id(db, case_id)
-                primary_client = case.clients[0] if case.clients else None
-                if (
-                    primary_client
-                    and primary_client.client_profile
-                    and primary_client.client_profile.phone
-                ):
-                    client_phone = primary_client.client_profile.phone
-                    sms_body = f"Message regarding '{case.title}':\n{db_message_full.content}"
-                    send_sms(to_number=client_phone, body=sms_body)
+            if sms_queued:
+                sms_dispatcher.notify()
     except WebSocketDisconnect:
         manager.disconnect(websocket, room)
     except Exception:
@@ -1,14 +1,11 @@
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import HTTPException
-import requests
 import logging
 from .config import get_settings
-
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from .services.jwks import azure_keys
+from .services.passwords import password_hasher
 
 settings = get_settings()
 SECRET_KEY = settings.secret_key
@@ -18,12 +15,13 @@ ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 logger = logging.getLogger(__name__)
 
 def hash_password(password: str) -> str:
-    """Hash a password using bcrypt"""
-    return pwd_context.hash(password)
+    """Hash a password using bcrypt (in the hashing process pool)"""
+    return password_hasher.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    """Verify a password against its hash (in the hashing process pool)"""
+    valid, _ = password_hasher.verify_and_update(plain_password, hashed_password)
+    return valid
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token"""
@@ -71,25 +69,13 @@ def verify_azure_token(token: str):
         if not issuer_tenant:
             raise HTTPException(status_code=401, detail="Tenant ID missing for token verification")
 
-        def fetch_keys(tenant_id: str):
-            jwks_url = f"https://login.microsoftonline.com/{tenant_id}/discovery/v2.0/keys"
-            logger.info("Azure token verify: tenant_id=%s jwks_url=%s", tenant_id, jwks_url)
-            response = requests.get(jwks_url, timeout=10)
-            response.raise_for_status()
-            keys = response.json().get("keys", [])
-            logger.info("Azure token verify: jwks_keys_count=%s", len(keys))
-            return keys
-
-        # 2. Pobranie kluczy publicznych Microsoftu dla Twojego tenanta
-        keys = fetch_keys(issuer_tenant)
-        
-        rsa_key = next((key for key in keys if key['kid'] == kid), None)
+        # 2. Klucze publiczne Microsoftu z cache (odświeżane w tle)
+        rsa_key = azure_keys.get_signing_key(issuer_tenant, kid)
 
         if not rsa_key:
             # Fallback do 'common' (klucze są globalne dla AAD)
             logger.warning("Azure token verify: kid not found in tenant keys, trying common")
-            keys = fetch_keys("common")
-            rsa_key = next((key for key in keys if key['kid'] == kid), None)
+            rsa_key = azure_keys.get_signing_key("common", kid)
         
         if not rsa_key:
             raise HTTPException(status_code=401, detail="Public key not found")
@@ -101,7 +87,7 @@ def verify_azure_token(token: str):
             rsa_key,
             algorithms=['RS256'],
             audience=client_id,
-            issuer=f"https://login.microsoftonline.com/{issuer_tenant}/v2.0"
+            issuer=f"{settings.azure_authority_host.rstrip('/')}/{issuer_tenant}/v2.0"
         )
         
         return payload # Zawiera 'name', 'preferred_username' (email), 'oid'
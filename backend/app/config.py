@@ -27,11 +27,27 @@ class Settings:
         self.secret_key = _get_env("SECRET_KEY", required=True)
         self.jwt_algorithm = _get_env("JWT_ALGORITHM", "HS256")
         self.access_token_expire_minutes = int(_get_env("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+        # Password hashing (bcrypt in a process pool; hashes at another cost are upgraded on login)
+        self.bcrypt_rounds = int(_get_env("BCRYPT_ROUNDS", "12"))
+        self.password_hash_workers = int(_get_env("PASSWORD_HASH_WORKERS", "2"))
+        self.password_hash_max_pending = int(_get_env("PASSWORD_HASH_MAX_PENDING", "64"))
+        self.password_hash_queue_timeout_seconds = float(_get_env("PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS", "10"))
 
         # Azure AD
         self.azure_client_id = _get_env("AZURE_CLIENT_ID", required=True)
         self.azure_tenant_id = _get_env("AZURE_TENANT_ID", required=True)
         self.azure_client_secret = _get_env("AZURE_CLIENT_SECRET", required=True)
+        self.azure_authority_host = _get_env("AZURE_AUTHORITY_HOST", "https://login.microsoftonline.com")
+        # Signing keys: TTL when the JWKS response has no Cache-Control max-age, and the
+        # minimum gap between refetches (unknown kid, failed refresh).
+        self.jwks_cache_ttl_seconds = float(_get_env("JWKS_CACHE_TTL_SECONDS", "3600"))
+        self.jwks_min_refetch_seconds = float(_get_env("JWKS_MIN_REFETCH_SECONDS", "300"))
+        # Microsoft Graph group lookups at login
+        self.azure_group_sync_ttl_seconds = float(_get_env("AZURE_GROUP_SYNC_TTL_SECONDS", "900"))
+        self.graph_timeout_seconds = float(_get_env("GRAPH_TIMEOUT_SECONDS", "10"))
+        self.graph_pool_size = int(_get_env("GRAPH_POOL_SIZE", "10"))
+        self.graph_breaker_failures = int(_get_env("GRAPH_BREAKER_FAILURES", "5"))
+        self.graph_breaker_reset_seconds = float(_get_env("GRAPH_BREAKER_RESET_SECONDS", "30"))
         self.backend_base_url = _get_env("BACKEND_BASE_URL", "http://localhost:8002")
         self.azure_redirect_uri = _get_env(
             "AZURE_REDIRECT_URI",
@@ -71,8 +87,64 @@ class Settings:
         self.twilio_account_sid = _get_env("TWILIO_ACCOUNT_SID")
         self.twilio_auth_token = _get_env("TWILIO_AUTH_TOKEN")
         self.twilio_phone_number = _get_env("TWILIO_PHONE_NUMBER")
+        # Country code assumed for bare 10-digit client numbers when matching inbound SMS.
+        self.default_phone_country_code = (_get_env("DEFAULT_PHONE_COUNTRY_CODE", "1") or "").strip().lstrip("+")
         twilio_validate_signature = (_get_env("TWILIO_VALIDATE_SIGNATURE", "true") or "true").strip().lower()
         self.twilio_validate_signature = twilio_validate_signature in {"1", "true", "yes", "on"}
+        # Outbound SMS queue (outbound_sms table). TWILIO_API_BASE_URL can point at a local fake.
+        self.twilio_api_base_url = (_get_env("TWILIO_API_BASE_URL", "https://api.twilio.com") or "").rstrip("/")
+        self.twilio_status_callback_url = _get_env("TWILIO_STATUS_CALLBACK_URL")
+        self.sms_dispatch_workers = int(_get_env("SMS_DISPATCH_WORKERS", "2"))
+        self.sms_batch_size = int(_get_env("SMS_BATCH_SIZE", "20"))
+        self.sms_poll_interval_seconds = float(_get_env("SMS_POLL_INTERVAL_SECONDS", "2"))
+        # Twilio long codes accept about one message per second each; messages queue behind this.
+        self.sms_rate_per_number = float(_get_env("SMS_RATE_PER_NUMBER", "1"))
+        self.sms_max_attempts = int(_get_env("SMS_MAX_ATTEMPTS", "5"))
+        self.sms_retry_base_seconds = float(_get_env("SMS_RETRY_BASE_SECONDS", "5"))
+        self.sms_send_timeout_seconds = float(_get_env("SMS_SEND_TIMEOUT_SECONDS", "10"))
+        self.sms_reconcile_interval_seconds = float(_get_env("SMS_RECONCILE_INTERVAL_SECONDS", "60"))
+        # Inbound webhooks are acknowledged once appended to this write-ahead log; a batch
+        # writer moves them to awaiting_sms. Without fsync the log survives process crashes
+        # but not power loss.
+        self.sms_webhook_wal_dir = _get_env("SMS_WEBHOOK_WAL_DIR", "data/sms_webhook_wal")
+        sms_webhook_wal_fsync = (_get_env("SMS_WEBHOOK_WAL_FSYNC", "false") or "false").strip().lower()
+        self.sms_webhook_wal_fsync = sms_webhook_wal_fsync in {"1", "true", "yes", "on"}
+        self.sms_webhook_flush_seconds = float(_get_env("SMS_WEBHOOK_FLUSH_SECONDS", "0.2"))
+        self.sms_webhook_batch_size = int(_get_env("SMS_WEBHOOK_BATCH_SIZE", "200"))
+
+        # Document storage. Uploads are received under UPLOAD_DIRECTORY on local disk, then
+        # handed to the backend: "local" keeps them there, "azure" moves them to a Blob
+        # Storage container (AZURE_STORAGE_ENDPOINT can point at the Azurite emulator).
+        self.upload_directory = _get_env("UPLOAD_DIRECTORY", "uploads")
+        self.storage_backend = (_get_env("STORAGE_BACKEND", "local") or "local").strip().lower()
+        self.azure_storage_account = _get_env("AZURE_STORAGE_ACCOUNT")
+        self.azure_storage_key = _get_env("AZURE_STORAGE_KEY")
+        self.azure_storage_container = _get_env("AZURE_STORAGE_CONTAINER", "documents")
+        self.azure_storage_endpoint = _get_env("AZURE_STORAGE_ENDPOINT")
+        self.storage_timeout_seconds = float(_get_env("STORAGE_TIMEOUT_SECONDS", "30"))
+        # Downloads redirect to a presigned URL valid this long, when the backend supports it.
+        self.storage_presign_seconds = int(_get_env("STORAGE_PRESIGN_SECONDS", "300"))
+        storage_redirect_downloads = (_get_env("STORAGE_REDIRECT_DOWNLOADS", "true") or "true").strip().lower()
+        self.storage_redirect_downloads = storage_redirect_downloads in {"1", "true", "yes", "on"}
+
+        # Local-storage downloads can be handed to the reverse proxy: "x-accel-redirect"
+        # (nginx; DOWNLOAD_ACCEL_PREFIX is an `internal` location aliased to UPLOAD_DIRECTORY)
+        # or "x-sendfile" (Apache/lighttpd). Empty serves the file from the app.
+        self.download_offload = (_get_env("DOWNLOAD_OFFLOAD", "") or "").strip().lower()
+        self.download_accel_prefix = (_get_env("DOWNLOAD_ACCEL_PREFIX", "/protected-uploads") or "").rstrip("/")
+
+        # Realtime fan-out ("memory" for a single worker, "postgres" for LISTEN/NOTIFY across workers)
+        self.realtime_backend = (_get_env("REALTIME_BACKEND", "memory") or "memory").strip().lower()
+        self.realtime_channel = _get_env("REALTIME_CHANNEL", "client_portal_realtime")
+        self.ws_send_queue_size = int(_get_env("WS_SEND_QUEUE_SIZE", "100"))
+        self.ws_send_timeout_seconds = float(_get_env("WS_SEND_TIMEOUT_SECONDS", "10"))
+        self.ws_db_workers = int(_get_env("WS_DB_WORKERS", "8"))
+        self.ws_replay_limit = int(_get_env("WS_REPLAY_LIMIT", "50"))
+
+        # In-process caches (per worker; the TTL bounds staleness across workers)
+        self.case_access_cache_ttl_seconds = float(_get_env("CASE_ACCESS_CACHE_TTL_SECONDS", "30"))
+        self.principal_cache_ttl_seconds = float(_get_env("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+        self.permission_version_check_seconds = float(_get_env("PERMISSION_VERSION_CHECK_SECONDS", "5"))
 
         # URLs / CORS
         self.client_base_url = _get_env("CLIENT_BASE_URL", "http://localhost:5173")
@@ -1,16 +1,28 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import update, func, and_, or_, select
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import event, insert, update, delete, exists, func, and_, or_, select, true, false, case as sql_case
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from . import models, schemas, auth
+from . import permissions
+from .phone import normalize_phone, phone_e164, phone_last10
+from .principals import invalidate_principal
+from .services.blobs import blob_key, hash_file, local_upload_path, place_blob, remove_file
+from .services.storage import document_storage
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Any, List, Tuple
+import os
 import random
 import string
 import secrets 
 import json
 import hashlib
+import logging
 from fastapi import HTTPException # Import HTTPException for use in CRUD functions
 
 
+logger = logging.getLogger(__name__)
+
+
 PERSONNEL_ROLES = ('lawyer', 'accountant', 'paralegal', 'legal assistant')
 STAFF_ROLES = PERSONNEL_ROLES + ('admin',)
 VALID_USER_ROLES = ('client',) + STAFF_ROLES
@@ -71,33 +83,35 @@ def _coerce_utc(value: datetime) -> datetime:
     return value.astimezone(timezone.utc)
 
 
-def _normalize_phone_value(phone: Optional[str]) -> Optional[str]:
-    value = (phone or "").strip()
-    if not value:
-        return None
-    has_plus_prefix = value.startswith("+")
-    digits = "".join(char for char in value if char.isdigit())
-    if not digits:
-        return None
-    if has_plus_prefix:
-        return f"+{digits}"
-    return digits
+def _upsert_insert(db: Session, model):
+    """INSERT construct supporting on_conflict_do_update; both supported databases (PostgreSQL, SQLite) implement it."""
+    insert_fn = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    return insert_fn(model)
 
 
-def _phones_match(phone_a: Optional[str], phone_b: Optional[str]) -> bool:
-    normalized_a = _normalize_phone_value(phone_a)
-    normalized_b = _normalize_phone_value(phone_b)
-    if not normalized_a or not normalized_b:
-        return False
-    if normalized_a == normalized_b:
-        return True
-    digits_a = normalized_a.lstrip("+")
-    digits_b = normalized_b.lstrip("+")
-    if digits_a == digits_b:
-        return True
-    if len(digits_a) >= 10 and len(digits_b) >= 10 and digits_a[-10:] == digits_b[-10:]:
-        return True
-    return False
+def get_sync_marker(db: Session, name: str) -> int:
+    value = db.query(models.SyncMarker.value).filter(models.SyncMarker.name == name).scalar()
+    return int(value or 0)
+
+
+def set_sync_marker(db: Session, name: str, value: int) -> None:
+    """Stores a watermark inside the caller's transaction (commit is left to the caller)."""
+    stmt = _upsert_insert(db, models.SyncMarker).values(name=name, value=value, updated_at=_utc_now())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.SyncMarker.name],
+        set_={"value": stmt.excluded.value, "updated_at": stmt.excluded.updated_at},
+    )
+    db.execute(stmt)
+
+
+def bump_sync_marker(db: Session, name: str) -> None:
+    """Increments a version stamp inside the caller's transaction (commit is left to the caller)."""
+    stmt = _upsert_insert(db, models.SyncMarker).values(name=name, value=1, updated_at=_utc_now())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.SyncMarker.name],
+        set_={"value": models.SyncMarker.value + 1, "updated_at": stmt.excluded.updated_at},
+    )
+    db.execute(stmt)
 
 
 # =========================================================================
@@ -146,28 +160,34 @@ def get_user_by_aad(db: Session, aad_id: str) -> Optional[models.User]:
              .first()
 
 def get_user_by_phone(db: Session, phone_number: str) -> Optional[models.User]:
-    """Retrieves a user based on the phone number in the client profile."""
-    raw_phone = (phone_number or "").strip()
-    normalized_phone = _normalize_phone_value(raw_phone)
-
-    exact_candidates = [candidate for candidate in {raw_phone, normalized_phone} if candidate]
-    profile = None
-    if exact_candidates:
-        profile = (
-            db.query(models.ClientProfile)
-            .filter(models.ClientProfile.phone.in_(exact_candidates))
-            .first()
+    """
+    Retrieves a user based on the phone number in the client profile: an exact E.164
+    match wins, otherwise the last ten digits (numbers stored without a country code).
+    Both keys are indexed, so this is a single query at any client count.
+    """
+    e164 = phone_e164(phone_number)
+    last10 = phone_last10(phone_number)
+    conditions = []
+    if e164:
+        conditions.append(models.ClientProfile.phone_e164 == e164)
+    if last10:
+        conditions.append(models.ClientProfile.phone_last10 == last10)
+    if not conditions:
+        return None
+    return (
+        db.query(models.User)
+        .join(models.ClientProfile, models.ClientProfile.user_id == models.User.id)
+        .options(
+            joinedload(models.User.lawyer_profile),
+            joinedload(models.User.client_profile),
         )
-    if not profile and normalized_phone:
-        # Backward-compatible fallback for legacy formatted phone numbers.
-        all_profiles = db.query(models.ClientProfile).filter(models.ClientProfile.phone.isnot(None)).all()
-        profile = next(
-            (candidate for candidate in all_profiles if _phones_match(candidate.phone, normalized_phone)),
-            None,
+        .filter(or_(*conditions))
+        .order_by(
+            sql_case((models.ClientProfile.phone_e164 == e164, 0), else_=1),
+            models.User.id.asc(),
         )
-    if profile:
-        return get_user_by_id(db, profile.user_id)
-    return None
+        .first()
+    )
 
 def create_user(db: Session, user_data: schemas.UserCreate) -> models.User:
     """
@@ -203,7 +223,7 @@ def create_user(db: Session, user_data: schemas.UserCreate) -> models.User:
              db_profile.aad_id = profile_data["aad_id"]
 
     elif user_data.role == 'client':
-        normalized_phone = _normalize_phone_value(profile_data.get("phone"))
+        normalized_phone = normalize_phone(profile_data.get("phone"))
         db_profile = models.ClientProfile(
             user_id=db_user.id,
             phone=normalized_phone,
@@ -214,6 +234,8 @@ def create_user(db: Session, user_data: schemas.UserCreate) -> models.User:
 
     if db_profile:
         db.add(db_profile)
+    if user_data.role == 'client' and normalized_phone:
+        link_pending_sms_to_client(db, db_user.id, normalized_phone)
         
     db.commit()
     db.refresh(db_user)
@@ -262,7 +284,9 @@ def upsert_azure_user(
 
     if user:
         user.email = email or user.email
-        user.name = name or user.name
+        if name and name != user.name:
+            user.name = name
+            rename_sms_threads(db, user.id, name)
         if resolved_role:
             user.role = resolved_role
             user.effective_role_source = role_source or "azure_group_map"
@@ -272,6 +296,7 @@ def upsert_azure_user(
         user.last_azure_sync_at = now
         _ensure_profile_for_role(db, user, aad_object_id)
         db.commit()
+        invalidate_principal(user.id)
         db.refresh(user)
         return get_user_by_id(db, user.id)
 
@@ -298,13 +323,20 @@ def upsert_azure_user(
     )
     return create_user(db, user_data)
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[models.User]:
-    """Authenticates any user type based on email and password."""
-    user = get_user_by_email(db, email)
-    if not user:
-        return None
-    if not auth.verify_password(password, user.hashed_password):
-        return None
+def record_local_login(db: Session, user: models.User, new_hash: Optional[str] = None) -> models.User:
+    """
+    Bookkeeping after a verified email/password login (the check itself is
+    password_hasher.verify_and_update_async, awaited by the route).
+    """
+    if new_hash:
+        # Stored with an older bcrypt cost; upgrade it while we have the plain password.
+        user.hashed_password = new_hash
+    if not user.auth_provider:
+        user.auth_provider = "local"
+    if not user.effective_role_source:
+        user.effective_role_source = "local"
+    db.commit()
+    db.refresh(user)
     return user
 
 # =========================================================================
@@ -368,11 +400,47 @@ def get_supported_roles() -> List[str]:
     return list(VALID_USER_ROLES)
 
 
-def get_role_permissions(db: Session, role: Optional[str] = None) -> List[models.RolePermission]:
-    query = db.query(models.RolePermission)
-    if role:
-        query = query.filter(models.RolePermission.role == role)
-    return query.order_by(models.RolePermission.role.asc(), models.RolePermission.permission.asc()).all()
+def _load_permission_snapshot(db: Session, version: Optional[int] = None) -> permissions.PermissionSnapshot:
+    if version is None:
+        version = get_sync_marker(db, permissions.ROLE_PERMISSIONS_MARKER)
+    rows = (
+        db.query(models.RolePermission)
+        .order_by(models.RolePermission.role.asc(), models.RolePermission.permission.asc())
+        .all()
+    )
+    snapshot = permissions.PermissionSnapshot(
+        version=version,
+        entries=tuple(
+            permissions.RolePermissionEntry(
+                id=row.id, role=row.role, permission=row.permission, created_at=row.created_at
+            )
+            for row in rows
+        ),
+    )
+    permissions.store_snapshot(snapshot)
+    return snapshot
+
+
+def get_permission_snapshot(db: Session) -> permissions.PermissionSnapshot:
+    """
+    The in-memory role -> permission matrix. Between version checks it costs no queries;
+    a check is one sync_markers lookup, and the table is only reloaded when the
+    version moved (another worker added or removed a permission).
+    """
+    snapshot = permissions.current_snapshot()
+    if snapshot is not None:
+        return snapshot
+
+    version = get_sync_marker(db, permissions.ROLE_PERMISSIONS_MARKER)
+    loaded = permissions.loaded_snapshot()
+    if loaded is not None and loaded.version == version:
+        permissions.store_snapshot(loaded)
+        return loaded
+    return _load_permission_snapshot(db, version)
+
+
+def get_role_permissions(db: Session, role: Optional[str] = None) -> List[permissions.RolePermissionEntry]:
+    return get_permission_snapshot(db).for_role(role)
 
 
 def role_has_permission(db: Session, role: str, permission: str) -> bool:
@@ -380,15 +448,7 @@ def role_has_permission(db: Session, role: str, permission: str) -> bool:
     normalized_permission = (permission or "").strip().lower()
     if not normalized_role or not normalized_permission:
         return False
-    return (
-        db.query(models.RolePermission.id)
-        .filter(
-            models.RolePermission.role == normalized_role,
-            models.RolePermission.permission == normalized_permission,
-        )
-        .first()
-        is not None
-    )
+    return get_permission_snapshot(db).allows(normalized_role, normalized_permission)
 
 
 def create_role_permission(
@@ -416,8 +476,10 @@ def create_role_permission(
 
     record = models.RolePermission(role=normalized_role, permission=normalized_permission)
     db.add(record)
+    bump_sync_marker(db, permissions.ROLE_PERMISSIONS_MARKER)
     db.commit()
     db.refresh(record)
+    _load_permission_snapshot(db)
     return record
 
 
@@ -426,7 +488,9 @@ def delete_role_permission(db: Session, permission_id: int) -> bool:
     if not record:
         return False
     db.delete(record)
+    bump_sync_marker(db, permissions.ROLE_PERMISSIONS_MARKER)
     db.commit()
+    _load_permission_snapshot(db)
     return True
 
 
@@ -623,6 +687,7 @@ def update_user_role(
     user.effective_role_source = "manual_admin"
     _ensure_profile_for_role(db, user, user.aad_object_id)
     db.commit()
+    invalidate_principal(user.id)
     db.refresh(user)
     return get_user_by_id(db, user.id)
 
@@ -631,9 +696,18 @@ def update_user_role(
 # 3. CASE CRUD (UPDATED FOR M2M)
 # =========================================================================
 
+# Collections are selectin-loaded (one extra query per collection for the whole result set)
+# so case lists don't multiply rows; both profiles are loaded because schemas.User
+# serializes both and would otherwise lazy-load them per user.
 comprehensive_case_load = [
-    joinedload(models.Case.clients).joinedload(models.User.client_profile),
-    joinedload(models.Case.personnel).joinedload(models.User.lawyer_profile)
+    selectinload(models.Case.clients).options(
+        joinedload(models.User.client_profile),
+        joinedload(models.User.lawyer_profile),
+    ),
+    selectinload(models.Case.personnel).options(
+        joinedload(models.User.lawyer_profile),
+        joinedload(models.User.client_profile),
+    ),
 ]
 
 def _get_user_case_association(role: str):
@@ -662,6 +736,40 @@ def get_case_client_roles_map(db: Session, case_id: int) -> dict[int, str]:
     )
     return {client_id: role_type for client_id, role_type in rows}
 
+
+def get_case_client_roles_maps(db: Session, case_ids: List[int]) -> dict[int, dict[int, str]]:
+    """Batched get_case_client_roles_map: {case_id: {client_id: role_type}} in one query."""
+    roles: dict[int, dict[int, str]] = {case_id: {} for case_id in case_ids}
+    if not case_ids:
+        return roles
+    rows = (
+        db.query(
+            models.case_client_association.c.case_id,
+            models.case_client_association.c.client_id,
+            models.case_client_association.c.role_type,
+        )
+        .filter(models.case_client_association.c.case_id.in_(case_ids))
+        .all()
+    )
+    for case_id, client_id, role_type in rows:
+        roles[case_id][client_id] = role_type
+    return roles
+
+def case_exists(db: Session, case_id: int) -> bool:
+    return db.query(exists().where(models.Case.id == case_id)).scalar()
+
+def is_case_member(db: Session, case_id: int, user_id: int, role: str) -> bool:
+    """Single EXISTS probe on the association table's (case_id, user_id) primary key."""
+    association_table, user_id_column = _get_user_case_association(role)
+    if association_table is None:
+        return False
+    return db.query(
+        exists().where(
+            association_table.c.case_id == case_id,
+            user_id_column == user_id,
+        )
+    ).scalar()
+
 def get_case_by_id(db: Session, case_id: int) -> Optional[models.Case]:
     """Retrieves a single case with full data loading."""
     return db.query(models.Case)\
@@ -688,29 +796,20 @@ def get_lawyer_cases(db: Session, lawyer_id: int) -> List[Tuple[models.Case, int
         user_id_column == lawyer_id
     ).subquery()
     
-    # 2. Subquery to count unread messages in those cases
-    unread_subquery = (
-        db.query(
-            models.Message.case_id,
-            func.count(models.Message.id).label("unread_count")
-        )
-        .filter(
-            models.Message.is_read == False,
-            models.Message.sender_id != lawyer_id,  # Count messages NOT from the lawyer
-            models.Message.case_id.in_(select(assigned_cases_subquery.c.case_id))
-        )
-        .group_by(models.Message.case_id)
-        .subquery()
-    )
-
-    # 3. Main query
+    # 2. Main query, reading unread totals from the maintained counters
     return (
         db.query(
             models.Case,
-            func.coalesce(unread_subquery.c.unread_count, 0)
+            func.coalesce(models.UnreadCounter.count, 0)
         )
         .join(assigned_cases_subquery, models.Case.id == assigned_cases_subquery.c.case_id)
-        .outerjoin(unread_subquery, models.Case.id == unread_subquery.c.case_id)
+        .outerjoin(
+            models.UnreadCounter,
+            and_(
+                models.UnreadCounter.case_id == models.Case.id,
+                models.UnreadCounter.user_id == lawyer_id,
+            ),
+        )
         .options(*comprehensive_case_load)
         .all()
     )
@@ -727,29 +826,20 @@ def get_client_cases(db: Session, client_id: int) -> List[Tuple[models.Case, int
         user_id_column == client_id
     ).subquery()
     
-    # 2. Subquery to count unread messages in those cases
-    unread_subquery = (
-        db.query(
-            models.Message.case_id,
-            func.count(models.Message.id).label("unread_count")
-        )
-        .filter(
-            models.Message.is_read == False,
-            models.Message.sender_id != client_id, # Count messages NOT from the client
-            models.Message.case_id.in_(select(assigned_cases_subquery.c.case_id))
-        )
-        .group_by(models.Message.case_id)
-        .subquery()
-    )
-
-    # 3. Main query
+    # 2. Main query, reading unread totals from the maintained counters
     return (
         db.query(
             models.Case,
-            func.coalesce(unread_subquery.c.unread_count, 0)
+            func.coalesce(models.UnreadCounter.count, 0)
         )
         .join(assigned_cases_subquery, models.Case.id == assigned_cases_subquery.c.case_id)
-        .outerjoin(unread_subquery, models.Case.id == unread_subquery.c.case_id)
+        .outerjoin(
+            models.UnreadCounter,
+            and_(
+                models.UnreadCounter.case_id == models.Case.id,
+                models.UnreadCounter.user_id == client_id,
+            ),
+        )
         .options(*comprehensive_case_load)
         .all()
     )
@@ -834,6 +924,7 @@ def create_case(db: Session, case: schemas.CaseCreate) -> models.Case:
         else:
             raise HTTPException(status_code=400, detail=f"User ID {personnel_id} is not valid personnel.")
 
+    sync_case_unread_counters(db, db_case.id)
     db.commit()
     db.refresh(db_case)
     
@@ -894,6 +985,7 @@ def add_client_to_case(
         )
         if client_user.client_profile:
             client_user.client_profile.active_cases += 1
+        sync_case_unread_counters(db, case_id)
 
     db.commit()
     return client_user
@@ -926,6 +1018,13 @@ def create_message(db: Session, message: schemas.MessageCreate) -> models.Messag
     """
     Creates a message using only the sender_id.
     """
+    db_message = add_message(db, message)
+    db.commit()
+    db.refresh(db_message)
+    return db_message
+
+def add_message(db: Session, message: schemas.MessageCreate) -> models.Message:
+    """create_message inside the caller's transaction (commit is left to the caller)."""
     db_message = models.Message(
         content=message.content,
         case_id=message.case_id,
@@ -934,8 +1033,8 @@ def create_message(db: Session, message: schemas.MessageCreate) -> models.Messag
         message_type=message.message_type # Added type
     )
     db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    db.flush()
+    _increment_unread_counters(db, db_message.case_id, db_message.sender_id)
     return db_message
 
 def get_message_by_id(db: Session, message_id: int) -> Optional[models.Message]:
@@ -952,65 +1051,145 @@ def get_message_by_id(db: Session, message_id: int) -> Optional[models.Message]:
              .filter(models.Message.id == message_id) \
              .first()
 
-def get_case_messages(db: Session, case_id: int, skip: int = 0, limit: int = 100):
-    """Retrieves messages for a case, eagerly loading sender information."""
-    return db.query(models.Message)\
-             .options(
-                 joinedload(models.Message.sender_user)
-                     .joinedload(models.User.lawyer_profile),
-                 joinedload(models.Message.sender_user)
-                     .joinedload(models.User.client_profile),
-                 joinedload(models.Message.document_request)
-                     .joinedload(models.DocumentRequest.requested_documents)
-             )\
-             .filter(models.Message.case_id == case_id)\
-             .order_by(models.Message.timestamp.asc())\
-             .offset(skip).limit(limit).all()
-             
-def mark_messages_as_read(db: Session, case_id: int, reader_id: int) -> int:
+def get_case_messages(
+    db: Session,
+    case_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    latest: bool = False,
+) -> List[models.Message]:
     """
-    Marks all unread messages in a case as read, for a specific reader.
-    Returns the number of messages updated.
+    Retrieves messages for a case in ascending id order, eagerly loading sender information.
+    `before_id` / `after_id` are keyset cursors served by the (case_id, id) index:
+    before_id returns the `limit` messages just older than it, after_id the ones just newer.
+    `latest` returns the newest `limit` messages. Without a cursor or `latest`,
+    `skip` is applied from the oldest message as before.
     """
-    
-    stmt = (
-        update(models.Message)
+    query = db.query(models.Message)\
+              .options(
+                  joinedload(models.Message.sender_user)
+                      .joinedload(models.User.lawyer_profile),
+                  joinedload(models.Message.sender_user)
+                      .joinedload(models.User.client_profile),
+                  selectinload(models.Message.document_request)
+                      .selectinload(models.DocumentRequest.requested_documents)
+              )\
+              .filter(models.Message.case_id == case_id)
+
+    if before_id is not None or (latest and after_id is None):
+        if before_id is not None:
+            query = query.filter(models.Message.id < before_id)
+        page = query.order_by(models.Message.id.desc()).limit(limit).all()
+        return list(reversed(page))
+
+    if after_id is not None:
+        query = query.filter(models.Message.id > after_id)
+    elif skip:
+        query = query.offset(skip)
+    return query.order_by(models.Message.id.asc()).limit(limit).all()
+
+def _case_read_watermark(db: Session, case_id: int, user_id: int):
+    return (
+        select(func.coalesce(models.CaseRead.last_read_message_id, 0))
         .where(
+            models.CaseRead.case_id == case_id,
+            models.CaseRead.user_id == user_id,
+        )
+        .scalar_subquery()
+    )
+
+def _upsert_case_read(db: Session, case_id: int, user_id: int, message_id: int):
+    """Moves a reader's watermark forward (never back) in a single statement."""
+    values = dict(
+        user_id=user_id,
+        case_id=case_id,
+        last_read_message_id=message_id,
+        read_at=datetime.now(timezone.utc),
+    )
+    stmt = _upsert_insert(db, models.CaseRead).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.CaseRead.user_id, models.CaseRead.case_id],
+        set_={
+            "last_read_message_id": stmt.excluded.last_read_message_id,
+            "read_at": stmt.excluded.read_at,
+        },
+        where=models.CaseRead.last_read_message_id < stmt.excluded.last_read_message_id,
+    )
+    db.execute(stmt)
+
+def mark_messages_as_read(db: Session, case_id: int, reader_id: int) -> int:
+    """
+    Marks the case as read for one reader by moving their case_reads watermark to the
+    newest message. Other members are unaffected. Returns how many messages that cleared.
+    """
+    latest_id = (
+        db.query(func.max(models.Message.id))
+        .filter(models.Message.case_id == case_id)
+        .scalar()
+    )
+    if latest_id is None:
+        return 0
+
+    # Locking the counter row serialises this with create_message's increment, so a
+    # message arriving between the count and the update below cannot be lost.
+    previous = (
+        db.query(models.UnreadCounter.count)
+        .filter(
+            models.UnreadCounter.case_id == case_id,
+            models.UnreadCounter.user_id == reader_id,
+        )
+        .with_for_update()
+        .scalar()
+    ) or 0
+
+    _upsert_case_read(db, case_id, reader_id, latest_id)
+    # Anything that arrived after latest_id was read stays unread.
+    remaining = (
+        db.query(func.count(models.Message.id))
+        .filter(
             models.Message.case_id == case_id,
-            models.Message.is_read == False,
-            models.Message.sender_id != reader_id
+            models.Message.id > _case_read_watermark(db, case_id, reader_id),
+            models.Message.sender_id != reader_id,
         )
-        .values(is_read=True)
+        .scalar()
+    )
+    db.execute(
+        update(models.UnreadCounter)
+        .where(
+            models.UnreadCounter.case_id == case_id,
+            models.UnreadCounter.user_id == reader_id,
+        )
+        .values(count=remaining)
     )
-    
-    result = db.execute(stmt)
     db.commit()
-    
-    return result.rowcount
+    return max(previous - remaining, 0)
+
+def get_case_member_ids(db: Session, case_id: int) -> set[int]:
+    """Returns the ids of every client and personnel user assigned to a case."""
+    client_ids = select(models.case_client_association.c.client_id).where(
+        models.case_client_association.c.case_id == case_id
+    )
+    personnel_ids = select(models.case_personnel_association.c.user_id).where(
+        models.case_personnel_association.c.case_id == case_id
+    )
+    return set(db.execute(client_ids.union(personnel_ids)).scalars().all())
 
 def get_total_unread_count(db: Session, user_id: int, role: str) -> int:
     """
-    Calculates the total number of unread messages for a user across all their cases.
-    (MODIFIED for M2M relationships)
+    Total number of unread messages for a user across all their cases,
+    summed from the maintained unread_counters rows.
     """
-    
-    query = db.query(func.count(models.Message.id)).join(
-        models.Case, models.Message.case_id == models.Case.id
-    ).filter(
-        models.Message.is_read == False,
-        models.Message.sender_id != user_id
-    )
-
-    # Filter cases based on the user's role using the association tables
-    association_table, user_id_column = _get_user_case_association(role)
-    if not association_table is not None:
+    association_table, _ = _get_user_case_association(role)
+    if association_table is None:
         return 0
-        
-    query = query.join(association_table, association_table.c.case_id == models.Case.id).filter(
-        user_id_column == user_id
-    )
 
-    count = query.scalar()
+    count = (
+        db.query(func.sum(models.UnreadCounter.count))
+        .filter(models.UnreadCounter.user_id == user_id)
+        .scalar()
+    )
     return count if count is not None else 0
 
 def get_unread_message_notifications(db: Session, user_id: int, role: str, limit: int = 5) -> List[Tuple[models.Message, str, str]]:
@@ -1020,16 +1199,19 @@ def get_unread_message_notifications(db: Session, user_id: int, role: str, limit
     if association_table is None or user_id_column is None:
         return []
     
-    # 2. Subquery to find the latest unread message timestamp per case, filtered by assignment
+    # 2. Subquery to find the latest message above the user's read watermark per case, filtered by assignment
     subq = (
         db.query(
             models.Message.case_id,
-            func.max(models.Message.timestamp).label("latest_timestamp")
+            func.max(models.Message.id).label("latest_id")
         )
-        .join(models.Case, models.Message.case_id == models.Case.id)
-        .join(association_table, models.Case.id == association_table.c.case_id) # Direct join on case ID
+        .join(association_table, models.Message.case_id == association_table.c.case_id) # Direct join on case ID
+        .outerjoin(models.CaseRead, and_(
+            models.CaseRead.case_id == models.Message.case_id,
+            models.CaseRead.user_id == user_id,
+        ))
         .filter(
-            models.Message.is_read == False,
+            models.Message.id > func.coalesce(models.CaseRead.last_read_message_id, 0),
             models.Message.sender_id != user_id,
             user_id_column == user_id # Filter assignment
         )
@@ -1044,10 +1226,7 @@ def get_unread_message_notifications(db: Session, user_id: int, role: str, limit
             models.Case.title,
             models.User.name.label("sender_name")
         )
-        .join(subq, and_(
-            models.Message.case_id == subq.c.case_id,
-            models.Message.timestamp == subq.c.latest_timestamp
-        ))
+        .join(subq, models.Message.id == subq.c.latest_id)
         .join(models.Case, models.Message.case_id == models.Case.id)
         .join(models.User, models.Message.sender_id == models.User.id)
         .order_by(models.Message.timestamp.desc())
@@ -1057,22 +1236,372 @@ def get_unread_message_notifications(db: Session, user_id: int, role: str, limit
     
     return results
 
+# =========================================================================
+# 4a. UNREAD COUNTERS
+# =========================================================================
+
+def _increment_unread_counters(db: Session, case_id: int, sender_id: int, amount: int = 1):
+    db.execute(
+        update(models.UnreadCounter)
+        .where(
+            models.UnreadCounter.case_id == case_id,
+            models.UnreadCounter.user_id != sender_id,
+        )
+        .values(count=models.UnreadCounter.count + amount)
+    )
+
+def _expected_unread_counts(case_id: Optional[int] = None):
+    """(user_id, case_id, count) for every case membership, computed from messages."""
+    clients = select(
+        models.case_client_association.c.client_id.label("user_id"),
+        models.case_client_association.c.case_id.label("case_id"),
+    )
+    personnel = select(
+        models.case_personnel_association.c.user_id.label("user_id"),
+        models.case_personnel_association.c.case_id.label("case_id"),
+    )
+    if case_id is not None:
+        clients = clients.where(models.case_client_association.c.case_id == case_id)
+        personnel = personnel.where(models.case_personnel_association.c.case_id == case_id)
+    members = clients.union(personnel).subquery("members")
+
+    return (
+        select(
+            members.c.user_id,
+            members.c.case_id,
+            func.count(models.Message.id).label("count"),
+        )
+        .select_from(members)
+        .outerjoin(
+            models.CaseRead,
+            and_(
+                models.CaseRead.case_id == members.c.case_id,
+                models.CaseRead.user_id == members.c.user_id,
+            ),
+        )
+        .outerjoin(
+            models.Message,
+            and_(
+                models.Message.case_id == members.c.case_id,
+                models.Message.id > func.coalesce(models.CaseRead.last_read_message_id, 0),
+                models.Message.sender_id != members.c.user_id,
+            ),
+        )
+        .group_by(members.c.user_id, members.c.case_id)
+    )
+
+def sync_case_unread_counters(db: Session, case_id: int):
+    """
+    Call after changing a case's clients/personnel (before commit): new members get a
+    counter seeded with what is already unread for them, removed members lose theirs.
+    """
+    db.flush()
+    expected = {
+        user_id: count
+        for user_id, _, count in db.execute(_expected_unread_counts(case_id)).all()
+    }
+    existing = set(
+        db.execute(
+            select(models.UnreadCounter.user_id).where(models.UnreadCounter.case_id == case_id)
+        ).scalars().all()
+    )
+
+    removed = existing - expected.keys()
+    if removed:
+        db.execute(
+            delete(models.UnreadCounter).where(
+                models.UnreadCounter.case_id == case_id,
+                models.UnreadCounter.user_id.in_(removed),
+            )
+        )
+    for user_id in expected.keys() - existing:
+        db.add(models.UnreadCounter(user_id=user_id, case_id=case_id, count=expected[user_id]))
+
+def verify_unread_counters(db: Session) -> List[Tuple[int, int, Optional[int], int]]:
+    """Returns (user_id, case_id, stored, expected) for every counter that has drifted."""
+    stored = {
+        (user_id, case_id): count
+        for user_id, case_id, count in db.query(
+            models.UnreadCounter.user_id,
+            models.UnreadCounter.case_id,
+            models.UnreadCounter.count,
+        ).all()
+    }
+    mismatches = []
+    for user_id, case_id, count in db.execute(_expected_unread_counts()).all():
+        current = stored.pop((user_id, case_id), None)
+        if current != count:
+            mismatches.append((user_id, case_id, current, count))
+    # Counters left over belong to users no longer on the case.
+    mismatches.extend((user_id, case_id, count, 0) for (user_id, case_id), count in stored.items())
+    return mismatches
+
+def rebuild_unread_counters(db: Session) -> int:
+    """Recomputes every counter from messages in one transaction. Returns the number of rows written."""
+    db.execute(delete(models.UnreadCounter))
+    result = db.execute(
+        models.UnreadCounter.__table__.insert().from_select(
+            ["user_id", "case_id", "count"],
+            _expected_unread_counts(),
+        )
+    )
+    db.commit()
+    return result.rowcount
+
 # =========================================================================
 # 5. AWAITING SMS CRUD
 # =========================================================================
 
+def _sms_thread_key(client_id: Optional[int], phone: str) -> str:
+    return f"{client_id or ''}|{phone}"
+
+
+def _add_to_sms_threads(db: Session, added: List[Tuple[Optional[int], str, datetime]]) -> None:
+    """
+    Counts newly stored pending SMS, given as (client_id, phone, received_at), into
+    sms_threads with one upsert. Commit is left to the caller.
+    """
+    if not added:
+        return
+    threads: dict[str, dict[str, Any]] = {}
+    for client_id, phone, received_at in added:
+        received_at = _coerce_utc(received_at).replace(tzinfo=None)
+        key = _sms_thread_key(client_id, phone)
+        thread = threads.get(key)
+        if thread is None:
+            threads[key] = {
+                "thread_key": key,
+                "client_id": client_id,
+                "client_phone_number": phone,
+                "pending_count": 1,
+                "last_received_at": received_at,
+            }
+        else:
+            thread["pending_count"] += 1
+            thread["last_received_at"] = max(thread["last_received_at"], received_at)
+
+    client_ids = {thread["client_id"] for thread in threads.values() if thread["client_id"]}
+    names = dict(db.query(models.User.id, models.User.name).filter(models.User.id.in_(client_ids)).all()) if client_ids else {}
+    for thread in threads.values():
+        thread["client_name"] = names.get(thread["client_id"])
+
+    stmt = _upsert_insert(db, models.SMSThread).values(list(threads.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.SMSThread.thread_key],
+        set_={
+            "pending_count": models.SMSThread.pending_count + stmt.excluded.pending_count,
+            "last_received_at": sql_case(
+                (stmt.excluded.last_received_at > models.SMSThread.last_received_at, stmt.excluded.last_received_at),
+                else_=models.SMSThread.last_received_at,
+            ),
+            "client_name": stmt.excluded.client_name,
+        },
+    )
+    db.execute(stmt)
+
+
+def _pending_sms_threads(phones: Optional[set] = None):
+    """(client_id, phone, pending_count, last_received_at, client_name) computed from awaiting_sms."""
+    query = (
+        select(
+            models.AwaitingSMS.client_id,
+            models.AwaitingSMS.client_phone_number,
+            func.count(models.AwaitingSMS.id).label("pending_count"),
+            func.max(models.AwaitingSMS.received_at).label("last_received_at"),
+            models.User.name.label("client_name"),
+        )
+        .outerjoin(models.User, models.AwaitingSMS.client_id == models.User.id)
+        .where(models.AwaitingSMS.status == "pending")
+        .group_by(models.AwaitingSMS.client_id, models.AwaitingSMS.client_phone_number, models.User.name)
+    )
+    if phones is not None:
+        query = query.where(models.AwaitingSMS.client_phone_number.in_(phones))
+    return query
+
+
+def _refresh_sms_threads(db: Session, keys: set) -> None:
+    """
+    Recomputes the given (client_id, phone) threads after SMS leave them (resolved, or
+    moved to another client). Scans only those phones' rows; commit is left to the caller.
+    """
+    if not keys:
+        return
+    db.flush()
+    thread_keys = {_sms_thread_key(client_id, phone) for client_id, phone in keys}
+    db.execute(
+        delete(models.SMSThread)
+        .where(models.SMSThread.thread_key.in_(thread_keys))
+        .execution_options(synchronize_session=False)
+    )
+    rows = [
+        {
+            "thread_key": _sms_thread_key(client_id, phone),
+            "client_id": client_id,
+            "client_phone_number": phone,
+            "pending_count": pending_count,
+            "last_received_at": last_received_at,
+            "client_name": client_name,
+        }
+        for client_id, phone, pending_count, last_received_at, client_name in db.execute(
+            _pending_sms_threads({phone for _, phone in keys})
+        ).all()
+        if _sms_thread_key(client_id, phone) in thread_keys
+    ]
+    if rows:
+        # Upsert: a concurrent webhook batch may have re-created one of these threads meanwhile.
+        stmt = _upsert_insert(db, models.SMSThread).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.SMSThread.thread_key],
+            set_={
+                "pending_count": stmt.excluded.pending_count,
+                "last_received_at": stmt.excluded.last_received_at,
+                "client_name": stmt.excluded.client_name,
+            },
+        )
+        db.execute(stmt)
+
+
+def rename_sms_threads(db: Session, client_id: int, name: Optional[str]) -> None:
+    """Keeps the denormalized client name current; commit is left to the caller."""
+    db.execute(
+        update(models.SMSThread)
+        .where(models.SMSThread.client_id == client_id)
+        .values(client_name=name)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def verify_sms_threads(db: Session) -> List[Tuple[str, Optional[Tuple[int, Any, Optional[str]]], Optional[Tuple[int, Any, Optional[str]]]]]:
+    """Returns (thread_key, stored, expected) for every thread that has drifted; values are (count, last received, name)."""
+    stored = {
+        thread_key: (count, last_received_at, name)
+        for thread_key, count, last_received_at, name in db.query(
+            models.SMSThread.thread_key,
+            models.SMSThread.pending_count,
+            models.SMSThread.last_received_at,
+            models.SMSThread.client_name,
+        ).all()
+    }
+    mismatches = []
+    for client_id, phone, count, last_received_at, name in db.execute(_pending_sms_threads()).all():
+        key = _sms_thread_key(client_id, phone)
+        expected = (count, last_received_at, name)
+        current = stored.pop(key, None)
+        if current != expected:
+            mismatches.append((key, current, expected))
+    # Threads left over have nothing pending any more.
+    mismatches.extend((key, current, None) for key, current in stored.items())
+    return mismatches
+
+
+def rebuild_sms_threads(db: Session) -> int:
+    """Recomputes sms_threads from awaiting_sms in one transaction. Returns the number of threads."""
+    db.execute(delete(models.SMSThread))
+    rows = [
+        {
+            "thread_key": _sms_thread_key(client_id, phone),
+            "client_id": client_id,
+            "client_phone_number": phone,
+            "pending_count": pending_count,
+            "last_received_at": last_received_at,
+            "client_name": client_name,
+        }
+        for client_id, phone, pending_count, last_received_at, client_name in db.execute(_pending_sms_threads()).all()
+    ]
+    if rows:
+        db.execute(insert(models.SMSThread), rows)
+    db.commit()
+    return len(rows)
+
+
 def create_awaiting_sms(db: Session, phone: str, body: str, client_id: Optional[int] = None) -> models.AwaitingSMS:
-    normalized_phone = _normalize_phone_value(phone) or (phone or "").strip()
+    normalized_phone = normalize_phone(phone) or (phone or "").strip()
     db_awaiting = models.AwaitingSMS(
         client_phone_number=normalized_phone,
         sms_body=body,
-        client_id=client_id
+        client_id=client_id,
+        received_at=_utc_now().replace(tzinfo=None),
     )
     db.add(db_awaiting)
+    _add_to_sms_threads(db, [(client_id, normalized_phone, db_awaiting.received_at)])
     db.commit()
     db.refresh(db_awaiting)
     return db_awaiting
 
+def get_client_ids_by_phones(db: Session, phones: List[str]) -> dict[str, int]:
+    """
+    Bulk form of get_user_by_phone for inbound batches: maps each phone to its client
+    with one query (E.164 match first, then last ten digits, lowest user id on ties).
+    """
+    keys = {phone: (phone_e164(phone), phone_last10(phone)) for phone in set(phones)}
+    e164_keys = {e164 for e164, _ in keys.values() if e164}
+    last10_keys = {last10 for _, last10 in keys.values() if last10}
+    if not e164_keys and not last10_keys:
+        return {}
+    rows = (
+        db.query(models.ClientProfile.user_id, models.ClientProfile.phone_e164, models.ClientProfile.phone_last10)
+        .filter(
+            or_(
+                models.ClientProfile.phone_e164.in_(e164_keys),
+                models.ClientProfile.phone_last10.in_(last10_keys),
+            )
+        )
+        .order_by(models.ClientProfile.user_id.asc())
+        .all()
+    )
+    by_e164: dict[str, int] = {}
+    by_last10: dict[str, int] = {}
+    for user_id, e164, last10 in rows:
+        if e164:
+            by_e164.setdefault(e164, user_id)
+        if last10:
+            by_last10.setdefault(last10, user_id)
+
+    matches = {}
+    for phone, (e164, last10) in keys.items():
+        user_id = by_e164.get(e164) if e164 else None
+        if user_id is None and last10:
+            user_id = by_last10.get(last10)
+        if user_id is not None:
+            matches[phone] = user_id
+    return matches
+
+
+def store_inbound_sms_batch(db: Session, records: List[dict]) -> int:
+    """
+    Inserts buffered webhook payloads ({"message_sid", "from", "body", "received_at"})
+    into awaiting_sms in one statement, resolving clients in bulk. Messages whose
+    MessageSid is already stored are skipped, so a batch can safely be replayed.
+    Returns the number of new rows.
+    """
+    if not records:
+        return 0
+    phones = [normalize_phone(record["from"]) or record["from"].strip() for record in records]
+    client_ids = get_client_ids_by_phones(db, phones)
+    rows = []
+    for record, phone in zip(records, phones):
+        received_at = datetime.fromisoformat(record["received_at"]) if record.get("received_at") else _utc_now()
+        rows.append({
+            "message_sid": record.get("message_sid") or None,
+            "client_phone_number": phone,
+            "phone_e164": phone_e164(phone),
+            "phone_last10": phone_last10(phone),
+            "sms_body": record["body"],
+            "received_at": _coerce_utc(received_at).replace(tzinfo=None),
+            "status": "pending",
+            "client_id": client_ids.get(phone),
+        })
+    stmt = _upsert_insert(db, models.AwaitingSMS).values(rows)
+    stmt = stmt.on_conflict_do_nothing(index_elements=[models.AwaitingSMS.message_sid]).returning(
+        models.AwaitingSMS.client_id,
+        models.AwaitingSMS.client_phone_number,
+        models.AwaitingSMS.received_at,
+    )
+    inserted = [tuple(row) for row in db.execute(stmt).all()]
+    _add_to_sms_threads(db, inserted)
+    db.commit()
+    return len(inserted)
+
 def get_awaiting_sms(
     db: Session,
     skip: int = 0,
@@ -1105,68 +1634,356 @@ def update_awaiting_sms_status(
     """Updates the status of a pending SMS (e.g., to 'resolved')."""
     db_sms = get_awaiting_sms_by_id(db, sms_id)
     if db_sms:
+        was_pending = db_sms.status == "pending"
         db_sms.status = status
         if assigned_case_id is not None:
             db_sms.assigned_case_id = assigned_case_id
             db_sms.assigned_at = datetime.now(timezone.utc)
         if assigned_by_user_id is not None:
             db_sms.assigned_by_user_id = assigned_by_user_id
+        if was_pending and status != "pending":
+            _refresh_sms_threads(db, {(db_sms.client_id, db_sms.client_phone_number)})
+        elif not was_pending and status == "pending":
+            _add_to_sms_threads(db, [(db_sms.client_id, db_sms.client_phone_number, db_sms.received_at)])
         db.commit()
         db.refresh(db_sms)
     return db_sms
 
 
+def assign_awaiting_sms_bulk(
+    db: Session,
+    assignments: List[Tuple[int, int]],
+    assigned_by_user_id: int,
+) -> List[models.Message]:
+    """
+    Files many inbox SMS into case chats at once: (sms_id, case_id) pairs are validated
+    together (one lookup for the SMS, one for case membership), their chat messages are
+    inserted in one statement, and everything commits in a single transaction. Nothing
+    is assigned if any pair is invalid. Returns the new messages in request order.
+    """
+    sms_ids = [sms_id for sms_id, _ in assignments]
+    if len(set(sms_ids)) != len(sms_ids):
+        raise HTTPException(status_code=400, detail="Each SMS can only be assigned once per request.")
+
+    query = db.query(models.AwaitingSMS).filter(models.AwaitingSMS.id.in_(sms_ids))
+    if db.get_bind().dialect.name == "postgresql":
+        # Two paralegals clearing the same backlog must not both file a message.
+        query = query.with_for_update()
+    sms_by_id = {sms.id: sms for sms in query.all()}
+
+    missing = [sms_id for sms_id in sms_ids if sms_id not in sms_by_id]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Inbox SMS not found: {missing}")
+    resolved = [sms_id for sms_id in sms_ids if sms_by_id[sms_id].status == "resolved"]
+    if resolved:
+        raise HTTPException(status_code=400, detail=f"SMS already resolved: {resolved}")
+    unidentified = [sms_id for sms_id in sms_ids if not sms_by_id[sms_id].client_id]
+    if unidentified:
+        raise HTTPException(status_code=400, detail=f"Cannot assign SMS without an identified client: {unidentified}")
+
+    memberships = set(
+        db.query(models.case_client_association.c.case_id, models.case_client_association.c.client_id)
+        .filter(
+            models.case_client_association.c.case_id.in_({case_id for _, case_id in assignments}),
+            models.case_client_association.c.client_id.in_({sms.client_id for sms in sms_by_id.values()}),
+        )
+        .all()
+    )
+    not_member = [sms_id for sms_id, case_id in assignments if (case_id, sms_by_id[sms_id].client_id) not in memberships]
+    if not_member:
+        raise HTTPException(status_code=403, detail=f"Case not found or client is not assigned to it for SMS: {not_member}")
+
+    now = _utc_now()
+    message_ids = db.execute(
+        insert(models.Message).returning(models.Message.id, sort_by_parameter_order=True),
+        [
+            {
+                "content": sms_by_id[sms_id].sms_body,
+                "case_id": case_id,
+                "sender_id": sms_by_id[sms_id].client_id,
+                "channel": "sms",
+                "message_type": "text",
+                "timestamp": now,
+                "is_read": False,
+            }
+            for sms_id, case_id in assignments
+        ],
+    ).scalars().all()
+
+    per_sender: dict[Tuple[int, int], int] = {}
+    sms_ids_by_case: dict[int, List[int]] = {}
+    for sms_id, case_id in assignments:
+        key = (case_id, sms_by_id[sms_id].client_id)
+        per_sender[key] = per_sender.get(key, 0) + 1
+        sms_ids_by_case.setdefault(case_id, []).append(sms_id)
+    for (case_id, sender_id), amount in per_sender.items():
+        _increment_unread_counters(db, case_id, sender_id, amount)
+
+    for case_id, case_sms_ids in sms_ids_by_case.items():
+        db.execute(
+            update(models.AwaitingSMS)
+            .where(models.AwaitingSMS.id.in_(case_sms_ids))
+            .values(
+                status="resolved",
+                assigned_case_id=case_id,
+                assigned_by_user_id=assigned_by_user_id,
+                assigned_at=now,
+            )
+            .execution_options(synchronize_session=False)
+        )
+    _refresh_sms_threads(db, {(sms.client_id, sms.client_phone_number) for sms in sms_by_id.values()})
+    db.commit()
+
+    messages = {
+        message.id: message
+        for message in db.query(models.Message)
+        .options(
+            joinedload(models.Message.sender_user).joinedload(models.User.lawyer_profile),
+            joinedload(models.Message.sender_user).joinedload(models.User.client_profile),
+            joinedload(models.Message.document_request),
+            joinedload(models.Message.case),
+        )
+        .filter(models.Message.id.in_(message_ids))
+        .all()
+    }
+    return [messages[message_id] for message_id in message_ids]
+
+
 def get_sms_inbox_threads(
     db: Session,
     skip: int = 0,
     limit: int = 100,
 ) -> List[schemas.SMSInboxThread]:
-    results = (
-        db.query(
-            models.AwaitingSMS.client_id,
-            models.AwaitingSMS.client_phone_number,
-            func.count(models.AwaitingSMS.id).label("pending_count"),
-            func.max(models.AwaitingSMS.received_at).label("last_received_at"),
-            models.User.name.label("client_name")
-        )
-        .outerjoin(models.User, models.AwaitingSMS.client_id == models.User.id)
-        .filter(models.AwaitingSMS.status == "pending")
-        .group_by(models.AwaitingSMS.client_id, models.AwaitingSMS.client_phone_number, models.User.name)
-        .order_by(func.max(models.AwaitingSMS.received_at).desc())
+    """Inbox threads, newest first, read from the sms_threads summary table."""
+    threads = (
+        db.query(models.SMSThread)
+        .order_by(models.SMSThread.last_received_at.desc(), models.SMSThread.id.desc())
         .offset(skip)
         .limit(limit)
         .all()
     )
-
     return [
         schemas.SMSInboxThread(
-            client_id=r.client_id,
-            client_phone_number=r.client_phone_number,
-            pending_count=r.pending_count,
-            last_received_at=r.last_received_at,
-            client_name=r.client_name,
+            client_id=thread.client_id,
+            client_phone_number=thread.client_phone_number,
+            pending_count=thread.pending_count,
+            last_received_at=thread.last_received_at,
+            client_name=thread.client_name,
         )
-        for r in results
+        for thread in threads
     ]
 
 
-def reconcile_pending_sms_client_matches(db: Session) -> int:
-    """Best-effort backfill: link pending SMS rows to clients by phone."""
-    pending_unknown = (
+SMS_RECONCILE_MARKER = "awaiting_sms_reconciled_id"
+# Rows younger than this are re-checked on the next sweep instead of passing the watermark,
+# so an insert whose id was allocated before a concurrent, later-committing one is not skipped.
+SMS_RECONCILE_GRACE = timedelta(seconds=60)
+
+
+def link_pending_sms_to_client(db: Session, client_id: int, phone: Optional[str]) -> int:
+    """
+    Attaches pending, unidentified inbox SMS from `phone` to the client. Called whenever a
+    client profile's phone is set; one indexed UPDATE, then the affected sms_threads are
+    recomputed. Commit is left to the caller.
+    """
+    e164 = phone_e164(phone)
+    last10 = phone_last10(phone)
+    conditions = []
+    if e164:
+        conditions.append(models.AwaitingSMS.phone_e164 == e164)
+    if last10:
+        conditions.append(models.AwaitingSMS.phone_last10 == last10)
+    if not conditions:
+        return 0
+    moved_phones = (
+        db.execute(
+            update(models.AwaitingSMS)
+            .where(
+                models.AwaitingSMS.status == "pending",
+                models.AwaitingSMS.client_id.is_(None),
+                or_(*conditions),
+            )
+            .values(client_id=client_id)
+            .returning(models.AwaitingSMS.client_phone_number)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+    )
+    _refresh_sms_threads(db, {(owner, phone) for phone in set(moved_phones) for owner in (None, client_id)})
+    return len(moved_phones)
+
+
+def reconcile_new_pending_sms(db: Session, batch_size: int = 500) -> int:
+    """
+    Safety net for SMS that raced a phone change: matches unidentified pending rows above
+    the sync_markers watermark (one index probe each) and moves the watermark past them.
+    Older rows only change hands through link_pending_sms_to_client.
+    """
+    watermark = get_sync_marker(db, SMS_RECONCILE_MARKER)
+    rows = (
         db.query(models.AwaitingSMS)
-        .filter(models.AwaitingSMS.status == "pending", models.AwaitingSMS.client_id.is_(None))
+        .filter(
+            models.AwaitingSMS.id > watermark,
+            models.AwaitingSMS.status == "pending",
+            models.AwaitingSMS.client_id.is_(None),
+        )
+        .order_by(models.AwaitingSMS.id.asc())
+        .limit(batch_size)
         .all()
     )
+    settled_before = (_utc_now() - SMS_RECONCILE_GRACE).replace(tzinfo=None)
     updated = 0
-    for row in pending_unknown:
+    moved_threads = set()
+    new_watermark = watermark
+    advancing = True
+    for row in rows:
         matched_user = get_user_by_phone(db, row.client_phone_number)
         if matched_user:
             row.client_id = matched_user.id
+            moved_threads.update({(None, row.client_phone_number), (matched_user.id, row.client_phone_number)})
             updated += 1
-    if updated:
+        received_at = row.received_at.replace(tzinfo=None) if row.received_at else None
+        if advancing and received_at is not None and received_at < settled_before:
+            new_watermark = row.id
+        else:
+            advancing = False
+    if new_watermark != watermark:
+        set_sync_marker(db, SMS_RECONCILE_MARKER, new_watermark)
+    _refresh_sms_threads(db, moved_threads)
+    if updated or new_watermark != watermark:
         db.commit()
     return updated
 
+
+# =========================================================================
+# 5b. OUTBOUND SMS QUEUE CRUD
+# =========================================================================
+
+SMS_FINAL_DELIVERY_STATUSES = ("delivered", "undelivered", "failed", "read")
+
+
+def enqueue_outbound_sms(
+    db: Session,
+    to_number: str,
+    body: str,
+    from_number: Optional[str] = None,
+    case_id: Optional[int] = None,
+) -> models.OutboundSMS:
+    """Queues an SMS for services.sms to send; callers then nudge sms_dispatcher.notify()."""
+    db_sms = add_outbound_sms(db, to_number, body, from_number=from_number, case_id=case_id)
+    db.commit()
+    db.refresh(db_sms)
+    return db_sms
+
+
+def add_outbound_sms(
+    db: Session,
+    to_number: str,
+    body: str,
+    from_number: Optional[str] = None,
+    case_id: Optional[int] = None,
+) -> models.OutboundSMS:
+    """
+    enqueue_outbound_sms inside the caller's transaction (commit is left to the caller),
+    so the SMS is queued if and only if the message it announces is stored.
+    """
+    now = _utc_now().replace(tzinfo=None)
+    db_sms = models.OutboundSMS(
+        to_number=normalize_phone(to_number) or (to_number or "").strip(),
+        from_number=from_number,
+        body=body,
+        case_id=case_id,
+        status="queued",
+        next_attempt_at=now,
+        created_at=now,
+        updated_at=now,
+    )
+    db.add(db_sms)
+    return db_sms
+
+
+def claim_outbound_sms(db: Session, limit: int, lease: timedelta) -> List[models.OutboundSMS]:
+    """
+    Moves up to `limit` due messages to 'sending' and leases them until now + lease.
+    Rows whose lease ran out (a worker died mid-send) are due again. On PostgreSQL the
+    claim skips rows other workers hold locked, so several app processes can share the queue.
+    """
+    now = _utc_now().replace(tzinfo=None)
+    query = (
+        db.query(models.OutboundSMS)
+        .filter(
+            models.OutboundSMS.status.in_(("queued", "sending")),
+            models.OutboundSMS.next_attempt_at <= now,
+        )
+        .order_by(models.OutboundSMS.next_attempt_at.asc(), models.OutboundSMS.id.asc())
+        .limit(limit)
+    )
+    if db.get_bind().dialect.name == "postgresql":
+        query = query.with_for_update(skip_locked=True)
+    rows = query.all()
+    for row in rows:
+        row.status = "sending"
+        row.attempts = (row.attempts or 0) + 1
+        row.next_attempt_at = now + lease
+        row.updated_at = now
+    db.commit()
+    return rows
+
+
+def record_outbound_sms_attempt(
+    db: Session,
+    sms_id: int,
+    status: str,
+    provider_sid: Optional[str] = None,
+    delivery_status: Optional[str] = None,
+    error: Optional[str] = None,
+    retry_at: Optional[datetime] = None,
+) -> None:
+    """Stores the outcome of one send: 'sent', 'failed', or 'queued' again with retry_at."""
+    now = _utc_now().replace(tzinfo=None)
+    values: dict[str, Any] = {"status": status, "last_error": error, "updated_at": now}
+    if status == "sent":
+        values.update(provider_sid=provider_sid, delivery_status=delivery_status, sent_at=now)
+    if retry_at is not None:
+        values["next_attempt_at"] = _coerce_utc(retry_at).replace(tzinfo=None)
+    db.execute(
+        update(models.OutboundSMS)
+        .where(models.OutboundSMS.id == sms_id, models.OutboundSMS.status == "sending")
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def update_outbound_sms_delivery(
+    db: Session,
+    provider_sid: str,
+    delivery_status: str,
+    error: Optional[str] = None,
+) -> bool:
+    """
+    Applies a Twilio status callback to the message it reports on. Callbacks can arrive
+    out of order, so an interim status never replaces a final one.
+    """
+    values: dict[str, Any] = {"delivery_status": delivery_status, "updated_at": _utc_now().replace(tzinfo=None)}
+    if error:
+        values["last_error"] = error
+    conditions = [models.OutboundSMS.provider_sid == provider_sid]
+    if delivery_status not in SMS_FINAL_DELIVERY_STATUSES:
+        conditions.append(
+            or_(
+                models.OutboundSMS.delivery_status.is_(None),
+                models.OutboundSMS.delivery_status.notin_(SMS_FINAL_DELIVERY_STATUSES),
+            )
+        )
+    result = db.execute(
+        update(models.OutboundSMS)
+        .where(*conditions)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount > 0
+
 # =========================================================================
 # 6. DOCUMENT REQUEST CRUD
 # =========================================================================
@@ -1180,6 +1997,17 @@ def create_document_request(
     Creates a new document request and associated elements.
     Generates a unique access token.
     """
+    db_request = add_document_request(db, case_id, request_data)
+    db.commit()
+    db.refresh(db_request)
+    return db_request
+
+def add_document_request(
+    db: Session,
+    case_id: int,
+    request_data: schemas.DocumentRequestCreate
+) -> models.DocumentRequest:
+    """create_document_request inside the caller's transaction (commit is left to the caller)."""
     if not request_data.lawyer_id:
         raise HTTPException(status_code=400, detail="Lawyer ID missing")
     
@@ -1220,11 +2048,9 @@ def create_document_request(
         message_type="document_request"
     )
     # Crucial: Must use the updated create_message that accepts message_type
-    chat_message = create_message(db, message=message_in)
+    chat_message = add_message(db, message=message_in)
     db_request.message_id = chat_message.id
-    
-    db.commit()
-    db.refresh(db_request)
+    db.flush()
     
     return db_request
 
@@ -1255,6 +2081,36 @@ def get_document_request_by_id(db: Session, request_id: int):
     return db.query(models.DocumentRequest).filter(models.DocumentRequest.id == request_id).first()
 
 
+def get_document_download(db: Session, doc_id: int, user_id: int, role: str):
+    """
+    Everything a download needs in one query: the stored file, when its content was
+    stored, and `allowed` (case membership, or admin). None if the document does not exist.
+    """
+    association_table, user_id_column = _get_user_case_association(role)
+    if role == "admin":
+        allowed = true()
+    elif association_table is None:
+        allowed = false()
+    else:
+        allowed = exists().where(
+            association_table.c.case_id == models.DocumentRequest.case_id,
+            user_id_column == user_id,
+        )
+    return db.execute(
+        select(
+            models.RequestedDocument.file_path,
+            models.RequestedDocument.file_name,
+            models.RequestedDocument.file_size,
+            models.RequestedDocument.file_sha256,
+            models.DocumentBlob.created_at.label("stored_at"),
+            allowed.label("allowed"),
+        )
+        .join(models.DocumentRequest, models.DocumentRequest.id == models.RequestedDocument.request_id)
+        .outerjoin(models.DocumentBlob, models.DocumentBlob.sha256 == models.RequestedDocument.file_sha256)
+        .where(models.RequestedDocument.id == doc_id)
+    ).first()
+
+
 def get_requested_document_by_id(db: Session, doc_id: int):
     """
     Retrieves a single RequestedDocument by its primary key (ID).
@@ -1366,7 +2222,7 @@ def update_requested_document_status(
         )
 
     if status == "required":
-        document.file_path = None
+        release_document_file(db, document)
 
     document.status = status
     db.commit()
@@ -1379,12 +2235,233 @@ def clear_requested_document_file(db: Session, doc_id: int) -> Optional[models.R
     if not document:
         return None
 
-    document.file_path = None
+    release_document_file(db, document)
     document.status = "required"
     db.commit()
     db.refresh(document)
     return document
 
+
+# =========================================================================
+# DOCUMENT BLOBS (content-addressed file store)
+# =========================================================================
+# Requested documents point at a document_blobs row by SHA-256; identical uploads share
+# one file. File moves happen while the blob row is locked (the upsert or SELECT ... FOR
+# UPDATE). Removals wait until the releasing transaction commits: a blob left with no
+# references keeps its row (ref_count 0) until then, and is deleted with its bytes only
+# if it is still unreferenced under a fresh lock. A rolled-back release therefore never
+# loses bytes, and a re-upload of the same content cannot race with the removal.
+
+# Session.info key for the stored files the current transaction has released.
+_RELEASED_FILES = "released_document_files"
+
+def attach_document_file(
+    db: Session,
+    document: models.RequestedDocument,
+    source_path: str,
+    sha256: str,
+    size: int,
+    filename: Optional[str],
+) -> None:
+    """
+    Points `document` at the blob for `sha256`. The uploaded file at `source_path` is
+    moved into the store if the content is new and dropped otherwise. The document's
+    previous file is released. Commit is left to the caller.
+    """
+    stmt = _upsert_insert(db, models.DocumentBlob).values(
+        sha256=sha256,
+        size=size,
+        path=blob_key(sha256),
+        ref_count=1,
+        created_at=_utc_now(),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.DocumentBlob.sha256],
+        set_={"ref_count": models.DocumentBlob.ref_count + 1},
+    ).returning(models.DocumentBlob.path)
+    stored_key = place_blob(source_path, db.execute(stmt).scalar_one())
+
+    previous = (document.file_sha256, document.file_path)
+    document.file_path = stored_key
+    document.file_name = filename
+    document.file_size = size
+    document.file_sha256 = sha256
+    db.flush()
+    # Also right when the same content is re-uploaded: it undoes the extra reference.
+    _release_blob(db, *previous)
+
+
+def release_document_file(db: Session, document: models.RequestedDocument) -> None:
+    """Detaches the document's file, removing the bytes once nothing else uses them. Commit is left to the caller."""
+    previous = (document.file_sha256, document.file_path)
+    document.file_path = None
+    document.file_name = None
+    document.file_size = None
+    document.file_sha256 = None
+    db.flush()
+    _release_blob(db, *previous)
+
+
+def _release_blob(db: Session, sha256: Optional[str], file_path: Optional[str]) -> None:
+    """Drops one reference; callers must already have pointed the document elsewhere. Bytes go after commit."""
+    blob = None
+    if sha256:
+        blob = (
+            db.query(models.DocumentBlob)
+            .filter(models.DocumentBlob.sha256 == sha256)
+            .populate_existing()
+            .with_for_update()
+            .first()
+        )
+    if blob is None:
+        # Uploaded before the blob store: the document owned its file outright.
+        if file_path:
+            _remove_after_commit(db, key=file_path)
+        return
+    if file_path and file_path != blob.path:
+        _remove_after_commit(db, key=file_path)
+    blob.ref_count -= 1
+    if blob.ref_count <= 0:
+        _remove_after_commit(db, sha256=blob.sha256)
+    db.flush()
+
+
+def _remove_after_commit(db: Session, key: Optional[str] = None, sha256: Optional[str] = None) -> None:
+    """Queues a document-owned file (`key`) or an unreferenced blob (`sha256`) for removal once `db` commits."""
+    db.info.setdefault(_RELEASED_FILES, []).append((key, sha256))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_released_files(session: Session) -> None:
+    session.info.pop(_RELEASED_FILES, None)
+
+
+@event.listens_for(Session, "after_commit")
+def _remove_released_files(session: Session) -> None:
+    released = session.info.pop(_RELEASED_FILES, None)
+    if not released:
+        return
+    # The committed session cannot run SQL any more; blobs are re-checked on a fresh one.
+    with Session(bind=session.get_bind()) as purge_db:
+        for key, sha256 in released:
+            try:
+                if key:
+                    document_storage.delete(key)
+                else:
+                    _purge_unreferenced_blob(purge_db, sha256)
+            except Exception:
+                # Left for `manage.py document-blobs rebuild`; the commit itself stood.
+                purge_db.rollback()
+                logger.exception("Failed to remove released document file %s", key or sha256)
+
+
+def _purge_unreferenced_blob(db: Session, sha256: str) -> None:
+    blob = (
+        db.query(models.DocumentBlob)
+        .filter(models.DocumentBlob.sha256 == sha256)
+        .with_for_update()
+        .first()
+    )
+    if blob is None or blob.ref_count > 0:
+        # Gone already, or the same content was uploaded again meanwhile.
+        db.rollback()
+        return
+    document_storage.delete(blob.path)
+    db.delete(blob)
+    db.commit()
+
+
+def _document_blob_references(db: Session) -> dict:
+    return dict(
+        db.query(models.RequestedDocument.file_sha256, func.count(models.RequestedDocument.id))
+        .filter(models.RequestedDocument.file_sha256.isnot(None))
+        .group_by(models.RequestedDocument.file_sha256)
+        .all()
+    )
+
+
+def verify_document_blobs(db: Session) -> List[Tuple[str, Optional[int], int, bool]]:
+    """Returns (sha256, stored ref_count, referencing documents, file present) for every blob that is off."""
+    references = _document_blob_references(db)
+    problems = []
+    for blob in db.query(models.DocumentBlob).all():
+        expected = references.pop(blob.sha256, 0)
+        present = document_storage.exists(blob.path)
+        if blob.ref_count != expected or not present:
+            problems.append((blob.sha256, blob.ref_count, expected, present))
+    return problems
+
+
+def _uploaded_filename(document: models.RequestedDocument) -> Optional[str]:
+    """The client's filename, recovered from an old "<request_id>/<doc_id>_<filename>" path if need be."""
+    if document.file_name or not document.file_path:
+        return document.file_name
+    filename = os.path.basename(document.file_path)
+    prefix = f"{document.id}_"
+    return filename[len(prefix):] if filename.startswith(prefix) else filename
+
+
+def rebuild_document_blobs(db: Session) -> Tuple[int, int]:
+    """
+    Moves files stored on local disk before the blob store (and storage backend) into
+    it, deduplicating them, then recomputes every ref_count and deletes unreferenced
+    blobs. Returns (documents moved, blobs removed).
+    """
+    moved = 0
+    legacy = (
+        db.query(models.RequestedDocument)
+        .filter(models.RequestedDocument.file_path.isnot(None), models.RequestedDocument.file_sha256.is_(None))
+        .all()
+    )
+    for document in legacy:
+        source_path = local_upload_path(document.file_path)
+        if not os.path.exists(source_path):
+            continue
+        attach_document_file(
+            db,
+            document,
+            source_path,
+            hash_file(source_path),
+            os.path.getsize(source_path),
+            _uploaded_filename(document),
+        )
+        db.commit()
+        moved += 1
+
+    # Blobs the migration created in place (at an upload's original path) move to their key.
+    for blob in db.query(models.DocumentBlob).all():
+        key = blob_key(blob.sha256)
+        source_path = local_upload_path(blob.path)
+        if blob.path == key or not os.path.exists(source_path):
+            continue
+        blob = (
+            db.query(models.DocumentBlob)
+            .filter(models.DocumentBlob.sha256 == blob.sha256)
+            .populate_existing()
+            .with_for_update()
+            .one()
+        )
+        place_blob(source_path, key)
+        documents = db.query(models.RequestedDocument).filter(models.RequestedDocument.file_sha256 == blob.sha256).all()
+        for document in documents:
+            if document.file_path and document.file_path != blob.path:
+                remove_file(local_upload_path(document.file_path))
+            document.file_name = _uploaded_filename(document)
+            document.file_path = key
+        blob.path = key
+        db.commit()
+        moved += len(documents)
+
+    references = _document_blob_references(db)
+    removed = 0
+    for blob in db.query(models.DocumentBlob).with_for_update().all():
+        blob.ref_count = references.get(blob.sha256, 0)
+        if blob.ref_count == 0:
+            _remove_after_commit(db, sha256=blob.sha256)
+            removed += 1
+    db.commit()
+    return moved, removed
+
 def update_client(db: Session, client_id: int, client_update: schemas.ClientUpdate):
     """Updates a client's core info and profile data."""
     user = get_user_by_id(db, client_id)
@@ -1394,17 +2471,20 @@ def update_client(db: Session, client_id: int, client_update: schemas.ClientUpda
     # Update Core User fields
     if client_update.name:
         user.name = client_update.name
+        rename_sms_threads(db, user.id, user.name)
     if client_update.email:
         user.email = client_update.email
         
     # Update Profile fields
     if user.client_profile:
         if client_update.phone:
-            user.client_profile.phone = _normalize_phone_value(client_update.phone)
+            user.client_profile.phone = normalize_phone(client_update.phone)
+            link_pending_sms_to_client(db, user.id, user.client_profile.phone)
         if client_update.address:
             user.client_profile.address = client_update.address
             
     db.commit()
+    invalidate_principal(user.id)
     db.refresh(user)
     return user
 
@@ -1412,8 +2492,24 @@ def delete_user(db: Session, user_id: int):
     """Deletes a user and their profile."""
     user = get_user_by_id(db, user_id)
     if user:
+        # Their pending SMS become unidentified (client_id is nulled), so each of the
+        # user's inbox threads is dropped and the phone's "|<phone>" thread recounted.
+        phones = {
+            phone
+            for (phone,) in db.query(models.SMSThread.client_phone_number)
+            .filter(models.SMSThread.client_id == user_id)
+            .all()
+        }
+        db.execute(
+            delete(models.SMSThread)
+            .where(models.SMSThread.client_id == user_id)
+            .execution_options(synchronize_session=False)
+        )
         db.delete(user)
+        db.flush()
+        _refresh_sms_threads(db, {(None, phone) for phone in phones})
         db.commit()
+        invalidate_principal(user_id)
         return True
     return False
 
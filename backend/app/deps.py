@@ -2,9 +2,10 @@ from fastapi import Cookie, Header, HTTPException, Depends
 from sqlalchemy.orm import Session
 from jose import JWTError
 
-from . import database, crud
+from . import database, crud, models
 from .auth import decode_access_token
 from .config import get_settings
+from .principals import Principal, cache_principal, get_cached_principal
 
 
 settings = get_settings()
@@ -21,18 +22,47 @@ def _get_token_from_request(
     raise HTTPException(status_code=401, detail="Not authenticated")
 
 
-def get_current_user(
-    token: str = Depends(_get_token_from_request),
-    db: Session = Depends(database.get_db),
-):
+def _get_token_user_id(token: str) -> int:
     try:
         payload = decode_access_token(token)
-        user_id = payload.get("sub")
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        user = crud.get_user_by_id(db, int(user_id))
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    user_id = payload.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return int(user_id)
+
+
+def load_principal(db: Session, user_id: int, token: str) -> Principal | None:
+    """Cached principal for this token, falling back to one users query on a miss."""
+    principal = get_cached_principal(user_id, token)
+    if principal is not None:
+        return principal
+    user = crud.get_user_by_id(db, user_id)
+    if not user:
+        return None
+    principal = Principal.from_user(user)
+    cache_principal(token, principal)
+    return principal
+
+
+def get_current_user(
+    token: str = Depends(_get_token_from_request),
+    db: Session = Depends(database.get_db),
+) -> Principal:
+    # The session only connects if the principal cache misses.
+    principal = load_principal(db, _get_token_user_id(token), token)
+    if principal is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    return principal
+
+
+def get_current_user_record(
+    token: str = Depends(_get_token_from_request),
+    db: Session = Depends(database.get_db),
+) -> models.User:
+    """Full user row with profiles, for endpoints that return the user itself."""
+    user = crud.get_user_by_id(db, _get_token_user_id(token))
+    if not user:
+        raise HTTPException(status_code=401, detail="User not found")
+    return user
@@ -1,3 +1,5 @@
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import logging
@@ -6,12 +8,15 @@ import os
 from . import database, models
 from .config import get_settings
 from .api import auth, cases, clients, users, documents, sms, ws, invites
+from .services.jwks import azure_keys
+from .services.passwords import password_hasher
+from .services.sms import inbound_sms_writer, sms_dispatcher, sms_reconciler
+from .services.storage import document_storage
 
 logging.basicConfig(level=logging.INFO)
 settings = get_settings()
 
-UPLOAD_DIRECTORY = "uploads"
-os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
+os.makedirs(settings.upload_directory, exist_ok=True)
 
 app = FastAPI()
 
@@ -25,12 +30,35 @@ def ensure_schema():
     # Create newly introduced tables (safe no-op for existing ones).
     models.Base.metadata.create_all(bind=database.engine)
 
+
+@app.on_event("startup")
+async def start_background_workers():
+    await ws.manager.start()
+    await sms_dispatcher.start()
+    await inbound_sms_writer.start()
+    await sms_reconciler.start()
+    azure_keys.start([tenant for tenant in (settings.azure_tenant_id, "common") if tenant])
+    await asyncio.to_thread(password_hasher.start)
+
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await ws.manager.stop()
+    await sms_dispatcher.stop()
+    await inbound_sms_writer.stop()
+    await sms_reconciler.stop()
+    azure_keys.stop()
+    await asyncio.to_thread(password_hasher.stop)
+    document_storage.close()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.cors_allow_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Keyset cursors for /cases/{id}/messages.
+    expose_headers=["X-Next-Before-Id", "X-Next-After-Id"],
 )
 
 
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Table, func, UniqueConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, DateTime, Boolean, Table, func, UniqueConstraint, Index
+from sqlalchemy.orm import relationship, validates
 from .database import Base
+from .phone import normalize_phone, phone_e164, phone_last10
 import datetime
 import json
 
@@ -100,6 +101,18 @@ class RolePermission(Base):
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
 
+class SyncMarker(Base):
+    """
+    Named version stamps for data that workers cache in memory. Writers bump the value
+    in the same transaction as their change; readers compare it to the version they loaded.
+    """
+    __tablename__ = "sync_markers"
+
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
+
 class Invite(Base):
     __tablename__ = "invites"
 
@@ -139,11 +152,21 @@ class ClientProfile(Base):
     __tablename__ = "client_profiles"
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     phone = Column(String, index=True) 
+    # Lookup keys for inbound SMS, derived from `phone` whenever it is assigned.
+    phone_e164 = Column(String, index=True, nullable=True)
+    phone_last10 = Column(String, index=True, nullable=True)
     address = Column(String)
     active_cases = Column(Integer, default=0)
     joined_date = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
     user = relationship("User", back_populates="client_profile")
 
+    @validates("phone")
+    def _sync_phone_keys(self, key, value):
+        value = normalize_phone(value)
+        self.phone_e164 = phone_e164(value)
+        self.phone_last10 = phone_last10(value)
+        return value
+
 # =========================================================================
 # 3. INTERACTION TABLES (Case and Message)
 # =========================================================================
@@ -198,9 +221,15 @@ class Message(Base):
     """
     __tablename__ = "messages"
     
+    __table_args__ = (
+        # Unread counts and paging are id ranges within one case.
+        Index("ix_messages_case_id_id", "case_id", "id"),
+    )
+    
     id = Column(Integer, primary_key=True, index=True)
     content = Column(String, nullable=False)
     timestamp = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+    # Legacy global flag, no longer maintained: read state is per reader in case_reads.
     is_read = Column(Boolean, default=False)
     
     message_type = Column(String, default='text')
@@ -221,6 +250,28 @@ class Message(Base):
         primaryjoin="Message.id == DocumentRequest.message_id" 
     )
 
+class CaseRead(Base):
+    """Per-reader watermark: every message in the case with id <= last_read_message_id has been read by user_id."""
+    __tablename__ = "case_reads"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    case_id = Column(Integer, ForeignKey("cases.id", ondelete="CASCADE"), primary_key=True)
+    last_read_message_id = Column(Integer, nullable=False, default=0, server_default="0")
+    read_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
+class UnreadCounter(Base):
+    """
+    Maintained count of unread messages (not sent by the user, above their case_reads
+    watermark) per case member. Kept in step by crud.create_message /
+    mark_messages_as_read and membership changes;
+    `python manage.py unread-counters verify|rebuild` recomputes it from messages.
+    """
+    __tablename__ = "unread_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    case_id = Column(Integer, ForeignKey("cases.id", ondelete="CASCADE"), primary_key=True, index=True)
+    count = Column(Integer, nullable=False, default=0, server_default="0")
+
 # =========================================================================
 # 4. AWAITING SMS
 # =========================================================================
@@ -229,7 +280,12 @@ class AwaitingSMS(Base):
     __tablename__ = "awaiting_sms"
     
     id = Column(Integer, primary_key=True, index=True)
+    # Twilio's MessageSid; unique so a replayed webhook buffer cannot store a message twice.
+    message_sid = Column(String, unique=True, index=True, nullable=True)
     client_phone_number = Column(String, index=True, nullable=False)
+    # Same lookup keys as ClientProfile, so a client's phone change finds its pending SMS by index.
+    phone_e164 = Column(String, index=True, nullable=True)
+    phone_last10 = Column(String, index=True, nullable=True)
     sms_body = Column(String, nullable=False)
     received_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
     
@@ -248,6 +304,60 @@ class AwaitingSMS(Base):
     assigned_case = relationship("Case", foreign_keys=[assigned_case_id])
     assigned_by_user = relationship("User", foreign_keys=[assigned_by_user_id])
 
+    @validates("client_phone_number")
+    def _sync_phone_keys(self, key, value):
+        self.phone_e164 = phone_e164(value)
+        self.phone_last10 = phone_last10(value)
+        return value
+
+class SMSThread(Base):
+    """
+    One row per inbox thread (client, or unknown number, with pending SMS): the pending
+    count, newest pending SMS time and client name, kept in step by the awaiting_sms
+    writers in crud. Threads with nothing pending are deleted, so the inbox thread list
+    is a read of this table in last_received_at order.
+    `python manage.py sms-threads verify|rebuild` recomputes it from awaiting_sms.
+    """
+    __tablename__ = "sms_threads"
+
+    id = Column(Integer, primary_key=True)
+    # "<client_id>|<phone>" ("|<phone>" for unidentified senders); client_id alone can be NULL.
+    thread_key = Column(String, unique=True, nullable=False)
+    client_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+    client_phone_number = Column(String, nullable=False)
+    client_name = Column(String, nullable=True)
+    pending_count = Column(Integer, nullable=False, default=0, server_default="0")
+    last_received_at = Column(DateTime, nullable=False, index=True)
+
+class OutboundSMS(Base):
+    """
+    Durable outbound SMS queue. Request handlers insert 'queued' rows; the workers in
+    services/sms.py claim due rows ('sending', leased until next_attempt_at), post them to
+    Twilio and record 'sent' or, after SMS_MAX_ATTEMPTS, 'failed'. delivery_status follows
+    Twilio's status callbacks (queued, sent, delivered, undelivered, ...).
+    """
+    __tablename__ = "outbound_sms"
+    __table_args__ = (
+        Index("ix_outbound_sms_due", "status", "next_attempt_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    to_number = Column(String, nullable=False)
+    from_number = Column(String, nullable=True)
+    body = Column(String, nullable=False)
+    case_id = Column(Integer, ForeignKey("cases.id", ondelete="SET NULL"), nullable=True, index=True)
+
+    status = Column(String, nullable=False, default="queued", server_default="queued")
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    next_attempt_at = Column(DateTime, nullable=False, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+    last_error = Column(String, nullable=True)
+
+    provider_sid = Column(String, unique=True, nullable=True)
+    delivery_status = Column(String, nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+    sent_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
 # =========================================================================
 # 5. DOCUMENT REQUEST TABLES
 # =========================================================================
@@ -277,6 +387,22 @@ class DocumentRequest(Base):
     chat_message = relationship("Message", back_populates="document_request", uselist=False)
 
 
+class DocumentBlob(Base):
+    """
+    One stored file per distinct content, keyed by its SHA-256 and shared by every
+    requested document that uploaded the same bytes. ref_count is the number of
+    requested_documents pointing at it; the file is removed when it drops to zero.
+    `python manage.py document-blobs verify|rebuild` recomputes the counts.
+    """
+    __tablename__ = "document_blobs"
+
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    path = Column(String, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime, default=lambda: datetime.datetime.now(datetime.timezone.utc))
+
+
 class RequestedDocument(Base):
     __tablename__ = "requested_documents"
     
@@ -288,5 +414,11 @@ class RequestedDocument(Base):
 
     file_id = Column(Integer, nullable=True) 
     file_path = Column(String, nullable=True)
+    # Name the client uploaded the file under (file_path points into the blob store).
+    file_name = Column(String, nullable=True)
+    file_size = Column(BigInteger, nullable=True)
+    # Hex SHA-256 of the stored file, computed while the upload streamed in.
+    file_sha256 = Column(String(64), ForeignKey("document_blobs.sha256"), nullable=True, index=True)
     
     request = relationship("DocumentRequest", back_populates="requested_documents")
+    blob = relationship("DocumentBlob")
@@ -0,0 +1,66 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from .config import get_settings
+
+
+settings = get_settings()
+
+ROLE_PERMISSIONS_MARKER = "role_permissions"
+
+
+@dataclass(frozen=True)
+class RolePermissionEntry:
+    id: int
+    role: str
+    permission: str
+    created_at: datetime
+
+
+@dataclass(frozen=True)
+class PermissionSnapshot:
+    """The whole role_permissions table as loaded at one sync_markers version."""
+
+    version: int
+    entries: tuple[RolePermissionEntry, ...]
+    matrix: frozenset[tuple[str, str]] = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "matrix", frozenset((e.role, e.permission) for e in self.entries))
+
+    def allows(self, role: str, permission: str) -> bool:
+        return (role, permission) in self.matrix
+
+    def for_role(self, role: Optional[str] = None) -> list[RolePermissionEntry]:
+        return [e for e in self.entries if not role or e.role == role]
+
+
+_lock = threading.Lock()
+_snapshot: Optional[PermissionSnapshot] = None
+_checked_at = 0.0
+
+
+def current_snapshot() -> Optional[PermissionSnapshot]:
+    """The loaded snapshot, or None when it is missing or due for a version check."""
+    with _lock:
+        if _snapshot is None:
+            return None
+        if time.monotonic() - _checked_at >= settings.permission_version_check_seconds:
+            return None
+        return _snapshot
+
+
+def loaded_snapshot() -> Optional[PermissionSnapshot]:
+    with _lock:
+        return _snapshot
+
+
+def store_snapshot(snapshot: PermissionSnapshot) -> None:
+    """Installs a snapshot (or confirms the current one is up to date) and restarts the check interval."""
+    global _snapshot, _checked_at
+    with _lock:
+        _snapshot = snapshot
+        _checked_at = time.monotonic()
@@ -0,0 +1,43 @@
+from typing import Optional
+
+from .config import get_settings
+
+
+settings = get_settings()
+
+
+def _digits(phone: Optional[str]) -> str:
+    return "".join(char for char in (phone or "") if char.isdigit())
+
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """Strips formatting: '+' followed by digits when the input had a leading '+', else digits only."""
+    value = (phone or "").strip()
+    digits = _digits(value)
+    if not digits:
+        return None
+    if value.startswith("+"):
+        return f"+{digits}"
+    return digits
+
+
+def phone_e164(phone: Optional[str]) -> Optional[str]:
+    """
+    Matching key in E.164 form. Bare 10-digit numbers get DEFAULT_PHONE_COUNTRY_CODE;
+    anything else is taken to already include its country code.
+    """
+    normalized = normalize_phone(phone)
+    if not normalized:
+        return None
+    digits = normalized.lstrip("+")
+    if not normalized.startswith("+") and len(digits) == 10 and settings.default_phone_country_code:
+        return f"+{settings.default_phone_country_code}{digits}"
+    return f"+{digits}"
+
+
+def phone_last10(phone: Optional[str]) -> Optional[str]:
+    """Last ten digits, the fallback key for numbers stored without a country code."""
+    digits = _digits(phone)
+    if len(digits) < 10:
+        return None
+    return digits[-10:]
@@ -0,0 +1,52 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from . import models
+from .cache import TTLCache
+from .config import get_settings
+
+
+settings = get_settings()
+
+
+@dataclass(frozen=True)
+class Principal:
+    """
+    The authenticated caller as request handlers see it: identity, role and profile flags.
+    Endpoints that need the full user row (e.g. /auth/me) load it explicitly.
+    """
+
+    id: int
+    role: str
+    email: str
+    name: str
+    has_lawyer_profile: bool
+    has_client_profile: bool
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(
+            id=user.id,
+            role=user.role,
+            email=user.email,
+            name=user.name,
+            has_lawyer_profile=user.lawyer_profile is not None,
+            has_client_profile=user.client_profile is not None,
+        )
+
+
+# Keyed by (user id, token) so a new login never reuses another token's entry.
+_principal_cache = TTLCache(settings.principal_cache_ttl_seconds)
+
+
+def get_cached_principal(user_id: int, token: str) -> Optional[Principal]:
+    return _principal_cache.get((user_id, token))
+
+
+def cache_principal(token: str, principal: Principal) -> None:
+    _principal_cache.set((principal.id, token), principal)
+
+
+def invalidate_principal(user_id: int) -> None:
+    """Call whenever a user's role, profile or existence changes."""
+    _principal_cache.invalidate(lambda key: key[0] == user_id)
@@ -132,11 +132,30 @@ class RequestedDocument(RequestedDocumentBase):
     file_id: Optional[int] = None
     
     file_path: Optional[str] = None
+    file_name: Optional[str] = None
+    file_size: Optional[int] = None
+    file_sha256: Optional[str] = None
     
     class Config:
         from_attributes = True
 
 
+class ResumableUploadCreate(BaseModel):
+    filename: str = Field(..., min_length=1)
+    size: int = Field(..., gt=0)
+
+
+class ResumableUploadStatus(BaseModel):
+    document_id: int
+    filename: str
+    size: int
+    offset: int
+
+
+class ResumableUploadComplete(BaseModel):
+    sha256: Optional[str] = None # Optional client-side checksum to verify against
+
+
 class DocumentRequestCreate(BaseModel):
     # List of required document names/actions
     required_items: List[RequestedDocumentCreate]
@@ -187,7 +206,6 @@ class Message(MessageBase):
     timestamp: datetime
     case_id: int
     sender_id: int
-    is_read: bool 
     channel: str 
     message_type: str # NEW: For frontend display logic
     
@@ -215,6 +233,7 @@ class Notification(BaseModel):
     timestamp: datetime
     case_id: int
     case_title: str
+    sender_id: int
     sender_name: str
     
     class Config:
@@ -245,6 +264,15 @@ class AssignSMSPayload(BaseModel):
     case_id: int
 
 
+class SMSAssignment(BaseModel):
+    sms_id: int
+    case_id: int
+
+
+class BulkAssignSMSPayload(BaseModel):
+    assignments: List[SMSAssignment] = Field(..., min_length=1, max_length=500)
+
+
 class SMSInboxThread(BaseModel):
     client_id: Optional[int] = None
     client_phone_number: str
@@ -0,0 +1,51 @@
+import hashlib
+import os
+from typing import Optional
+
+from ..config import get_settings
+from .storage import document_storage
+
+
+settings = get_settings()
+
+
+def blob_key(sha256: str) -> str:
+    # Two-level fan-out keeps any one directory (or listing prefix) small.
+    return f"blobs/{sha256[:2]}/{sha256}"
+
+
+def place_blob(source_path: str, key: str) -> str:
+    """
+    Hands a freshly uploaded local file to storage under its blob's `key`. When the
+    content is already stored the upload is simply dropped, so duplicates cost no extra
+    bytes. Call while holding the blob row lock, so a concurrent release cannot remove
+    the stored copy in between.
+    """
+    if document_storage.exists(key):
+        if os.path.abspath(source_path) != os.path.abspath(local_upload_path(key)):
+            remove_file(source_path)
+        return key
+    document_storage.put_file(key, source_path)
+    return key
+
+
+def local_upload_path(key: str) -> str:
+    """Where `key` lies under the local upload directory (files stored before the storage backend)."""
+    return os.path.join(settings.upload_directory, key)
+
+
+def remove_file(path: Optional[str]) -> None:
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def hash_file(path: str, chunk_bytes: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as reader:
+        for block in iter(lambda: reader.read(chunk_bytes), b""):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,146 @@
+import datetime
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+from urllib.parse import quote
+
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
+from starlette.datastructures import Headers
+
+from ..config import get_settings
+from .storage import document_storage
+
+
+settings = get_settings()
+
+_SINGLE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def content_disposition(filename: str, inline: bool = False) -> str:
+    disposition = "inline" if inline else "attachment"
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+
+def _http_date(value: datetime.datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return formatdate(value.timestamp(), usegmt=True)
+
+
+def _is_not_modified(request_headers: Headers, etag: Optional[str], last_modified: Optional[str]) -> bool:
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag is None:
+            return False
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag in tags
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _requested_range(request_headers: Headers, size: int, validators: set[str]) -> Optional[tuple[int, int]]:
+    """
+    The inclusive byte range to send, or None for the whole file. Only single ranges are
+    honoured here (multipart ranges get the full body, which RFC 9110 allows); If-Range
+    must match the ETag or Last-Modified.
+    """
+    http_range = request_headers.get("range")
+    if not http_range:
+        return None
+    if_range = request_headers.get("if-range")
+    if if_range is not None and if_range not in validators:
+        return None
+    match = _SINGLE_RANGE.match(http_range.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def serve_stored_file(
+    request_headers: Headers,
+    key: str,
+    filename: str,
+    size: Optional[int],
+    sha256: Optional[str],
+    stored_at: Optional[datetime.datetime],
+    inline: bool = False,
+) -> Response:
+    """
+    Response for a stored document file. Validators come from the database: the ETag is
+    the content SHA-256 and Last-Modified the time the content was first stored, so a
+    matching If-None-Match / If-Modified-Since is answered 304 without touching storage.
+    The bytes are then served, in order of preference, by the object store (presigned
+    redirect), the reverse proxy (X-Accel-Redirect / X-Sendfile), sendfile via
+    FileResponse, or streamed from the backend. Range and If-Range are honoured on every
+    path.
+    """
+    etag = f'"{sha256}"' if sha256 else None
+    last_modified = _http_date(stored_at) if stored_at else None
+    disposition = content_disposition(filename, inline=inline)
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    headers = {"Cache-Control": "private, no-cache"}
+    if etag:
+        headers["ETag"] = etag
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+
+    if _is_not_modified(request_headers, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    if settings.storage_redirect_downloads:
+        # The link is short-lived and minted per request, so it must not be cached.
+        url = document_storage.presign(key, settings.storage_presign_seconds, content_disposition=disposition)
+        if url:
+            return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-store"})
+
+    local_path = document_storage.local_path(key)
+    if local_path is not None:
+        if not os.path.exists(local_path):
+            raise HTTPException(status_code=404, detail="File not found")
+        headers["Content-Disposition"] = disposition
+        if settings.download_offload == "x-accel-redirect":
+            # nginx serves the file (with ranges and conditionals) from its internal location.
+            headers["X-Accel-Redirect"] = f"{settings.download_accel_prefix}/{quote(key)}"
+            return Response(media_type=media_type, headers=headers)
+        if settings.download_offload == "x-sendfile":
+            headers["X-Sendfile"] = os.path.abspath(local_path)
+            return Response(media_type=media_type, headers=headers)
+        # FileResponse handles Range/If-Range itself and uses the zero-copy pathsend
+        # extension where the server offers it.
+        return FileResponse(local_path, media_type=media_type, headers=headers)
+
+    validators = {value for value in (etag, last_modified) if value}
+    byte_range = _requested_range(request_headers, size, validators) if size else None
+    try:
+        chunks = document_storage.stream(key, byte_range=byte_range)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    headers["Content-Disposition"] = disposition
+    if size:
+        headers["Accept-Ranges"] = "bytes"
+    if byte_range is None:
+        if size is not None:
+            headers["Content-Length"] = str(size)
+        return StreamingResponse(chunks, media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(chunks, status_code=206, media_type=media_type, headers=headers)
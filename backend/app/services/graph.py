@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ..cache import TTLCache
+from ..config import get_settings
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+GRAPH_MEMBER_GROUPS_URL = "https://graph.microsoft.com/v1.0/me/getMemberGroups"
+GRAPH_MEMBER_OF_URL = "https://graph.microsoft.com/v1.0/me/memberOf?$select=id,displayName"
+
+
+class GraphUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive outage-type failures and rejects calls
+    for `reset_seconds`; then lets a single trial call through (half-open) and closes
+    again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial_in_flight or time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("Microsoft Graph circuit opened after %s failures", self._failures)
+                self._opened_at = time.monotonic()
+
+
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=settings.graph_pool_size))
+_executor = ThreadPoolExecutor(max_workers=settings.graph_pool_size, thread_name_prefix="graph")
+graph_breaker = CircuitBreaker(settings.graph_breaker_failures, settings.graph_breaker_reset_seconds)
+# (aad object id, ids fetched, names fetched) -> (group ids, group names)
+_group_cache = TTLCache(settings.azure_group_sync_ttl_seconds)
+
+
+def _graph_request(method: str, url: str, access_token: str, **kwargs) -> dict:
+    if not graph_breaker.allow():
+        raise GraphUnavailable("Microsoft Graph circuit is open")
+    try:
+        response = _session.request(
+            method,
+            url,
+            headers={"Authorization": f"Bearer {access_token}"},
+            timeout=settings.graph_timeout_seconds,
+            **kwargs,
+        )
+    except requests.RequestException:
+        graph_breaker.record_failure()
+        raise
+    if response.status_code >= 500 or response.status_code == 429:
+        graph_breaker.record_failure()
+    else:
+        # A 4xx (e.g. missing consent) is a configuration problem, not an outage.
+        graph_breaker.record_success()
+    response.raise_for_status()
+    return response.json()
+
+
+def fetch_group_ids(access_token: str) -> Optional[list[str]]:
+    try:
+        data = _graph_request("POST", GRAPH_MEMBER_GROUPS_URL, access_token, json={"securityEnabledOnly": False})
+        values = data.get("value", [])
+        if isinstance(values, list):
+            return [str(value) for value in values]
+        return []
+    except Exception as exc:
+        logger.warning("Failed to fetch Azure groups from Graph: %s", exc)
+    return None
+
+
+def fetch_group_names(access_token: str) -> Optional[list[str]]:
+    try:
+        data = _graph_request("GET", GRAPH_MEMBER_OF_URL, access_token)
+        values = data.get("value", [])
+        if not isinstance(values, list):
+            return []
+        names: list[str] = []
+        for value in values:
+            if not isinstance(value, dict):
+                continue
+            display_name = value.get("displayName")
+            if display_name:
+                names.append(str(display_name))
+        return names
+    except Exception as exc:
+        logger.warning("Failed to fetch Azure group names from Graph: %s", exc)
+    return None
+
+
+def resolve_graph_groups(
+    aad_object_id: str,
+    access_token: Optional[str],
+    fetch_ids: bool,
+    fetch_names: bool,
+) -> tuple[list[str], list[str]]:
+    """
+    Group ids and/or display names for the signed-in user. Both Graph calls run
+    concurrently on the pooled session; complete results are cached per object id
+    for AZURE_GROUP_SYNC_TTL_SECONDS. Failed or skipped (circuit open) calls come
+    back empty and are not cached.
+    """
+    if not access_token or not (fetch_ids or fetch_names):
+        return [], []
+
+    cache_key = (aad_object_id, fetch_ids, fetch_names)
+    cached = _group_cache.get(cache_key)
+    if cached is not None:
+        return list(cached[0]), list(cached[1])
+
+    ids_future = _executor.submit(fetch_group_ids, access_token) if fetch_ids else None
+    names_future = _executor.submit(fetch_group_names, access_token) if fetch_names else None
+    group_ids = ids_future.result() if ids_future else []
+    group_names = names_future.result() if names_future else []
+
+    if group_ids is not None and group_names is not None:
+        _group_cache.set(cache_key, (tuple(group_ids), tuple(group_names)))
+    return group_ids or [], group_names or []
@@ -0,0 +1,185 @@
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+from jose import jwk
+from jose.backends.base import Key
+
+from ..config import get_settings
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+_MAX_TTL_SECONDS = 24 * 60 * 60
+# Entries are refreshed in the background once this share of their lifetime has passed.
+_REFRESH_AT_FRACTION = 0.8
+
+
+@dataclass(frozen=True)
+class _KeySet:
+    keys: dict[str, Key]
+    fetched_at: float
+    expires_at: float
+
+    @property
+    def refresh_at(self) -> float:
+        return self.fetched_at + (self.expires_at - self.fetched_at) * _REFRESH_AT_FRACTION
+
+
+class AzureKeyCache:
+    """
+    Signing keys for Azure AD tokens, cached per tenant and kid as parsed keys.
+
+    Lifetimes follow the Cache-Control max-age Microsoft sends (TTL fallback when it
+    is missing). A background thread refreshes every cached tenant before expiry, so
+    logins normally verify without a network round-trip; an unknown kid forces a
+    refetch at most once per min_refetch_seconds per tenant (key rollover).
+    """
+
+    def __init__(self, authority: str, default_ttl_seconds: float, min_refetch_seconds: float, timeout: float = 10):
+        self.authority = authority.rstrip("/")
+        self.default_ttl_seconds = default_ttl_seconds
+        self.min_refetch_seconds = min_refetch_seconds
+        self.timeout = timeout
+        self._session = requests.Session()
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._key_sets: dict[str, _KeySet] = {}
+        self._jwks_uris: dict[str, tuple[str, float]] = {}
+        self._last_forced: dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, tenants: list[str]):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(tenants,), name="azure-jwks-refresh", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def get_signing_key(self, tenant: str, kid: str) -> Optional[Key]:
+        key_set = self._key_sets.get(tenant)
+        if key_set is None or key_set.expires_at <= time.monotonic():
+            # First use, or the background refresh has not kept up; keep stale keys on failure.
+            key_set = self._refresh(tenant, fallback=key_set)
+        key = key_set.keys.get(kid) if key_set else None
+        if key is None and self._may_force_refetch(tenant):
+            logger.info("Azure JWKS: kid %s not cached for tenant %s, refetching", kid, tenant)
+            key_set = self._refresh(tenant, fallback=key_set)
+            key = key_set.keys.get(kid) if key_set else None
+        return key
+
+    def _may_force_refetch(self, tenant: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_forced.get(tenant)
+            if last is not None and now - last < self.min_refetch_seconds:
+                return False
+            self._last_forced[tenant] = now
+            return True
+
+    def _refresh(self, tenant: str, fallback: Optional[_KeySet] = None) -> Optional[_KeySet]:
+        started = time.monotonic()
+        with self._fetch_lock:
+            current = self._key_sets.get(tenant)
+            if current is not None and current.fetched_at >= started:
+                # Another caller refreshed while we waited.
+                return current
+            try:
+                key_set = self._fetch_key_set(tenant)
+            except Exception as exc:
+                logger.error("Azure JWKS: refresh for tenant %s failed: %s", tenant, exc)
+                return current or fallback
+            self._key_sets[tenant] = key_set
+        with self._lock:
+            # Any successful fetch counts towards the kid-miss refetch interval.
+            self._last_forced[tenant] = key_set.fetched_at
+        return key_set
+
+    def _fetch_key_set(self, tenant: str) -> _KeySet:
+        response = self._session.get(self._jwks_uri(tenant), timeout=self.timeout)
+        response.raise_for_status()
+        keys: dict[str, Key] = {}
+        for key_data in response.json().get("keys", []):
+            kid = key_data.get("kid")
+            if not kid or key_data.get("kty") != "RSA" or key_data.get("use", "sig") != "sig":
+                continue
+            try:
+                keys[kid] = jwk.construct(key_data, algorithm=key_data.get("alg", "RS256"))
+            except Exception as exc:
+                logger.warning("Azure JWKS: skipping unparsable key %s: %s", kid, exc)
+        now = time.monotonic()
+        ttl = self._ttl_from(response)
+        logger.info("Azure JWKS: tenant=%s keys=%s ttl=%ss", tenant, len(keys), int(ttl))
+        return _KeySet(keys=keys, fetched_at=now, expires_at=now + ttl)
+
+    def _jwks_uri(self, tenant: str) -> str:
+        cached = self._jwks_uris.get(tenant)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        default_uri = f"{self.authority}/{tenant}/discovery/v2.0/keys"
+        try:
+            response = self._session.get(
+                f"{self.authority}/{tenant}/v2.0/.well-known/openid-configuration",
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            jwks_uri = response.json().get("jwks_uri") or default_uri
+            self._jwks_uris[tenant] = (jwks_uri, time.monotonic() + self._ttl_from(response))
+            return jwks_uri
+        except Exception as exc:
+            logger.warning("Azure JWKS: OpenID metadata for tenant %s unavailable (%s), using %s", tenant, exc, default_uri)
+            return default_uri
+
+    def _ttl_from(self, response: requests.Response) -> float:
+        cache_control = (response.headers.get("Cache-Control") or "").lower()
+        match = _MAX_AGE_RE.search(cache_control)
+        if not match or "no-store" in cache_control or "no-cache" in cache_control:
+            ttl = self.default_ttl_seconds
+        else:
+            ttl = float(match.group(1))
+        return min(max(ttl, self.min_refetch_seconds), _MAX_TTL_SECONDS)
+
+    def _run(self, tenants: list[str]):
+        for tenant in tenants:
+            if self._stop.is_set():
+                return
+            self._refresh(tenant)
+        # A failed refresh leaves refresh_at in the past; retry no faster than the refetch interval.
+        retry_at: dict[str, float] = {}
+        while not self._stop.is_set():
+            due_times = {}
+            for tenant, key_set in dict(self._key_sets).items():
+                due_times[tenant] = max(key_set.refresh_at, retry_at.get(tenant, 0.0))
+            now = time.monotonic()
+            for tenant, due in due_times.items():
+                if due <= now:
+                    key_set = self._refresh(tenant)
+                    if key_set is None or key_set.fetched_at < now:
+                        retry_at[tenant] = time.monotonic() + self.min_refetch_seconds
+                    else:
+                        retry_at.pop(tenant, None)
+                    due_times[tenant] = max(key_set.refresh_at if key_set else 0.0, retry_at.get(tenant, 0.0))
+            next_due = min(due_times.values()) if due_times else now + self.min_refetch_seconds
+            self._stop.wait(max(next_due - time.monotonic(), 1.0))
+
+
+azure_keys = AzureKeyCache(
+    authority=settings.azure_authority_host,
+    default_ttl_seconds=settings.jwks_cache_ttl_seconds,
+    min_refetch_seconds=settings.jwks_min_refetch_seconds,
+)
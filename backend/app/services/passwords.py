@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from ..config import get_settings
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# How often an async caller re-checks for a free slot while the queue is full.
+SLOT_POLL_SECONDS = 0.02
+
+
+# --- Runs inside the pool's worker processes ----------------------------------------
+
+@lru_cache(maxsize=None)
+def _context(rounds: int) -> CryptContext:
+    # Pinning min/max rounds to the configured cost makes verify_and_update return a
+    # fresh hash for anything hashed at a different cost.
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+def _hash(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str, rounds: int) -> tuple[bool, Optional[str]]:
+    try:
+        return _context(rounds).verify_and_update(password, hashed_password)
+    except (ValueError, TypeError):
+        # Unknown or malformed hash: treat as a failed login rather than a server error.
+        return False, None
+
+
+def _warm_up() -> None:
+    return None
+
+
+# --- Request side -------------------------------------------------------------------
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a bounded process pool so a burst of logins neither holds the GIL
+    nor fills FastAPI's request threadpool with CPU work. At most `max_pending` calls
+    are in flight or queued; callers past that wait up to `queue_timeout_seconds`
+    for a slot and then get a 503. Async routes (the login) use verify_and_update_async,
+    which await the pool instead of blocking a thread on it.
+
+    The pool only exists between start() and stop() (the app's startup/shutdown);
+    scripts such as seed.py hash in the calling thread instead of spawning workers.
+    """
+
+    def __init__(self, workers: int, max_pending: int, queue_timeout_seconds: float, rounds: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.rounds = rounds
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._running = False
+        self._in_flight = 0
+        self._waiting = 0
+        self._rejected = 0
+        self._completed = 0
+
+    def start(self):
+        with self._lock:
+            self._running = True
+            if self._pool is None:
+                # spawn: the app process runs threads (listeners, caches) that must not be forked.
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            pool = self._pool
+        # Start the worker processes now rather than on the first login.
+        try:
+            for future in [pool.submit(_warm_up) for _ in range(self.workers)]:
+                future.result()
+        except BrokenProcessPool:
+            logger.error("Password hashing pool failed to start; hashing in request threads")
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _restart(self):
+        with self._lock:
+            if not self._running:
+                return
+        self.start()
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password, self.rounds)
+
+    def verify_and_update(self, password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        """(valid, new_hash); new_hash is set when the stored hash used a different cost."""
+        return self._run(_verify_and_update, password, hashed_password, self.rounds)
+
+    async def verify_and_update_async(self, password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        return await self._run_async(_verify_and_update, password, hashed_password, self.rounds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "in_flight": self._in_flight,
+                "waiting": self._waiting,
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+
+    def _run(self, fn, *args):
+        with self._lock:
+            self._waiting += 1
+        self._admit(self._slots.acquire(timeout=self.queue_timeout_seconds))
+        try:
+            pool = self._pool
+            if pool is None:
+                return fn(*args)
+            try:
+                return pool.submit(fn, *args).result()
+            except BrokenProcessPool:
+                self._pool_broke(pool)
+                return fn(*args)
+        finally:
+            self._finish()
+
+    async def _run_async(self, fn, *args):
+        with self._lock:
+            self._waiting += 1
+        deadline = time.monotonic() + self.queue_timeout_seconds
+        acquired = self._slots.acquire(blocking=False)
+        while not acquired and time.monotonic() < deadline:
+            await asyncio.sleep(SLOT_POLL_SECONDS)
+            acquired = self._slots.acquire(blocking=False)
+        self._admit(acquired)
+        try:
+            pool = self._pool
+            if pool is None:
+                return await asyncio.to_thread(fn, *args)
+            try:
+                return await asyncio.wrap_future(pool.submit(fn, *args))
+            except BrokenProcessPool:
+                self._pool_broke(pool)
+                return await asyncio.to_thread(fn, *args)
+        finally:
+            self._finish()
+
+    def _admit(self, acquired: bool):
+        with self._lock:
+            self._waiting -= 1
+            if not acquired:
+                self._rejected += 1
+            else:
+                self._in_flight += 1
+        if not acquired:
+            logger.warning("Password hashing queue full (%s pending)", self.max_pending)
+            raise HTTPException(status_code=503, detail="Too many sign-in attempts right now. Please retry.")
+
+    def _finish(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+        self._slots.release()
+
+    def _pool_broke(self, pool: ProcessPoolExecutor):
+        # A worker died (e.g. OOM-killed); start a fresh pool and serve this call inline.
+        logger.error("Password hashing pool broke, restarting it")
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        threading.Thread(target=self._restart, name="password-pool-restart", daemon=True).start()
+
+
+password_hasher = PasswordHasher(
+    workers=settings.password_hash_workers,
+    max_pending=settings.password_hash_max_pending,
+    queue_timeout_seconds=settings.password_hash_queue_timeout_seconds,
+    rounds=settings.bcrypt_rounds,
+)
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from .. import database
+from ..config import get_settings
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+DeliverCallback = Callable[[str, str], Awaitable[None]]
+
+# NOTIFY payloads are capped at 8000 bytes; larger envelopes are split into chunks.
+NOTIFY_CHUNK_CHARS = 3000
+PARTIAL_TTL_SECONDS = 30
+RECONNECT_MAX_DELAY_SECONDS = 30
+LISTEN_POLL_SECONDS = 1.0
+
+
+class InProcessPubSub:
+    """Default backend: the publishing process already delivered to its own sockets."""
+
+    name = "memory"
+
+    async def start(self, deliver: DeliverCallback) -> None:
+        return None
+
+    async def publish(self, room: str, message: str) -> None:
+        return None
+
+    async def stop(self) -> None:
+        return None
+
+
+class PostgresPubSub:
+    """
+    Fans broadcasts out to every worker through Postgres LISTEN/NOTIFY.
+    Each process delivers its own broadcasts locally and skips them when they come back.
+    """
+
+    name = "postgres"
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        self._deliver: Optional[DeliverCallback] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listener: Optional[threading.Thread] = None
+        self._partials: Dict[Tuple[str, str], Tuple[float, List[Optional[str]]]] = {}
+        self._stopping = threading.Event()
+
+    async def start(self, deliver: DeliverCallback) -> None:
+        self._deliver = deliver
+        self._loop = asyncio.get_running_loop()
+        self._stopping.clear()
+        self._listener = threading.Thread(target=self._listen_forever, name="realtime-pubsub", daemon=True)
+        self._listener.start()
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        if self._listener:
+            await asyncio.to_thread(self._listener.join, LISTEN_POLL_SECONDS * 2)
+            self._listener = None
+
+    async def publish(self, room: str, message: str) -> None:
+        envelope = json.dumps({"origin": self.origin, "room": room, "message": message})
+        payloads = self._chunk(envelope)
+        try:
+            await asyncio.to_thread(self._notify, payloads)
+        except Exception as exc:
+            logger.error("Realtime pub/sub failed to publish to %s: %s", room, exc)
+
+    def _chunk(self, envelope: str) -> List[str]:
+        if len(envelope) <= NOTIFY_CHUNK_CHARS:
+            return [envelope]
+        message_id = uuid.uuid4().hex
+        pieces = [envelope[i:i + NOTIFY_CHUNK_CHARS] for i in range(0, len(envelope), NOTIFY_CHUNK_CHARS)]
+        return [
+            json.dumps({
+                "origin": self.origin,
+                "chunk": message_id,
+                "seq": seq,
+                "total": len(pieces),
+                "data": piece,
+            })
+            for seq, piece in enumerate(pieces)
+        ]
+
+    def _notify(self, payloads: List[str]) -> None:
+        with database.engine.connect() as conn:
+            for payload in payloads:
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": payload})
+            conn.commit()
+
+    def _open_listener(self):
+        # The LISTEN connection lives for the whole worker, so it is opened outside the shared pool.
+        dialect = database.engine.dialect
+        cargs, cparams = dialect.create_connect_args(database.engine.url)
+        conn = dialect.loaded_dbapi.connect(*cargs, **cparams)
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        return conn
+
+    def _listen_forever(self) -> None:
+        delay = 1
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = self._open_listener()
+                logger.info("Realtime pub/sub listening on Postgres channel %s", self.channel)
+                delay = 1
+                while not self._stopping.is_set():
+                    readable, _, _ = select.select([conn], [], [], LISTEN_POLL_SECONDS)
+                    if not readable:
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self._loop.call_soon_threadsafe(self._handle_payload, notify.payload)
+            except Exception as exc:
+                logger.warning("Realtime pub/sub lost its Postgres connection: %s", exc)
+                self._stopping.wait(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY_SECONDS)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def _handle_payload(self, payload: str) -> None:
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            logger.warning("Realtime pub/sub received a malformed payload")
+            return
+        if data.get("origin") == self.origin:
+            return
+        if "chunk" in data:
+            data = self._assemble(data)
+            if data is None:
+                return
+        room = data.get("room")
+        message = data.get("message")
+        if room and message is not None and self._deliver:
+            self._loop.create_task(self._deliver(room, message))
+
+    def _assemble(self, chunk: dict) -> Optional[dict]:
+        now = time.monotonic()
+        for key in [key for key, (started, _) in self._partials.items() if now - started > PARTIAL_TTL_SECONDS]:
+            del self._partials[key]
+
+        key = (chunk["origin"], chunk["chunk"])
+        started, pieces = self._partials.setdefault(key, (now, [None] * int(chunk["total"])))
+        pieces[int(chunk["seq"])] = chunk["data"]
+        if any(piece is None for piece in pieces):
+            return None
+        del self._partials[key]
+        try:
+            return json.loads("".join(pieces))
+        except ValueError:
+            logger.warning("Realtime pub/sub failed to reassemble a chunked payload")
+            return None
+
+
+def create_pubsub_backend():
+    backend = settings.realtime_backend
+    if backend == "memory":
+        return InProcessPubSub()
+    if backend == "postgres":
+        if not database.engine.url.get_backend_name().startswith("postgresql"):
+            raise RuntimeError("REALTIME_BACKEND=postgres requires a PostgreSQL DATABASE_URL")
+        return PostgresPubSub(settings.realtime_channel)
+    raise RuntimeError(f"Unsupported REALTIME_BACKEND: {backend}")
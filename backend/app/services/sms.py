@@ -1,30 +1,426 @@
+import asyncio
 import logging
-from twilio.rest import Client
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 
+import requests
+from requests.adapters import HTTPAdapter
+
+from .. import crud, database
 from ..config import get_settings
+from .wal import WALSegment, WriteAheadLog
 
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+_MAX_RETRY_DELAY_SECONDS = 15 * 60
+
 
 if not all([settings.twilio_account_sid, settings.twilio_auth_token, settings.twilio_phone_number]):
     logger.warning("Twilio configuration missing. SMS functionality will not work.")
-    _twilio_client = None
-else:
-    _twilio_client = Client(settings.twilio_account_sid, settings.twilio_auth_token)
-
-
-def send_sms(to_number: str, body: str):
-    if not _twilio_client:
-        logger.info("SMS SIMULATION to %s: %s", to_number, body)
-        return
-    try:
-        message = _twilio_client.messages.create(
-            body=body,
-            from_=settings.twilio_phone_number,
-            to=to_number,
-        )
-        logger.info("SMS Sent (SID: %s) to %s", message.sid, to_number)
-    except Exception as e:
-        logger.error("Failed to send SMS to %s: %s", to_number, str(e))
+
+
+class SMSSendError(Exception):
+    def __init__(self, message: str, retryable: bool, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class _QueuedSMS:
+    id: int
+    to_number: str
+    from_number: str
+    body: str
+    attempts: int
+
+
+class TwilioSender:
+    """Posts messages to Twilio's REST API over a pooled session (base URL is configurable)."""
+
+    def __init__(self, base_url: str, account_sid: Optional[str], auth_token: Optional[str], timeout: float, pool_size: int):
+        self.base_url = base_url
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.timeout = timeout
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self._session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.account_sid and self.auth_token)
+
+    def send(self, to_number: str, from_number: str, body: str) -> tuple[str, Optional[str]]:
+        """Returns (message sid, Twilio status); raises SMSSendError."""
+        data = {"To": to_number, "From": from_number, "Body": body}
+        if settings.twilio_status_callback_url:
+            data["StatusCallback"] = settings.twilio_status_callback_url
+        try:
+            response = self._session.post(
+                f"{self.base_url}/2010-04-01/Accounts/{self.account_sid}/Messages.json",
+                data=data,
+                auth=(self.account_sid, self.auth_token),
+                timeout=self.timeout,
+            )
+        except requests.RequestException as exc:
+            raise SMSSendError(f"Twilio request failed: {exc}", retryable=True) from exc
+
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {}
+        if response.status_code >= 400:
+            message = f"Twilio {response.status_code} (code {payload.get('code')}): {payload.get('message') or response.text[:200]}"
+            retry_after = None
+            if response.headers.get("Retry-After", "").isdigit():
+                retry_after = float(response.headers["Retry-After"])
+            # 429 / 5xx are transient; other 4xx (bad number, opted out, ...) will not succeed on retry.
+            retryable = response.status_code == 429 or response.status_code >= 500
+            raise SMSSendError(message, retryable=retryable, retry_after=retry_after)
+        sid = payload.get("sid")
+        if not sid:
+            raise SMSSendError("Twilio response carried no message sid", retryable=True)
+        return str(sid), payload.get("status")
+
+
+class _NumberRateLimiter:
+    """Spaces sends from each sender number to `per_second` (event-loop only, so no locking)."""
+
+    def __init__(self, per_second: float):
+        self.interval = 1.0 / per_second if per_second > 0 else 0.0
+        self._next_slot: dict[str, float] = {}
+
+    async def wait(self, number: str):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next_slot.get(number, 0.0))
+        self._next_slot[number] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def back_off(self, number: str, seconds: float):
+        loop = asyncio.get_running_loop()
+        self._next_slot[number] = max(self._next_slot.get(number, 0.0), loop.time() + seconds)
+
+
+class OutboundSMSDispatcher:
+    """
+    Sends the outbound_sms queue. A poller claims due rows in batches of `batch_size`
+    (crud.claim_outbound_sms) and hands them to `workers` send tasks; each sender number
+    is held to `rate_per_number` messages per second (per app process). Transient Twilio
+    failures are retried with jittered exponential backoff up to `max_attempts`.
+
+    Handlers only insert a row and call notify(), so they never wait on Twilio; rows
+    left 'sending' by a crashed process are picked up again once their lease expires.
+    """
+
+    def __init__(
+        self,
+        sender: TwilioSender,
+        workers: int,
+        batch_size: int,
+        poll_interval_seconds: float,
+        rate_per_number: float,
+        max_attempts: int,
+        retry_base_seconds: float,
+    ):
+        self.sender = sender
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.poll_interval_seconds = poll_interval_seconds
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        # Long enough for a full batch to drain through the rate limit and a slow send.
+        per_number = rate_per_number if rate_per_number > 0 else float("inf")
+        self.lease = timedelta(seconds=self.batch_size / per_number + sender.timeout * 2 + 30)
+        self._limiter = _NumberRateLimiter(rate_per_number)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._queue: Optional[asyncio.Queue[_QueuedSMS]] = None
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._queue = asyncio.Queue(maxsize=self.batch_size)
+        self._tasks = [asyncio.create_task(self._poll())]
+        self._tasks += [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def notify(self):
+        """Wakes the poller after an enqueue; safe to call from any thread."""
+        loop, wakeup = self._loop, self._wakeup
+        if loop is None or wakeup is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(wakeup.set)
+
+    def _claim(self, limit: int) -> list[_QueuedSMS]:
+        db = database.SessionLocal()
+        try:
+            return [
+                _QueuedSMS(
+                    id=row.id,
+                    to_number=row.to_number,
+                    from_number=row.from_number or settings.twilio_phone_number or "",
+                    body=row.body,
+                    attempts=row.attempts,
+                )
+                for row in crud.claim_outbound_sms(db, limit, self.lease)
+            ]
+        finally:
+            db.close()
+
+    def _record(self, sms_id: int, **values):
+        db = database.SessionLocal()
+        try:
+            crud.record_outbound_sms_attempt(db, sms_id, **values)
+        finally:
+            db.close()
+
+    async def _poll(self):
+        while True:
+            try:
+                # Claim only what the workers can start on soon, so leases stay short.
+                room = self._queue.maxsize - self._queue.qsize()
+                claimed = await asyncio.to_thread(self._claim, room) if room > 0 else []
+                for item in claimed:
+                    await self._queue.put(item)
+                if claimed and len(claimed) == room:
+                    await self._queue.join()
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Claiming outbound SMS failed")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._deliver(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Outbound SMS %s: unexpected error", item.id)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, item: _QueuedSMS):
+        if item.attempts > self.max_attempts:
+            # Only reachable through expired leases, i.e. sends that kept dying mid-flight.
+            logger.error("Outbound SMS %s to %s abandoned after %s attempts", item.id, item.to_number, item.attempts - 1)
+            await asyncio.to_thread(self._record, item.id, status="failed", error="Send did not complete")
+            return
+        if not self.sender.configured or not item.from_number:
+            logger.info("SMS SIMULATION to %s: %s", item.to_number, item.body)
+            await asyncio.to_thread(self._record, item.id, status="sent", delivery_status="simulated")
+            return
+
+        await self._limiter.wait(item.from_number)
+        try:
+            sid, twilio_status = await asyncio.to_thread(self.sender.send, item.to_number, item.from_number, item.body)
+        except SMSSendError as exc:
+            if exc.retry_after:
+                self._limiter.back_off(item.from_number, exc.retry_after)
+            if exc.retryable and item.attempts < self.max_attempts:
+                delay = exc.retry_after or self._backoff(item.attempts)
+                logger.warning("Outbound SMS %s to %s failed (attempt %s), retrying in %.1fs: %s", item.id, item.to_number, item.attempts, delay, exc)
+                retry_at = datetime.now(timezone.utc) + timedelta(seconds=delay)
+                await asyncio.to_thread(self._record, item.id, status="queued", error=str(exc), retry_at=retry_at)
+            else:
+                logger.error("Outbound SMS %s to %s failed permanently after %s attempt(s): %s", item.id, item.to_number, item.attempts, exc)
+                await asyncio.to_thread(self._record, item.id, status="failed", error=str(exc))
+            return
+
+        logger.info("SMS Sent (SID: %s) to %s", sid, item.to_number)
+        await asyncio.to_thread(self._record, item.id, status="sent", provider_sid=sid, delivery_status=twilio_status)
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.retry_base_seconds * (2 ** max(attempts - 1, 0)), _MAX_RETRY_DELAY_SECONDS)
+        return delay * random.uniform(0.5, 1.0)
+
+
+sms_dispatcher = OutboundSMSDispatcher(
+    sender=TwilioSender(
+        base_url=settings.twilio_api_base_url,
+        account_sid=settings.twilio_account_sid,
+        auth_token=settings.twilio_auth_token,
+        timeout=settings.sms_send_timeout_seconds,
+        pool_size=settings.sms_dispatch_workers,
+    ),
+    workers=settings.sms_dispatch_workers,
+    batch_size=settings.sms_batch_size,
+    poll_interval_seconds=settings.sms_poll_interval_seconds,
+    rate_per_number=settings.sms_rate_per_number,
+    max_attempts=settings.sms_max_attempts,
+    retry_base_seconds=settings.sms_retry_base_seconds,
+)
+
+
+class InboundSMSWriter:
+    """
+    Moves acknowledged inbound webhooks from the write-ahead log into awaiting_sms.
+    The webhook only appends to `wal` and answers Twilio; every `flush_seconds` (or
+    sooner once `batch_size` records are waiting) this rotates the log and stores the
+    closed segment with crud.store_inbound_sms_batch. A segment is deleted only after
+    its rows are committed, and replays are deduplicated on MessageSid, so a crash at
+    any point loses nothing that Twilio was told was received.
+    """
+
+    def __init__(self, wal: WriteAheadLog, flush_seconds: float, batch_size: int):
+        self.wal = wal
+        self.flush_seconds = flush_seconds
+        self.batch_size = max(1, batch_size)
+        self._backlog: list[WALSegment] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self):
+        if self._task:
+            return
+        await asyncio.to_thread(self.wal.open)
+        self._backlog = await asyncio.to_thread(self.wal.orphans)
+        if self._backlog:
+            logger.info("Replaying %s inbound SMS log segment(s)", len(self._backlog))
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Final inbound SMS flush failed; the log is replayed on next start")
+        for segment in self._backlog:
+            segment.release()
+        self._backlog = []
+        await asyncio.to_thread(self.wal.close)
+
+    def append(self, message_sid: Optional[str], from_number: str, body: str):
+        pending = self.wal.append({
+            "message_sid": message_sid,
+            "from": from_number,
+            "body": body,
+            "received_at": datetime.now(timezone.utc).isoformat(),
+        })
+        if pending >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        segment = self.wal.rotate()
+        if segment:
+            self._backlog.append(segment)
+        stored = 0
+        while self._backlog:
+            segment = self._backlog[0]
+            stored += await asyncio.to_thread(self._store_segment, segment)
+            self._backlog.pop(0)
+            segment.discard()
+        return stored
+
+    def _store_segment(self, segment: WALSegment) -> int:
+        records = segment.read()
+        db = database.SessionLocal()
+        try:
+            stored = 0
+            for start in range(0, len(records), self.batch_size):
+                stored += crud.store_inbound_sms_batch(db, records[start:start + self.batch_size])
+            return stored
+        finally:
+            db.close()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                stored = await self.flush()
+                if stored:
+                    logger.info("Stored %s inbound SMS", stored)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Segments stay in the backlog and are retried on the next tick.
+                logger.exception("Storing inbound SMS failed")
+                await asyncio.sleep(max(self.flush_seconds, 1.0))
+
+
+inbound_sms_writer = InboundSMSWriter(
+    wal=WriteAheadLog(settings.sms_webhook_wal_dir, prefix="inbound-sms", fsync=settings.sms_webhook_wal_fsync),
+    flush_seconds=settings.sms_webhook_flush_seconds,
+    batch_size=settings.sms_webhook_batch_size,
+)
+
+
+class PendingSMSReconciler:
+    """
+    Periodically runs crud.reconcile_new_pending_sms. Phone changes link pending SMS
+    directly; this sweep only catches rows that raced one, so inbox reads never reconcile.
+    """
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        if self._task or self.interval_seconds <= 0:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def run_once(self) -> int:
+        db = database.SessionLocal()
+        try:
+            return crud.reconcile_new_pending_sms(db)
+        finally:
+            db.close()
+
+    async def _run(self):
+        while True:
+            try:
+                matched = await asyncio.to_thread(self.run_once)
+                if matched:
+                    logger.info("Linked %s pending SMS to clients", matched)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Pending SMS reconciliation failed")
+            await asyncio.sleep(self.interval_seconds)
+
+
+sms_reconciler = PendingSMSReconciler(settings.sms_reconcile_interval_seconds)
@@ -0,0 +1,314 @@
+import abc
+import base64
+import datetime
+import hashlib
+import hmac
+import logging
+import os
+import shutil
+from email.utils import formatdate
+from typing import Iterator, Optional
+from urllib.parse import quote, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ..config import get_settings
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+STREAM_CHUNK_BYTES = 1024 * 1024
+
+
+class StorageError(Exception):
+    pass
+
+
+class StorageBackend(abc.ABC):
+    """
+    Where stored document files live, addressed by slash-separated keys such as
+    "blobs/ab/ab12...". Uploads are received on local disk first and handed over with
+    put_file(); everything after that goes through this interface.
+    """
+
+    @abc.abstractmethod
+    def put_file(self, key: str, source_path: str) -> None:
+        """Stores the local file under `key` and removes the local copy."""
+
+    @abc.abstractmethod
+    def exists(self, key: str) -> bool:
+        """Whether `key` is stored."""
+
+    def get(self, key: str) -> bytes:
+        return b"".join(self.stream(key))
+
+    @abc.abstractmethod
+    def stream(
+        self,
+        key: str,
+        chunk_size: int = STREAM_CHUNK_BYTES,
+        byte_range: Optional[tuple[int, int]] = None,
+    ) -> Iterator[bytes]:
+        """The stored bytes, or only the inclusive (first, last) `byte_range`; raises FileNotFoundError."""
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> None:
+        """Removes `key`; a missing key is not an error."""
+
+    def presign(self, key: str, expires_in: float, content_disposition: Optional[str] = None) -> Optional[str]:
+        """A short-lived URL the client can fetch the bytes from directly, or None if unsupported."""
+        return None
+
+    def local_path(self, key: str) -> Optional[str]:
+        """The file's path when it sits on this node's disk, or None."""
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+class LocalStorage(StorageBackend):
+    """Files under `root` on the local filesystem (single node, or a shared volume)."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if os.path.isabs(key) or not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise StorageError(f"Invalid storage key: {key}")
+        return path
+
+    def put_file(self, key: str, source_path: str) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.abspath(source_path) != os.path.abspath(path):
+            shutil.move(source_path, path)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def stream(
+        self,
+        key: str,
+        chunk_size: int = STREAM_CHUNK_BYTES,
+        byte_range: Optional[tuple[int, int]] = None,
+    ) -> Iterator[bytes]:
+        reader = open(self._path(key), "rb")
+        remaining = None
+        if byte_range is not None:
+            reader.seek(byte_range[0])
+            remaining = byte_range[1] - byte_range[0] + 1
+
+        def chunks():
+            nonlocal remaining
+            with reader:
+                while remaining is None or remaining > 0:
+                    block = reader.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                    if not block:
+                        break
+                    if remaining is not None:
+                        remaining -= len(block)
+                    yield block
+
+        return chunks()
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self._path(key)
+
+
+class AzureBlobStorage(StorageBackend):
+    """
+    Blobs in one Azure Storage container, over the REST API with Shared Key auth;
+    presign() returns a read-only service SAS URL. `endpoint` defaults to the public
+    account URL; point it at Azurite (http://127.0.0.1:10000/devstoreaccount1) to test
+    locally.
+    """
+
+    API_VERSION = "2021-08-06"
+
+    def __init__(
+        self,
+        account: str,
+        account_key: str,
+        container: str,
+        endpoint: Optional[str] = None,
+        timeout: float = 30,
+        pool_size: int = 10,
+    ):
+        self.account = account
+        self.container = container
+        self.endpoint = (endpoint or f"https://{account}.blob.core.windows.net").rstrip("/")
+        self.timeout = timeout
+        self._key = base64.b64decode(account_key)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def _blob_path(self, key: str) -> str:
+        # Path as it appears in the URL, including the account segment on emulator endpoints.
+        base_path = requests.utils.urlparse(self.endpoint).path.rstrip("/")
+        return f"{base_path}/{self.container}/{quote(key, safe='/')}"
+
+    def _sign(self, value: str) -> str:
+        return base64.b64encode(hmac.new(self._key, value.encode("utf-8"), hashlib.sha256).digest()).decode()
+
+    def _authorization(self, method: str, path: str, headers: dict) -> str:
+        """Shared Key signature for a request without query parameters."""
+        length = headers.get("Content-Length", "")
+        canonical_headers = "".join(
+            f"{name}:{value.strip()}\n"
+            for name, value in sorted((name.lower(), value) for name, value in headers.items() if name.lower().startswith("x-ms-"))
+        )
+        string_to_sign = "\n".join(
+            [
+                method,
+                "",  # Content-Encoding
+                "",  # Content-Language
+                "" if length in ("", "0") else str(length),
+                "",  # Content-MD5
+                headers.get("Content-Type", ""),
+                "",  # Date (x-ms-date is used instead)
+                "",  # If-Modified-Since
+                "",  # If-Match
+                "",  # If-None-Match
+                "",  # If-Unmodified-Since
+                "",  # Range
+            ]
+        ) + "\n" + canonical_headers + f"/{self.account}{path}"
+        return f"SharedKey {self.account}:{self._sign(string_to_sign)}"
+
+    def _request(self, method: str, key: str, headers: Optional[dict] = None, data=None, stream: bool = False):
+        headers = dict(headers or {})
+        headers["x-ms-date"] = formatdate(usegmt=True)
+        headers["x-ms-version"] = self.API_VERSION
+        headers["Authorization"] = self._authorization(method, self._blob_path(key), headers)
+        url = f"{self.endpoint}/{self.container}/{quote(key, safe='/')}"
+        try:
+            return self._session.request(method, url, headers=headers, data=data, stream=stream, timeout=self.timeout)
+        except requests.RequestException as exc:
+            raise StorageError(f"Azure Blob {method} {key} failed: {exc}") from exc
+
+    @staticmethod
+    def _raise_for_status(response, key: str):
+        if response.status_code >= 400:
+            raise StorageError(f"Azure Blob {response.request.method} {key}: HTTP {response.status_code} {response.text[:200]}")
+
+    def put_file(self, key: str, source_path: str) -> None:
+        size = os.path.getsize(source_path)
+        with open(source_path, "rb") as reader:
+            response = self._request(
+                "PUT",
+                key,
+                headers={
+                    "Content-Length": str(size),
+                    "Content-Type": "application/octet-stream",
+                    "x-ms-blob-type": "BlockBlob",
+                },
+                data=reader,
+            )
+        self._raise_for_status(response, key)
+        os.remove(source_path)
+
+    def exists(self, key: str) -> bool:
+        response = self._request("HEAD", key)
+        if response.status_code == 404:
+            return False
+        self._raise_for_status(response, key)
+        return True
+
+    def stream(
+        self,
+        key: str,
+        chunk_size: int = STREAM_CHUNK_BYTES,
+        byte_range: Optional[tuple[int, int]] = None,
+    ) -> Iterator[bytes]:
+        # The request is made here, not on first iteration, so a missing blob surfaces
+        # before a response has started.
+        headers = {"x-ms-range": f"bytes={byte_range[0]}-{byte_range[1]}"} if byte_range else None
+        response = self._request("GET", key, headers=headers, stream=True)
+        if response.status_code == 404:
+            response.close()
+            raise FileNotFoundError(key)
+        if response.status_code >= 400:
+            response.close()
+            self._raise_for_status(response, key)
+
+        def chunks():
+            try:
+                yield from response.iter_content(chunk_size)
+            finally:
+                response.close()
+
+        return chunks()
+
+    def delete(self, key: str) -> None:
+        response = self._request("DELETE", key)
+        if response.status_code != 404:
+            self._raise_for_status(response, key)
+
+    def presign(self, key: str, expires_in: float, content_disposition: Optional[str] = None) -> Optional[str]:
+        expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=expires_in)
+        params = {
+            "sv": self.API_VERSION,
+            "sr": "b",
+            "sp": "r",
+            "se": expiry.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        if self.endpoint.startswith("https://"):
+            params["spr"] = "https"
+        if content_disposition:
+            params["rscd"] = content_disposition
+        string_to_sign = "\n".join(
+            [
+                params["sp"],
+                "",  # signedStart
+                params["se"],
+                f"/blob/{self.account}/{self.container}/{key}",
+                "",  # signedIdentifier
+                "",  # signedIP
+                params.get("spr", ""),
+                params["sv"],
+                params["sr"],
+                "",  # signedSnapshotTime
+                "",  # signedEncryptionScope
+                "",  # rscc
+                params.get("rscd", ""),
+                "",  # rsce
+                "",  # rscl
+                "",  # rsct
+            ]
+        )
+        params["sig"] = self._sign(string_to_sign)
+        return f"{self.endpoint}/{self.container}/{quote(key, safe='/')}?{urlencode(params, quote_via=quote)}"
+
+    def close(self) -> None:
+        self._session.close()
+
+
+def build_storage() -> StorageBackend:
+    if settings.storage_backend == "azure":
+        if not (settings.azure_storage_account and settings.azure_storage_key and settings.azure_storage_container):
+            raise RuntimeError("STORAGE_BACKEND=azure needs AZURE_STORAGE_ACCOUNT, AZURE_STORAGE_KEY and AZURE_STORAGE_CONTAINER")
+        return AzureBlobStorage(
+            settings.azure_storage_account,
+            settings.azure_storage_key,
+            settings.azure_storage_container,
+            endpoint=settings.azure_storage_endpoint,
+            timeout=settings.storage_timeout_seconds,
+        )
+    if settings.storage_backend != "local":
+        raise RuntimeError(f"Unknown STORAGE_BACKEND: {settings.storage_backend}")
+    return LocalStorage(settings.upload_directory)
+
+
+document_storage = build_storage()
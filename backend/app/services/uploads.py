@@ -0,0 +1,332 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: no cross-process locking, single worker only.
+    fcntl = None
+
+from fastapi import HTTPException, Request
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from .blobs import hash_file
+
+
+# Body bytes collected before they are handed to a worker thread for parsing and writing.
+WRITE_BATCH_BYTES = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class StoredUpload:
+    field_name: str
+    filename: str
+    path: str
+    size: int
+    sha256: str
+
+
+class _FilePart:
+    def __init__(self, field_name: str, filename: str, final_path: str):
+        self.field_name = field_name
+        self.filename = filename
+        self.final_path = final_path
+        directory = os.path.dirname(final_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        # Same directory as the final path, so the closing rename is atomic.
+        fd, self.temp_path = tempfile.mkstemp(prefix=".upload-", suffix=".part", dir=directory)
+        self.handle = os.fdopen(fd, "wb")
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes, max_bytes: int):
+        self.size += len(data)
+        if self.size > max_bytes:
+            raise HTTPException(status_code=413, detail="File too large")
+        self.digest.update(data)
+        self.handle.write(data)
+
+    def close(self):
+        if not self.handle.closed:
+            self.handle.flush()
+            os.fsync(self.handle.fileno())
+            self.handle.close()
+
+    def discard(self):
+        if not self.handle.closed:
+            self.handle.close()
+        try:
+            os.unlink(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+
+async def receive_uploads(
+    request: Request,
+    target_path: Callable[[str, str], Optional[str]],
+    max_bytes: int,
+    allowed_extensions: set[str],
+    max_body_bytes: Optional[int] = None,
+) -> list[StoredUpload]:
+    """
+    Streams a multipart/form-data body straight to disk, one chunk at a time.
+
+    For every file part, `target_path(field_name, filename)` returns where to store it,
+    or None to skip the part. The extension is checked as soon as the part's headers
+    arrive and the size while its bytes do, so a bad file is rejected (400/413) without
+    reading the rest of the body. Each file is written to a temp file beside its target
+    while its SHA-256 is computed; the renames happen only once the whole body has been
+    received, so a rejected or aborted upload leaves no partial files behind. When a
+    field name repeats, only its last file is kept. Parsing and all file I/O run in
+    worker threads, WRITE_BATCH_BYTES at a time, so the event loop never waits on disk.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload.")
+    content_length = request.headers.get("content-length")
+    if max_body_bytes is not None and content_length and content_length.isdigit() and int(content_length) > max_body_bytes:
+        raise HTTPException(status_code=413, detail="Upload too large")
+
+    finished: dict[str, _FilePart] = {}
+    state: dict = {"headers": {}, "header_field": b"", "header_value": b"", "part": None}
+
+    def on_part_begin():
+        state["headers"] = {}
+        state["part"] = None
+
+    def on_header_field(data: bytes, start: int, end: int):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        if b"filename" not in disposition:
+            return  # Plain form field; nothing to store.
+        field_name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        filename = os.path.basename(disposition[b"filename"].decode("utf-8", "replace").replace("\\", "/"))
+        final_path = target_path(field_name, filename)
+        if final_path is None:
+            return
+        ext = os.path.splitext(filename)[1].lower()
+        if ext not in allowed_extensions:
+            raise HTTPException(status_code=400, detail=f"File type not allowed: {ext}")
+        state["part"] = _FilePart(field_name, filename, final_path)
+
+    def on_part_data(data: bytes, start: int, end: int):
+        part = state["part"]
+        if part is not None:
+            part.write(data[start:end], max_bytes)
+
+    def on_part_end():
+        part = state["part"]
+        if part is not None:
+            part.close()
+            previous = finished.pop(part.field_name, None)
+            if previous is not None:
+                previous.discard()
+            finished[part.field_name] = part
+            state["part"] = None
+
+    parser = MultipartParser(
+        boundary,
+        callbacks={
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+    def store_parts():
+        for part in finished.values():
+            os.replace(part.temp_path, part.final_path)
+
+    def discard_parts():
+        if state["part"] is not None:
+            state["part"].discard()
+        for part in finished.values():
+            part.discard()
+
+    try:
+        try:
+            batch = bytearray()
+            async for chunk in request.stream():
+                batch += chunk
+                if len(batch) >= WRITE_BATCH_BYTES:
+                    await asyncio.to_thread(parser.write, bytes(batch))
+                    batch.clear()
+            if batch:
+                await asyncio.to_thread(parser.write, bytes(batch))
+            await asyncio.to_thread(parser.finalize)
+        except MultipartParseError as exc:
+            raise HTTPException(status_code=400, detail="Malformed multipart body.") from exc
+        await asyncio.to_thread(store_parts)
+    except BaseException:
+        # Shielded: a cancelled request must still remove its temp files.
+        await asyncio.shield(asyncio.to_thread(discard_parts))
+        raise
+
+    return [
+        StoredUpload(
+            field_name=part.field_name,
+            filename=part.filename,
+            path=part.final_path,
+            size=part.size,
+            sha256=part.digest.hexdigest(),
+        )
+        for part in finished.values()
+    ]
+
+
+class ResumableUpload:
+    """
+    A partially received file, persisted as `<key>.part` (the bytes so far) and
+    `<key>.json` (declared filename and size) in `directory`.
+
+    The offset is the length of the .part file, so it survives dropped connections and
+    restarts: the client asks for the offset, then PATCHes only the missing bytes.
+    Appends and finalize are serialized with flock, so concurrent retries cannot interleave.
+    """
+
+    def __init__(self, directory: str, key: str):
+        self.directory = directory
+        self.key = key
+        self.data_path = os.path.join(directory, f"{key}.part")
+        self.meta_path = os.path.join(directory, f"{key}.json")
+
+    def load(self) -> Optional[dict]:
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as reader:
+                return json.load(reader)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @property
+    def offset(self) -> int:
+        try:
+            return os.path.getsize(self.data_path)
+        except FileNotFoundError:
+            return 0
+
+    def start(self, filename: str, size: int) -> dict:
+        """Opens the upload, or resumes it when the same file is already in progress."""
+        meta = self.load()
+        if meta == {"filename": filename, "size": size} and os.path.exists(self.data_path):
+            return meta
+        meta = {"filename": filename, "size": size}
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=".meta-", dir=self.directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as writer:
+            json.dump(meta, writer)
+        open(self.data_path, "wb").close()
+        os.replace(temp_path, self.meta_path)
+        return meta
+
+    def _lock(self, handle):
+        """Exclusive flock on the .part file; 409 while another request holds it."""
+        if fcntl is None:
+            return
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            raise HTTPException(status_code=409, detail="Another upload for this document is in progress.")
+
+    def _open_for_append(self, offset: int, content_length: Optional[str]):
+        meta = self.load()
+        if meta is None or not os.path.exists(self.data_path):
+            raise HTTPException(status_code=404, detail="Upload not started.")
+        handle = open(self.data_path, "ab")
+        try:
+            self._lock(handle)
+            current = os.fstat(handle.fileno()).st_size
+            if offset != current:
+                raise HTTPException(status_code=409, detail=f"Upload offset mismatch; expected {current}.")
+            if content_length and content_length.isdigit() and current + int(content_length) > meta["size"]:
+                raise HTTPException(status_code=413, detail="Chunk exceeds the declared upload size.")
+        except BaseException:
+            handle.close()
+            raise
+        return handle, meta["size"], current
+
+    @staticmethod
+    def _write_and_close(handle, data: bytes):
+        with handle:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    async def append(self, request: Request, offset: int) -> int:
+        """
+        Appends the request body at `offset`, which must equal the current offset (409
+        otherwise). Bytes are kept as they arrive, so an interrupted PATCH still moves
+        the offset forward. File I/O runs in worker threads, WRITE_BATCH_BYTES at a
+        time. Returns the new offset.
+        """
+        handle, size, current = await asyncio.to_thread(
+            self._open_for_append, offset, request.headers.get("content-length")
+        )
+        batch = bytearray()
+        try:
+            async for chunk in request.stream():
+                if current + len(batch) + len(chunk) > size:
+                    raise HTTPException(status_code=413, detail="Chunk exceeds the declared upload size.")
+                batch += chunk
+                if len(batch) >= WRITE_BATCH_BYTES:
+                    await asyncio.to_thread(handle.write, bytes(batch))
+                    current += len(batch)
+                    batch.clear()
+        finally:
+            # Shielded: what was received is kept (and the lock released) even on disconnect.
+            await asyncio.shield(asyncio.to_thread(self._write_and_close, handle, bytes(batch)))
+        return current + len(batch)
+
+    def finalize(self, final_path: str, expected_sha256: Optional[str] = None) -> StoredUpload:
+        """
+        Moves the completed file to `final_path`; a checksum mismatch discards the upload.
+        Holds the append lock throughout, so a PATCH still in flight cannot add bytes
+        after the size check.
+        """
+        meta = self.load()
+        if meta is None or not os.path.exists(self.data_path):
+            raise HTTPException(status_code=404, detail="Upload not started.")
+        with open(self.data_path, "rb") as handle:
+            self._lock(handle)
+            size = os.fstat(handle.fileno()).st_size
+            if size != meta["size"]:
+                raise HTTPException(status_code=409, detail=f"Upload incomplete: {size} of {meta['size']} bytes received.")
+            sha256 = hash_file(self.data_path)
+            if expected_sha256 and expected_sha256.lower() != sha256:
+                self.discard()
+                raise HTTPException(status_code=422, detail="Checksum mismatch; the upload must be restarted.")
+            os.makedirs(os.path.dirname(final_path) or ".", exist_ok=True)
+            os.replace(self.data_path, final_path)
+            os.unlink(self.meta_path)
+        return StoredUpload(
+            field_name=self.key,
+            filename=meta["filename"],
+            path=final_path,
+            size=size,
+            sha256=sha256,
+        )
+
+    def discard(self):
+        for path in (self.data_path, self.meta_path):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
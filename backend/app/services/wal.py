@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: no cross-process locking, single worker only.
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+
+def _try_lock(handle) -> bool:
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+class WALSegment:
+    """One closed log file, held locked by this process until it is discarded."""
+
+    def __init__(self, path: str, handle):
+        self.path = path
+        self._handle = handle
+
+    def read(self) -> list[dict]:
+        records = []
+        with open(self.path, "r", encoding="utf-8") as reader:
+            for line in reader:
+                if not line.endswith("\n"):
+                    # Torn final write from a crash mid-append; it was never acknowledged.
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    logger.error("WAL %s: skipping unreadable record", self.path)
+        return records
+
+    def discard(self):
+        try:
+            os.unlink(self.path)
+        finally:
+            self._handle.close()
+
+    def release(self):
+        self._handle.close()
+
+
+class WriteAheadLog:
+    """
+    Append-only JSON-lines log in `directory`, one active file per process.
+
+    append() returns once the record is in the file (flushed to the OS, and fsynced when
+    `fsync` is set). The consumer calls rotate() to close the active file and get it back
+    as a WALSegment, processes it, then discards it. Files left by a process that died
+    are handed out by orphans(); each file is flock'ed by whoever owns it, so several app
+    processes can share the directory.
+    """
+
+    def __init__(self, directory: str, prefix: str, fsync: bool = False):
+        self.directory = directory
+        self.prefix = prefix
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._active = None
+        self._active_path: Optional[str] = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            if self._active is None:
+                self._open_active()
+
+    def close(self):
+        """Closes the active file; it is picked up as an orphan on the next start."""
+        with self._lock:
+            if self._active is not None:
+                self._active.close()
+                if self._pending == 0:
+                    os.unlink(self._active_path)
+                self._active = None
+                self._active_path = None
+
+    def _open_active(self):
+        path = os.path.join(self.directory, f"{self.prefix}-{os.getpid()}-{time.time_ns()}.log")
+        handle = open(path, "a", encoding="utf-8")
+        _try_lock(handle)
+        self._active, self._active_path, self._pending = handle, path, 0
+
+    def append(self, record: dict) -> int:
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._active is None:
+                raise RuntimeError("Write-ahead log is not open")
+            self._active.write(line)
+            self._active.flush()
+            if self.fsync:
+                os.fsync(self._active.fileno())
+            self._pending += 1
+            return self._pending
+
+    def rotate(self) -> Optional[WALSegment]:
+        with self._lock:
+            if self._active is None or self._pending == 0:
+                return None
+            handle, path = self._active, self._active_path
+            self._open_active()
+        return WALSegment(path, handle)
+
+    def orphans(self) -> list[WALSegment]:
+        segments = []
+        try:
+            names = [name for name in os.listdir(self.directory) if name.startswith(f"{self.prefix}-")]
+        except FileNotFoundError:
+            return segments
+        # Oldest first: names end in their creation time.
+        for name in sorted(names, key=lambda name: int(name.rsplit("-", 1)[-1].split(".", 1)[0] or 0)):
+            path = os.path.join(self.directory, name)
+            if path == self._active_path:
+                continue
+            handle = open(path, "a", encoding="utf-8")
+            if _try_lock(handle):
+                segments.append(WALSegment(path, handle))
+            else:
+                handle.close()
+        return segments
@@ -0,0 +1,180 @@
+"""
+Maintenance commands for the portal backend.
+
+    python manage.py unread-counters verify   # report counters that drifted from messages
+    python manage.py unread-counters rebuild  # recompute every counter from messages
+    python manage.py sms-threads verify       # report inbox threads that drifted from awaiting_sms
+    python manage.py sms-threads rebuild      # recompute sms_threads from awaiting_sms
+    python manage.py document-blobs verify    # report blob ref counts or files that are off
+    python manage.py document-blobs rebuild   # move older uploads into the blob store, recount refs
+    python manage.py bench-login --email a@b.c --password secret  # login latency under concurrent load
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
+
+from app import crud
+from app.database import SessionLocal
+
+
+def unread_counters(action: str) -> int:
+    db = SessionLocal()
+    try:
+        if action == "rebuild":
+            written = crud.rebuild_unread_counters(db)
+            print(f"Rebuilt unread counters ({written} rows).")
+            return 0
+
+        mismatches = crud.verify_unread_counters(db)
+        for user_id, case_id, stored, expected in mismatches:
+            print(f"user {user_id} / case {case_id}: stored={stored} expected={expected}")
+        if mismatches:
+            print(f"{len(mismatches)} unread counter(s) out of date. Run 'unread-counters rebuild' to fix.")
+            return 1
+        print("Unread counters are consistent.")
+        return 0
+    finally:
+        db.close()
+
+
+def sms_threads(action: str) -> int:
+    db = SessionLocal()
+    try:
+        if action == "rebuild":
+            written = crud.rebuild_sms_threads(db)
+            print(f"Rebuilt SMS inbox threads ({written} rows).")
+            return 0
+
+        mismatches = crud.verify_sms_threads(db)
+        for thread_key, stored, expected in mismatches:
+            print(f"thread {thread_key}: stored={stored} expected={expected}")
+        if mismatches:
+            print(f"{len(mismatches)} SMS thread(s) out of date. Run 'sms-threads rebuild' to fix.")
+            return 1
+        print("SMS threads are consistent.")
+        return 0
+    finally:
+        db.close()
+
+
+def document_blobs(action: str) -> int:
+    db = SessionLocal()
+    try:
+        if action == "rebuild":
+            moved, removed = crud.rebuild_document_blobs(db)
+            print(f"Moved {moved} document(s) into the blob store; removed {removed} unreferenced blob(s).")
+            return 0
+
+        problems = crud.verify_document_blobs(db)
+        for sha256, stored, expected, present in problems:
+            print(f"blob {sha256}: ref_count={stored} expected={expected}{'' if present else ' (file missing)'}")
+        if problems:
+            print(f"{len(problems)} blob(s) out of date. Run 'document-blobs rebuild' to fix ref counts.")
+            return 1
+        print("Document blobs are consistent.")
+        return 0
+    finally:
+        db.close()
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def bench_login(url: str, email: str, password: str, requests_total: int, concurrency: int, probe_path: str) -> int:
+    """
+    Fires `requests_total` logins at a running server from `concurrency` threads while
+    one more thread polls `probe_path`, and prints latency percentiles for both: the
+    probe shows whether password hashing starves unrelated requests.
+    """
+    base = url.rstrip("/")
+    login_times: list[float] = []
+    probe_times: list[float] = []
+    failures = 0
+    done = False
+
+    def login_once(_):
+        nonlocal failures
+        started = time.perf_counter()
+        try:
+            response = requests.post(f"{base}/auth/login", json={"email": email, "password": password}, timeout=60)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        login_times.append(time.perf_counter() - started)
+        if not ok:
+            failures += 1
+
+    def probe():
+        with requests.Session() as session:
+            while not done:
+                started = time.perf_counter()
+                try:
+                    session.get(f"{base}{probe_path}", timeout=60)
+                except requests.RequestException:
+                    pass
+                probe_times.append(time.perf_counter() - started)
+                time.sleep(0.01)
+
+    with ThreadPoolExecutor(max_workers=concurrency + 1) as pool:
+        probe_future = pool.submit(probe)
+        started = time.perf_counter()
+        try:
+            list(pool.map(login_once, range(requests_total)))
+        finally:
+            elapsed = time.perf_counter() - started
+            done = True
+        probe_future.result()
+
+    print(f"{requests_total} logins, concurrency {concurrency}: {elapsed:.2f}s ({requests_total / elapsed:.1f}/s), {failures} failed")
+    for label, samples in (("login", login_times), (f"GET {probe_path}", probe_times)):
+        if samples:
+            print(
+                f"{label:>12}: p50={_percentile(samples, 50) * 1000:.0f}ms "
+                f"p95={_percentile(samples, 95) * 1000:.0f}ms p99={_percentile(samples, 99) * 1000:.0f}ms"
+            )
+    return 1 if failures else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    counters = commands.add_parser("unread-counters", help="Verify or rebuild the unread_counters table.")
+    counters.add_argument("action", choices=["verify", "rebuild"])
+
+    threads = commands.add_parser("sms-threads", help="Verify or rebuild the sms_threads table.")
+    threads.add_argument("action", choices=["verify", "rebuild"])
+
+    blobs = commands.add_parser("document-blobs", help="Verify or rebuild document blob reference counts.")
+    blobs.add_argument("action", choices=["verify", "rebuild"])
+
+    bench = commands.add_parser("bench-login", help="Measure /auth/login latency under concurrent load.")
+    bench.add_argument("--url", default="http://localhost:8002")
+    bench.add_argument("--email", required=True)
+    bench.add_argument("--password", required=True)
+    bench.add_argument("--requests", type=int, default=200)
+    bench.add_argument("--concurrency", type=int, default=32)
+    bench.add_argument("--probe-path", default="/")
+
+    args = parser.parse_args(argv)
+    if args.command == "unread-counters":
+        return unread_counters(args.action)
+    if args.command == "sms-threads":
+        return sms_threads(args.action)
+    if args.command == "document-blobs":
+        return document_blobs(args.action)
+    if args.command == "bench-login":
+        return bench_login(args.url, args.email, args.password, args.requests, args.concurrency, args.probe_path)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
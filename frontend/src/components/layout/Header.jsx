@@ -10,8 +10,11 @@ import {
   PopoverContent,
 } from "@/components/ui/popover";
 import { apiFetch } from "@/lib/api";
+import { subscribeUserEvents } from "@/lib/userEvents";
 import { getStoredUser, fetchCurrentUser, clearStoredUser } from "@/lib/auth";
 
+const NOTIFICATION_LIMIT = 5;
+
 export default function Header() {
   const [user, setUser] = useState(() => getStoredUser());
   
@@ -26,26 +29,27 @@ export default function Header() {
       return;
     }
     if (user.id && user.role) {
-      const fetchNotifications = async () => {
-        try {
-          const res = await apiFetch(`/users/${user.id}/notifications?role=${user.role}`);
-          if (!res.ok) {
-            throw new Error("Failed to fetch notifications");
-          }
-          const data = await res.json();
-          setNotifications(data.notifications || []);
-          setHasUnread(data.notifications.length > 0);
-        } catch (err) {
-          console.error(err.message);
+      // Pushed over the per-user socket: one latest unread message per case, newest first.
+      return subscribeUserEvents((event) => {
+        if (event.type === "snapshot") {
+          setNotifications(event.notifications || []);
+          setHasUnread((event.notifications || []).length > 0);
+        } else if (event.type === "message_created") {
+          setNotifications((current) =>
+            [event.notification, ...current.filter((n) => n.case_id !== event.case_id)].slice(0, NOTIFICATION_LIMIT)
+          );
+          setHasUnread(true);
+        } else if (event.type === "case_read") {
+          setNotifications((current) => current.filter((n) => n.case_id !== event.case_id));
         }
-      };
-      
-      fetchNotifications();
-      const interval = setInterval(fetchNotifications, 60000); // Poll every 60 seconds
-      return () => clearInterval(interval);
+      });
     }
   }, [user]);
 
+  useEffect(() => {
+    if (notifications.length === 0) setHasUnread(false);
+  }, [notifications]);
+
   const handleLogout = async () => {
     try {
       await apiFetch("/auth/logout", { method: "POST" });
@@ -5,7 +5,7 @@ import { Home, Briefcase, Users, FileText, MessageSquare, Shield, Inbox } from "
 import { Button } from "@/components/ui/button";
 import { Badge } from "@/components/ui/badge";
 import { useNavigate, useLocation } from "react-router-dom";
-import { apiFetch } from "@/lib/api";
+import { subscribeUserEvents, resyncUserEvents } from "@/lib/userEvents";
 import { getStoredUser, fetchCurrentUser } from "@/lib/auth";
 
 export default function Sidebar() {
@@ -26,31 +26,19 @@ export default function Sidebar() {
   }, []);
   // --- END MODIFIED ---
 
-  // --- ADDED: Effect to fetch total unread count ---
+  // Unread total is pushed over the per-user socket (snapshot on connect, then deltas).
   useEffect(() => {
-    if (user && user.id && user.role) {
-      const fetchTotalCount = async () => {
-        try {
-          const res = await apiFetch(`/users/${user.id}/unread-count?role=${user.role}`);
-          if (!res.ok) {
-            throw new Error("Failed to fetch unread count");
-          }
-          const data = await res.json();
-          setTotalUnreadCount(data.total_unread_count);
-        } catch (err) {
-          console.error(err.message);
-        }
-      };
-      
-      fetchTotalCount();
-      
-      // Optional: Poll for new messages every 30 seconds
-      const interval = setInterval(fetchTotalCount, 30000);
-      return () => clearInterval(interval);
-
-    }
-  }, [user]); // Re-run when user is loaded
-  // --- END ADDED ---
+    if (!user || !user.id) return;
+    return subscribeUserEvents((event) => {
+      if (event.type === "snapshot") {
+        setTotalUnreadCount(event.total_unread_count);
+      } else if (event.type === "message_created" || event.type === "case_read") {
+        setTotalUnreadCount((count) => Math.max(0, count + event.unread_delta));
+      } else if (event.type === "resync") {
+        resyncUserEvents();
+      }
+    });
+  }, [user]);
 
   const baseNavItems = [
     { name: "Overview", icon: Home, path: "/dashboard", roles: ["lawyer", "client", "accountant", "paralegal", "legal assistant", "admin"] },
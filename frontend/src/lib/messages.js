@@ -0,0 +1,72 @@
+import { apiFetch, getWsBaseUrl } from "@/lib/api";
+
+const PAGE_SIZE = 500;
+const HISTORY_PAGE_SIZE = 50;
+
+// Keeps a case's messages in ascending id order without duplicates.
+// Socket replays can overlap live traffic, so every insert goes through here.
+export const mergeMessages = (current, incoming) => {
+  const fresh = incoming.filter((msg) => msg && msg.id && !current.some((m) => m.id === msg.id));
+  if (fresh.length === 0) return current;
+  return [...current, ...fresh].sort((a, b) => a.id - b.id);
+};
+
+export const lastMessageId = (messages) => (messages.length ? messages[messages.length - 1].id : 0);
+
+const fetchHistoryPage = async (caseId, cursorParam) => {
+  const res = await apiFetch(`/cases/${caseId}/messages?${cursorParam}&limit=${HISTORY_PAGE_SIZE}`);
+  if (!res.ok) throw new Error("Failed to fetch messages");
+  const messages = await res.json();
+  const next = res.headers.get("X-Next-Before-Id");
+  return { messages, olderCursor: next ? Number(next) : null };
+};
+
+// Newest page of a case; olderCursor is null once the start of the history is loaded.
+export const fetchLatestMessages = (caseId) => fetchHistoryPage(caseId, "latest=true");
+
+// The page just older than beforeId, for scrolling back through the history.
+export const fetchOlderMessages = (caseId, beforeId) => fetchHistoryPage(caseId, `before_id=${beforeId}`);
+
+// Fetches every message newer than afterId by following the X-Next-After-Id cursor.
+// Only used to fill a reconnect gap; opening a case loads the newest page instead.
+export const fetchCaseMessages = async (caseId, afterId = 0) => {
+  const collected = [];
+  let cursor = afterId;
+  while (cursor !== null) {
+    const res = await apiFetch(`/cases/${caseId}/messages?after_id=${cursor}&limit=${PAGE_SIZE}`);
+    if (!res.ok) throw new Error("Failed to fetch messages");
+    const page = await res.json();
+    collected.push(...page);
+    const next = res.headers.get("X-Next-After-Id");
+    cursor = next ? Number(next) : null;
+  }
+  return collected;
+};
+
+// Opens the case chat socket, asking the server to replay anything after sinceId.
+export const openCaseSocket = (caseId, sinceId, onMessages) => {
+  const ws = new WebSocket(`${getWsBaseUrl()}/ws/${caseId}?since=${sinceId}`);
+  ws.onmessage = (event) => {
+    let data;
+    try {
+      data = JSON.parse(event.data);
+    } catch (e) {
+      console.error("Failed to parse ws message", e);
+      return;
+    }
+    if (data.type === "resync") {
+      // Too much was missed to replay over the socket; page it in over HTTP.
+      fetchCaseMessages(caseId, data.after_id)
+        .then(onMessages)
+        .catch((e) => console.error(e));
+      return;
+    }
+    if (data.type === "messages") {
+      // Several messages filed at once (bulk SMS assignment).
+      onMessages(data.messages || []);
+      return;
+    }
+    if (data.id) onMessages([data]);
+  };
+  return ws;
+};
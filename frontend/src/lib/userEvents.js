@@ -0,0 +1,70 @@
+import { getWsBaseUrl } from "@/lib/api";
+
+// One per-user socket shared by every subscriber (Sidebar badge, Header bell).
+// The server sends a "snapshot" on connect, then incremental events.
+const RECONNECT_MAX_DELAY_MS = 30000;
+
+const listeners = new Set();
+let socket = null;
+let reconnectTimer = null;
+let reconnectDelay = 1000;
+let lastSnapshot = null;
+
+const emit = (event) => {
+  listeners.forEach((listener) => listener(event));
+};
+
+const connect = () => {
+  const ws = new WebSocket(`${getWsBaseUrl()}/ws/user`);
+  socket = ws;
+
+  ws.onopen = () => {
+    reconnectDelay = 1000;
+  };
+
+  ws.onmessage = (event) => {
+    let data;
+    try {
+      data = JSON.parse(event.data);
+    } catch {
+      return;
+    }
+    if (data.type === "snapshot") lastSnapshot = data;
+    emit(data);
+  };
+
+  ws.onclose = (event) => {
+    // Ignore sockets that were already replaced or torn down by the last unsubscribe.
+    if (socket !== ws) return;
+    socket = null;
+    lastSnapshot = null;
+    // 1008 = not authenticated; wait for the next subscriber instead of retrying.
+    if (listeners.size === 0 || event.code === 1008) return;
+    reconnectTimer = setTimeout(() => {
+      reconnectTimer = null;
+      connect();
+    }, reconnectDelay);
+    reconnectDelay = Math.min(reconnectDelay * 2, RECONNECT_MAX_DELAY_MS);
+  };
+};
+
+export const subscribeUserEvents = (listener) => {
+  listeners.add(listener);
+  if (lastSnapshot) listener(lastSnapshot);
+  if (!socket && !reconnectTimer) connect();
+
+  return () => {
+    listeners.delete(listener);
+    if (listeners.size > 0) return;
+    clearTimeout(reconnectTimer);
+    reconnectTimer = null;
+    socket?.close();
+    socket = null;
+    lastSnapshot = null;
+  };
+};
+
+// Asks the server for a fresh snapshot (used after a "resync" event).
+export const resyncUserEvents = () => {
+  socket?.close();
+};
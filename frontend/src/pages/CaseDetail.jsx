@@ -1,4 +1,4 @@
-import { useState, useEffect, useCallback, useRef } from "react"
+import { useState, useEffect, useLayoutEffect, useCallback, useRef } from "react"
 import { useNavigate, useParams } from "react-router-dom"
 import { ArrowLeft, UserPlus, Plus, FileText, Download, Loader2, X, MessageSquare, Search, User, Send } from "lucide-react"
 import MainLayout from "../components/layout/MainLayout"
@@ -10,8 +10,9 @@ import { Input } from "../components/ui/input"
 import { Label } from "../components/ui/label"
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "../components/ui/select"
 import { motion as Motion } from "framer-motion"
-import { API_BASE_URL, CLIENT_BASE_URL, getWsBaseUrl, apiFetch } from "@/lib/api"
+import { API_BASE_URL, CLIENT_BASE_URL, apiFetch } from "@/lib/api"
 import { getStoredUser, fetchCurrentUser } from "@/lib/auth"
+import { fetchLatestMessages, fetchOlderMessages, lastMessageId, mergeMessages, openCaseSocket } from "@/lib/messages"
 import { STAFF_ROLES, getDocumentRequestBody, getDocumentRequestTitle } from "@/lib/documentRequestText"
 
 
@@ -43,6 +44,10 @@ export default function CaseDetail() {
   const [messages, setMessages] = useState([]);
   const [messageInput, setMessageInput] = useState("");
   const messagesEndRef = useRef(null);
+  const [olderCursor, setOlderCursor] = useState(null);
+  const loadingOlderRef = useRef(false);
+  const scrollRestoreRef = useRef(null);
+  const chatCaseRef = useRef(id);
   const ws = useRef(null);
 
   const fetchCaseDocuments = useCallback(async () => {
@@ -105,58 +110,77 @@ export default function CaseDetail() {
   
   // --- 3. Chat Logic (Fetch & WebSocket) ---
   
-  // Fetch History
-  useEffect(() => {
-    if (!id) return;
-    const fetchMessages = async () => {
-      try {
-        const res = await apiFetch(`/cases/${id}/messages`);
-        if (res.ok) {
-          const data = await res.json();
-          setMessages(data);
-        }
-      } catch (e) {
-        console.error("Failed to load messages", e);
-      }
-    };
-    fetchMessages();
-  }, [id]);
-
-  // WebSocket Connection
+  // Fetch the newest page, then connect and let the socket replay anything sent in between.
+  // Older history is paged in as the chat is scrolled to the top.
   useEffect(() => {
     if (!id || !currentUser) return;
-    
-    // Construct WS URL
-    const wsUrl = `${getWsBaseUrl()}/ws/${id}`;
-    ws.current = new WebSocket(wsUrl);
-
-    ws.current.onopen = () => {
-       console.log("Connected to Chat WS");
-    };
+    let cancelled = false;
+    chatCaseRef.current = id;
 
-    ws.current.onmessage = (event) => {
+    const connect = async () => {
+      let history = [];
       try {
-        const msg = JSON.parse(event.data);
-        setMessages((prev) => {
-          // Avoid duplicates
-          if (prev.some(m => m.id === msg.id)) return prev;
-          return [...prev, msg];
-        });
+        const page = await fetchLatestMessages(id);
+        history = page.messages;
+        if (!cancelled) setOlderCursor(page.olderCursor);
       } catch (e) {
-        console.error("WS Message Parse Error", e);
+        console.error("Failed to load messages", e);
       }
+      if (cancelled) return;
+      setMessages((prev) => mergeMessages(prev, history));
+
+      ws.current = openCaseSocket(id, lastMessageId(history), (incoming) => {
+        setMessages((prev) => mergeMessages(prev, incoming));
+      });
+      ws.current.onopen = () => {
+        console.log("Connected to Chat WS");
+      };
     };
+    setMessages([]);
+    setOlderCursor(null);
+    connect();
 
     return () => {
+      cancelled = true;
       ws.current?.close();
     };
   }, [id, currentUser]);
 
-  // Auto-scroll to bottom
+  // Auto-scroll to bottom when a newer message arrives, not when older pages are prepended
+  // (jump straight there on open, so the scroll doesn't pass the top and page in history)
+  const newestMessageId = lastMessageId(messages);
+  const shownNewestRef = useRef(0);
   useEffect(() => {
-    messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
+    messagesEndRef.current?.scrollIntoView({ behavior: shownNewestRef.current ? "smooth" : "auto" });
+    shownNewestRef.current = newestMessageId;
+  }, [newestMessageId]);
+
+  // Keep the visible messages in place after an older page is prepended
+  useLayoutEffect(() => {
+    const restore = scrollRestoreRef.current;
+    if (!restore) return;
+    scrollRestoreRef.current = null;
+    restore.el.scrollTop = restore.el.scrollHeight - restore.fromBottom;
   }, [messages]);
 
+  const handleChatScroll = async (e) => {
+    const el = e.currentTarget;
+    if (el.scrollTop > 40 || !olderCursor || loadingOlderRef.current) return;
+    loadingOlderRef.current = true;
+    const caseId = id;
+    try {
+      const page = await fetchOlderMessages(caseId, olderCursor);
+      if (chatCaseRef.current !== caseId) return;
+      if (page.messages.length) scrollRestoreRef.current = { el, fromBottom: el.scrollHeight - el.scrollTop };
+      setOlderCursor(page.olderCursor);
+      setMessages((prev) => mergeMessages(prev, page.messages));
+    } catch (err) {
+      console.error("Failed to load older messages", err);
+    } finally {
+      loadingOlderRef.current = false;
+    }
+  };
+
   const handleSendMessage = () => {
     if (!messageInput.trim() || !ws.current || !currentUser) return;
     
@@ -577,7 +601,7 @@ export default function CaseDetail() {
                 </h2>
             </div>
 
-            <div className="flex-1 overflow-y-auto bg-muted/20 p-4 space-y-4">
+            <div className="flex-1 overflow-y-auto bg-muted/20 p-4 space-y-4" onScroll={handleChatScroll}>
               {messages.length === 0 && (
                  <div className="text-center text-sm text-muted-foreground py-10">
                     <p>No messages yet.</p>
@@ -1,6 +1,6 @@
 "use client"
 
-import { useState, useEffect, useRef } from "react"
+import { useState, useEffect, useLayoutEffect, useRef } from "react"
 import MainLayout from "@/components/layout/MainLayout"
 import { Card, CardHeader, CardTitle, CardContent } from "@/components/ui/card"
 import { Input } from "@/components/ui/input"
@@ -39,8 +39,9 @@ import {
 import { useNavigate, useSearchParams } from "react-router-dom"
 import { format } from "date-fns"
 import { Toaster, toast } from "sonner" 
-import { API_BASE_URL, CLIENT_BASE_URL, getWsBaseUrl, apiFetch } from "@/lib/api"
+import { API_BASE_URL, CLIENT_BASE_URL, apiFetch } from "@/lib/api"
 import { getStoredUser, fetchCurrentUser } from "@/lib/auth"
+import { fetchLatestMessages, fetchOlderMessages, lastMessageId, mergeMessages, openCaseSocket } from "@/lib/messages"
 import {
   STAFF_ROLES,
   formatItemLabel,
@@ -393,6 +394,11 @@ export default function Messages() {
 
   const messagesEndRef = useRef(null)
   const webSocketRef = useRef(null)
+  const [olderCursor, setOlderCursor] = useState(null)
+  const loadingOlderRef = useRef(false)
+  const scrollRestoreRef = useRef(null)
+  const shownNewestRef = useRef(0)
+  const openCaseRef = useRef(null)
   const navigate = useNavigate()
   const [searchParams, setSearchParams] = useSearchParams()
 
@@ -467,42 +473,34 @@ export default function Messages() {
         body: JSON.stringify({ reader_id: user.id }),
       })
       setConversations((prevConvos) => prevConvos.map((c) => (c.id === caseId ? { ...c, unreadCount: 0 } : c)))
-      const res = await apiFetch(`/cases/${caseId}/messages`)
-      if (!res.ok) throw new Error("Failed to fetch messages")
-      const data = await res.json()
-      if (Array.isArray(data)) {
-        setMessages(data.map((msg) => ({ ...msg, id: msg.id }))) 
-      }
-      scrollToBottom()
+      // Only the newest page; older history is paged in as the chat is scrolled to the top.
+      const page = await fetchLatestMessages(caseId)
+      setMessages(page.messages)
+      setOlderCursor(page.olderCursor)
+      return page.messages
     } catch (err) {
       console.error("Message fetch/read error:", err)
+      return []
     }
   }
 
   useEffect(() => {
     if (selectedConversation && user) {
+      openCaseRef.current = selectedConversation.id
+      shownNewestRef.current = 0
+      setOlderCursor(null)
       const openConversation = async () => {
-        await fetchMessages(selectedConversation.id)
+        const history = await fetchMessages(selectedConversation.id)
         if (webSocketRef.current) {
           webSocketRef.current.close()
         }
-        const ws = new WebSocket(`${getWsBaseUrl()}/ws/${selectedConversation.id}`)
+        // since= replays whatever was posted between the history fetch and the connect.
+        const ws = openCaseSocket(selectedConversation.id, lastMessageId(history), (incoming) => {
+          setMessages((prevMessages) => mergeMessages(prevMessages, incoming))
+        })
         webSocketRef.current = ws
         ws.onopen = () => console.log("WebSocket connected")
         ws.onclose = () => console.log("WebSocket disconnected")
-        ws.onmessage = (event) => {
-          try {
-            const newMessage = JSON.parse(event.data)
-            setMessages((prevMessages) => {
-              if (prevMessages.some((msg) => msg.id === newMessage.id)) {
-                return prevMessages
-              }
-              return [...prevMessages, { ...newMessage, id: newMessage.id }]
-            })
-          } catch (e) {
-            console.error("Failed to parse ws message", e)
-          }
-        }
       }
       openConversation()
       return () => {
@@ -513,9 +511,40 @@ export default function Messages() {
     }
   }, [selectedConversation, user])
 
+  // Scroll down only when a newer message arrives, not when older pages are prepended
+  // (jump straight there on open, so the scroll doesn't pass the top and page in history).
+  const newestMessageId = lastMessageId(messages)
   useEffect(() => {
-    scrollToBottom()
+    messagesEndRef.current?.scrollIntoView({ behavior: shownNewestRef.current ? "smooth" : "auto" })
+    shownNewestRef.current = newestMessageId
+  }, [newestMessageId])
+
+  // Keep the visible messages in place after an older page is prepended.
+  useLayoutEffect(() => {
+    const restore = scrollRestoreRef.current
+    if (!restore) return
+    scrollRestoreRef.current = null
+    restore.el.scrollTop = restore.el.scrollHeight - restore.fromBottom
   }, [messages])
+
+  // ScrollArea scrolls its inner viewport, so listen in the capture phase.
+  const handleChatScroll = async (e) => {
+    const el = e.target
+    if (el.scrollTop > 40 || !olderCursor || loadingOlderRef.current) return
+    loadingOlderRef.current = true
+    const caseId = openCaseRef.current
+    try {
+      const page = await fetchOlderMessages(caseId, olderCursor)
+      if (openCaseRef.current !== caseId) return
+      if (page.messages.length) scrollRestoreRef.current = { el, fromBottom: el.scrollHeight - el.scrollTop }
+      setOlderCursor(page.olderCursor)
+      setMessages((prevMessages) => mergeMessages(prevMessages, page.messages))
+    } catch (err) {
+      console.error("Failed to load older messages", err)
+    } finally {
+      loadingOlderRef.current = false
+    }
+  }
   
   useEffect(() => {
     if (!isRequestingDocs) {
@@ -540,10 +569,6 @@ export default function Messages() {
     return date.toLocaleTimeString([], { hour: "2-digit", minute: "2-digit" })
   }
 
-  const scrollToBottom = () => {
-    messagesEndRef.current?.scrollIntoView({ behavior: "smooth" })
-  }
-
   const sendMessage = () => {
     if (!newMessage.trim() || !webSocketRef.current || !user) return
     const messagePayload = {
@@ -750,7 +775,7 @@ export default function Messages() {
 
               {/* Messages Area */}
               <CardContent className="flex-1 p-6 overflow-hidden bg-muted/10">
-                <ScrollArea className="h-full pr-4">
+                <ScrollArea className="h-full pr-4" onScrollCapture={handleChatScroll}>
                   <div className="space-y-4">
                     {messages.map((msg) => {
                       // Debug log to check message structure